@@ -1,12 +1,25 @@
+import datetime
 import json
 import logging
+import math
+import os
+import re
+import threading
+import time
 import typing as t
 
+import tornado.concurrent
+import tornado.gen
 import tornado.ioloop
+import tornado.iostream
+import tornado.queues
+import tornado.util
 import tornado.web
 
+import compaction
 import database.repository as r
 import entity.conf as c
+import envoy_stats as es
 import logger
 import requests
 import response
@@ -14,27 +27,382 @@ import response
 logger.config_logger()
 LOG = logging.getLogger(__name__)
 
-redis = r.RedisRepository()
+repository = r.new_repository()
+read_replicas = r.new_read_replicas(repository)
 
+MAX_WAIT_SECONDS = 60.0
+WAIT_PATTERN = re.compile(r"^(?P<value>[0-9]+(\.[0-9]+)?)(?P<unit>ms|s)?$")
 
-class EndpointsHandler(tornado.web.RequestHandler):
+MAX_BATCH_OPERATIONS = 10000
+BATCH_TYPE_ENDPOINT = "endpoint"
+BATCH_TYPE_SERVER = "server"
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_BODY_SIZE = 1024 * 1024 * 1024
+EXPORT_FLUSH_RECORDS = 1000
+RECORD_TYPE_SNAPSHOT = "snapshot"
+
+CHANGE_BLOCK_MILLISECONDS = 5000
+CHANGE_KEEPALIVE_SECONDS = 15
+# Reads of the change stream are retried after a failure, waiting twice
+# as long after each one up to the maximum.
+CHANGE_RETRY_SECONDS = 0.5
+CHANGE_RETRY_MAX_SECONDS = 30.0
+CHANGE_RESYNC = "resync"
+
+CONFIG_VERSION_HEADER = "X-Config-Version"
+
+# Stages of an operation by the fields of their start and end.
+LATENCY_STAGES = [
+    ("queue", "queued_at", "applied_at"),
+    ("write", "applied_at", "written_at"),
+    ("envoy", "written_at", "envoy_acked_at"),
+    ("total", "queued_at", "envoy_acked_at")
+]
+
+# Changes are rejected while the worker is behind the thresholds,
+# 0 disables a threshold.
+try:
+    MAX_QUEUE_DEPTH = int(os.environ["MAX_QUEUE_DEPTH"])
+except KeyError:
+    MAX_QUEUE_DEPTH = 100000
+
+try:
+    MAX_QUEUE_LAG_SECONDS = float(os.environ["MAX_QUEUE_LAG_SECONDS"])
+except KeyError:
+    MAX_QUEUE_LAG_SECONDS = 60.0
+
+# Token bucket of every client, 0 disables the rate limit.
+try:
+    CLIENT_RATE = float(os.environ["CLIENT_RATE"])
+except KeyError:
+    CLIENT_RATE = 20.0
+
+try:
+    CLIENT_BURST = int(os.environ["CLIENT_BURST"])
+except KeyError:
+    CLIENT_BURST = 100
+
+# Addresses of the proxies in front, whose X-Forwarded-For is trusted to
+# tell the client.
+try:
+    TRUSTED_PROXIES = [address for address
+                       in os.environ["TRUSTED_PROXIES"].split(",")
+                       if address]
+except KeyError:
+    TRUSTED_PROXIES = []
+
+QUEUE_STATS_INTERVAL_SECONDS = 0.5
+QUEUE_RETRY_AFTER_SECONDS = 5
+ADMITTED_METHODS = ("POST", "PUT", "DELETE")
+
+
+class OperationWaiters:
+    """Wakes up requests waiting for an operation to be applied.
+
+    A single Redis subscription is shared by every waiting request, the
+    worker publishes an operation ID when it records the operation result.
+    """
+
+    def __init__(self) -> None:
+        self._waiters: t.Dict[str, t.List[tornado.concurrent.Future]] = {}
+        self._io_loop: t.Optional[tornado.ioloop.IOLoop] = None
+
+    def start(self) -> None:
+        self._io_loop = tornado.ioloop.IOLoop.current()
+        thread = threading.Thread(target=self._listen, daemon=True)
+        thread.start()
+
+    def _listen(self) -> None:
+        for operation_id in repository.listen_operations():
+            self._io_loop.add_callback(self._notify, operation_id)
+
+    def _notify(self, operation_id: str) -> None:
+        for future in self._waiters.pop(operation_id, []):
+            if not future.done():
+                future.set_result(None)
+
+    def register(self, operation_id: str) -> tornado.concurrent.Future:
+        future = tornado.concurrent.Future()
+        self._waiters.setdefault(operation_id, []).append(future)
+        return future
+
+    def unregister(self,
+                   operation_id: str,
+                   future: tornado.concurrent.Future) -> None:
+        futures = self._waiters.get(operation_id, [])
+        if future in futures:
+            futures.remove(future)
+        if not futures:
+            self._waiters.pop(operation_id, None)
+
+
+waiters = OperationWaiters()
+
+
+class ChangeFeed:
+    """Fans out the change stream to every watching request.
+
+    A single thread follows the Redis stream, so the number of watchers
+    does not add blocking reads to Redis.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: t.Set[tornado.queues.Queue] = set()
+        self._io_loop: t.Optional[tornado.ioloop.IOLoop] = None
+
+    def start(self) -> None:
+        self._io_loop = tornado.ioloop.IOLoop.current()
+        thread = threading.Thread(target=self._listen, daemon=True)
+        thread.start()
+
+    def _listen(self) -> None:
+        last_change_id: t.Optional[str] = None
+        retry_seconds = CHANGE_RETRY_SECONDS
+        while True:
+            try:
+                if last_change_id is None:
+                    last_change_id = repository.get_last_change_id() or "0-0"
+                changes = repository.get_changes(
+                    last_change_id, block=CHANGE_BLOCK_MILLISECONDS)
+            except Exception:
+                LOG.exception("Failed to read the change stream.")
+                time.sleep(retry_seconds)
+                retry_seconds = min(retry_seconds * 2,
+                                    CHANGE_RETRY_MAX_SECONDS)
+                continue
+
+            retry_seconds = CHANGE_RETRY_SECONDS
+            if not changes:
+                continue
+
+            last_change_id = changes[-1][0]
+            self._io_loop.add_callback(self._publish, changes)
+
+    def _publish(self,
+                 changes: t.List[t.Tuple[str, r.CHANGE_EVENT_TYPE]]) -> None:
+        for subscriber in self._subscribers:
+            for change in changes:
+                subscriber.put_nowait(change)
+
+    def subscribe(self) -> tornado.queues.Queue:
+        subscriber = tornado.queues.Queue()
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: tornado.queues.Queue) -> None:
+        self._subscribers.discard(subscriber)
+
+
+change_feed = ChangeFeed()
+stats_collector = es.StatsCollector()
+
+
+class AdmissionControl:
+    """Rejects changes while the worker is behind or a client is too fast.
+
+    Queue depth and lag are read at most once per interval and shared by
+    every request, token buckets of the clients are kept in the storage
+    to be shared by every API server.
+    """
+
+    def __init__(self) -> None:
+        self._stats: t.Tuple[int, float] = (0, 0.0)
+        self._stats_read_at: t.Optional[float] = None
+
+    def _get_queue_stats(self) -> t.Tuple[int, float]:
+        now = time.monotonic()
+        if self._stats_read_at is None \
+                or now - self._stats_read_at >= QUEUE_STATS_INTERVAL_SECONDS:
+            self._stats = repository.get_queue_stats()
+            self._stats_read_at = now
+        return self._stats
+
+    def check(self,
+              client_id: str,
+              lane: str) -> t.Optional[t.Tuple[str, int]]:
+        # Emergency changes are let in even when the queue is behind,
+        # they are taken ahead of the backlog.
+        if lane != r.LANE_EMERGENCY \
+                and (MAX_QUEUE_DEPTH > 0 or MAX_QUEUE_LAG_SECONDS > 0):
+            depth, lag = self._get_queue_stats()
+            if 0 < MAX_QUEUE_DEPTH <= depth:
+                return "Request queue is full.", QUEUE_RETRY_AFTER_SECONDS
+            if 0 < MAX_QUEUE_LAG_SECONDS <= lag:
+                return "Worker is behind the request queue.", \
+                    max(1, math.ceil(lag - MAX_QUEUE_LAG_SECONDS))
+
+        if CLIENT_RATE > 0:
+            wait = repository.take_token(client_id, CLIENT_RATE, CLIENT_BURST)
+            if wait > 0:
+                return "Too many requests from the client.", \
+                    max(1, math.ceil(wait))
+
+        return None
+
+
+admission = AdmissionControl()
+
+
+def parse_stream_id(stream_id: str) -> t.Tuple[int, int]:
+    millisecond, _, sequence = stream_id.partition("-")
+    return int(millisecond), int(sequence or "0")
+
+
+def parse_wait(wait: str) -> float:
+    matched = WAIT_PATTERN.match(wait)
+    if matched is None:
+        raise ValueError("Invalid wait value: " + wait)
+
+    seconds = float(matched.group("value"))
+    if matched.group("unit") == "ms":
+        seconds /= 1000
+
+    return min(seconds, MAX_WAIT_SECONDS)
+
+
+def get_latency(operation: r.OPERATION_TYPE) -> t.Dict[str, float]:
+    # Times are strings in Redis.
+    latency: t.Dict[str, float] = {}
+    for stage, start, end in LATENCY_STAGES:
+        if start in operation and end in operation:
+            latency[stage] = round(
+                float(operation[end]) - float(operation[start]), 3)
+    return latency
+
+
+def parse_expires_at(body: t.Dict[str, t.Any]) -> t.Optional[float]:
+    # TTL is turned into the time to expire when accepted, so the worker
+    # and the replay of the journal expire it at the same time.
+    ttl_seconds: t.Any = body.get("ttl_seconds")
+    if ttl_seconds is None:
+        return None
+
+    if isinstance(ttl_seconds, bool) \
+            or not isinstance(ttl_seconds, (int, float)) \
+            or ttl_seconds <= 0:
+        raise requests.InvalidParameter("ttl_seconds")
+    return time.time() + ttl_seconds
+
+
+def is_added_again(request: requests.REQUEST_TYPE) -> bool:
+    # A registered resource is added again to refresh its TTL or to cancel
+    # it, and is a conflict otherwise.
+    if request.get(requests.EXPIRES_AT_KEY) is not None:
+        return True
+
+    key = compaction.get_key(request)
+    return any(compaction.get_key(json.loads(removal)) == key
+               for removal in repository.get_expirations())
+
+
+def parse_config_sets(body: t.Dict[str, t.Any]) -> t.Optional[t.List[str]]:
+    config_sets: t.Any = body.get("config_sets")
+    if config_sets is None:
+        return None
+
+    if not isinstance(config_sets, list) or not config_sets \
+            or not all(isinstance(name, str)
+                       and requests.CONFIG_SET_NAME_PATTERN.match(name)
+                       for name in config_sets):
+        raise requests.InvalidParameter("config_sets")
+    return config_sets
+
+
+def get_client_ip(remote_ip: str, forwarded_for: t.Optional[str]) -> str:
+    # Proxies append the address they were connected from, so the last
+    # address not of a trusted proxy is the client.
+    if remote_ip not in TRUSTED_PROXIES or not forwarded_for:
+        return remote_ip
+
+    for address in reversed(forwarded_for.split(",")):
+        address = address.strip()
+        if address and address not in TRUSTED_PROXIES:
+            return address
+    return remote_ip
+
+
+def parse_lane(lane: str) -> str:
+    if lane not in r.LANES:
+        raise requests.InvalidParameter("lane")
+    return lane
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def prepare(self) -> None:
+        if self.request.method in ADMITTED_METHODS:
+            self.admit()
+
+    def admit(self) -> bool:
+        rejected: t.Optional[t.Tuple[str, int]] = \
+            admission.check(get_client_ip(
+                                self.request.remote_ip,
+                                self.request.headers.get("X-Forwarded-For")),
+                            self.get_query_argument("lane",
+                                                    r.LANE_INTERACTIVE))
+        if rejected is None:
+            return True
+
+        error, retry_after = rejected
+        message = {"message": error}
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Retry-After", str(retry_after))
+        self.set_status(429)
+        self.finish(json.dumps(message))
+        return False
+
+    def get_lane(self,
+                 default: str = r.LANE_INTERACTIVE) -> t.Optional[str]:
+        # A caller puts urgent changes like pulling a failing server ahead
+        # of the bulk changes by the lane.
+        try:
+            return parse_lane(self.get_query_argument("lane", default))
+        except requests.InvalidParameter as e:
+            message = {"message": str(e)}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return None
+
+
+class ReadHandler(BaseHandler):
+    def get_reader(self) -> t.Optional[r.Repository]:
+        # A client reads its own writes by giving conf_version of
+        # the operation as min_version.
+        try:
+            min_version = int(self.get_query_argument("min_version", "0"))
+        except ValueError:
+            message = {"message": "Invalid parameter given in 'min_version'"}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return None
+
+        reader, version = read_replicas.select(min_version)
+        if version is not None:
+            self.set_header(CONFIG_VERSION_HEADER, str(version))
+        return reader
+
+
+class EndpointsHandler(ReadHandler):
     def post(self) -> None:
         mode = requests.MODE_KEY_ADD
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
 
         body: t.Dict[str, str] = json.loads(self.request.body)
         port_value: str = body["port_value"]
         route: str = body["route"]
         host_header: str = body["host_header"]
 
-        idx: t.Optional[t.Tuple[int]] = \
-            redis.get_endpoint_index(lb_port=port_value,
-                                     url_prefix=route,
-                                     endpoint_uuid=None)
-        if idx is not None:
-            message = {"message": "Specified 'port' with 'route' is "
-                       "already registered."}
+        try:
+            expires_at: t.Optional[float] = parse_expires_at(body)
+            config_sets: t.Optional[t.List[str]] = parse_config_sets(body)
+        except requests.InvalidParameter as e:
+            message = {"message": str(e)}
             self.set_header("Content-Type", "application/json")
-            self.set_status(409)
+            self.set_status(400)
             self.write(json.dumps(message))
             return
 
@@ -43,28 +411,53 @@ class EndpointsHandler(tornado.web.RequestHandler):
                                    port_value,
                                    route,
                                    host_header,
-                                   endpoint_uuid)
-        redis.add_queue(ep_req.get_json())
+                                   endpoint_uuid,
+                                   expires_at,
+                                   config_sets)
 
-        message = {"message": "Operation was accepted."}
+        idx: t.Optional[t.Tuple[int]] = \
+            repository.get_endpoint_index(lb_port=port_value,
+                                          url_prefix=route,
+                                          endpoint_uuid=None)
+        if idx is not None and not is_added_again(ep_req.get_dict()):
+            message = {"message": "Specified 'port' with 'route' is "
+                       "already registered."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(409)
+            self.write(json.dumps(message))
+            return
+
+        operation_id: str = repository.add_queue(ep_req.get_json(),
+                                                 lane)
+
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
         self.set_header("Content-Type", "application/json")
         self.write(json.dumps(message))
         self.set_status(202)
 
     def get(self) -> None:
-        conf: c.EnvoyConf = redis.load_conf()
+        reader: t.Optional[r.Repository] = self.get_reader()
+        if reader is None:
+            return
+
+        conf: c.EnvoyConf = reader.load_conf()
         result = response.make_response_with_routeshort(conf)
         self.set_header("Content-Type", "application/json")
         self.set_status(200)
         self.write(result)
 
 
-class EndpointsWithArgHandler(tornado.web.RequestHandler):
+class EndpointsWithArgHandler(ReadHandler):
     def get(self, endpoint_uuid: str) -> None:
+        reader: t.Optional[r.Repository] = self.get_reader()
+        if reader is None:
+            return
+
         idx: t.Optional[t.Tuple[int]] = \
-            redis.get_endpoint_index(lb_port=None,
-                                     url_prefix=None,
-                                     endpoint_uuid=endpoint_uuid)
+            reader.get_endpoint_index(lb_port=None,
+                                      url_prefix=None,
+                                      endpoint_uuid=endpoint_uuid)
         if idx is None:
             message = {"message": "Target endpoint was not found."}
             self.set_header("Content-Type", "application/json")
@@ -75,7 +468,7 @@ class EndpointsWithArgHandler(tornado.web.RequestHandler):
         resource_idx = idx[0]
         route_idx = idx[1]
 
-        conf: c.EnvoyConf = redis.load_conf()
+        conf: c.EnvoyConf = reader.load_conf()
         result: str = \
             response.make_response_with_routeshort_idx(conf,
                                                        resource_idx,
@@ -87,11 +480,14 @@ class EndpointsWithArgHandler(tornado.web.RequestHandler):
 
     def delete(self, endpoint_uuid: str) -> None:
         mode = requests.MODE_KEY_REMOVE
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
 
         idx: t.Optional[t.Tuple[int]] = \
-            redis.get_endpoint_index(lb_port=None,
-                                     url_prefix=None,
-                                     endpoint_uuid=endpoint_uuid)
+            repository.get_endpoint_index(lb_port=None,
+                                          url_prefix=None,
+                                          endpoint_uuid=endpoint_uuid)
         if idx is None:
             message = {"message": "Target endpoint was not found."}
             self.set_header("Content-Type", "application/json")
@@ -102,7 +498,7 @@ class EndpointsWithArgHandler(tornado.web.RequestHandler):
         resource_idx = idx[0]
         route_idx = idx[1]
 
-        conf: c.EnvoyConf = redis.load_conf()
+        conf: c.EnvoyConf = repository.load_conf()
         lds_res = conf.lds.resources[resource_idx]
         route = lds_res.routes[route_idx]
 
@@ -111,26 +507,82 @@ class EndpointsWithArgHandler(tornado.web.RequestHandler):
                                    route.prefix,
                                    route.host_header,
                                    endpoint_uuid)
-        redis.add_queue(ep_req.get_json())
+        operation_id: str = repository.add_queue(ep_req.get_json(),
+                                                 lane)
 
-        message = {"message": "Operation was accepted."}
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
         self.set_header("Content-Type", "application/json")
         self.write(json.dumps(message))
         self.set_status(202)
 
 
-class ServersHandler(tornado.web.RequestHandler):
+class EndpointStatsHandler(ReadHandler):
+    def get(self, endpoint_uuid: str) -> None:
+        reader: t.Optional[r.Repository] = self.get_reader()
+        if reader is None:
+            return
+
+        idx: t.Optional[t.Tuple[int]] = \
+            reader.get_endpoint_index(lb_port=None,
+                                      url_prefix=None,
+                                      endpoint_uuid=endpoint_uuid)
+        if idx is None:
+            message = {"message": "Target endpoint was not found."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(404)
+            self.write(json.dumps(message))
+            return
+
+        # Stats are read from the last scrape of the collector, Envoy is
+        # never asked by a request.
+        stats, collected_at = stats_collector.get(endpoint_uuid)
+        if collected_at is None:
+            message = {"message": "Envoy stats are not collected yet."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(503)
+            self.write(json.dumps(message))
+            return
+
+        if stats is None:
+            message = {"message": "Target endpoint is not in Envoy stats."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(404)
+            self.write(json.dumps(message))
+            return
+
+        result = {"endpoint_uuid": endpoint_uuid,
+                  "collected_at": collected_at}
+        result.update(stats)
+        self.set_header("Content-Type", "application/json")
+        self.set_status(200)
+        self.write(json.dumps(result))
+
+
+class ServersHandler(ReadHandler):
     def post(self, endpoint_uuid: str) -> None:
         mode = requests.MODE_KEY_ADD
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
 
         body: t.Dict[str, str] = json.loads(self.request.body)
         address: str = body["address"]
         port: int = int(body["port"])
 
+        try:
+            expires_at: t.Optional[float] = parse_expires_at(body)
+        except requests.InvalidParameter as e:
+            message = {"message": str(e)}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return
+
         idx: t.Optional[t.Tuple[int]] = \
-            redis.get_endpoint_index(lb_port=None,
-                                     url_prefix=None,
-                                     endpoint_uuid=endpoint_uuid)
+            repository.get_endpoint_index(lb_port=None,
+                                          url_prefix=None,
+                                          endpoint_uuid=endpoint_uuid)
         if idx is None:
             message = {"message": "Target endpoint was not found"}
             self.set_header("Content-Type", "application/json")
@@ -138,11 +590,18 @@ class ServersHandler(tornado.web.RequestHandler):
             self.write(json.dumps(message))
             return
 
-        eidx: t.Optional[t.Tuple[int]] = \
-            redis.get_server_info(address=address,
-                                  port=port,
-                                  server_uuid=None)
-        if eidx is not None:
+        sr_req = requests.Server(mode,
+                                 address,
+                                 port,
+                                 endpoint_uuid,
+                                 expires_at)
+
+        server: t.Optional[t.Tuple[str, int]] = \
+            repository.get_server_info(endpoint_uuid=endpoint_uuid,
+                                       address=address,
+                                       port=port,
+                                       server_uuid=None)
+        if server is not None and not is_added_again(sr_req.get_dict()):
             message = {"message": "Specified server 'address' with 'port' is "
                        "already registered."}
             self.set_header("Content-Type", "application/json")
@@ -150,22 +609,64 @@ class ServersHandler(tornado.web.RequestHandler):
             self.write(json.dumps(message))
             return
 
-        sr_req = requests.Server(mode,
-                                 address,
-                                 port,
-                                 endpoint_uuid)
-        redis.add_queue(sr_req.get_json())
+        operation_id: str = repository.add_queue(sr_req.get_json(),
+                                                 lane)
+
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(message))
+        self.set_status(202)
+
+    def put(self, endpoint_uuid: str) -> None:
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
+
+        body: t.Dict[str, t.List[t.Dict[str, str]]] = \
+            json.loads(self.request.body)
+
+        idx: t.Optional[t.Tuple[int]] = \
+            repository.get_endpoint_index(lb_port=None,
+                                          url_prefix=None,
+                                          endpoint_uuid=endpoint_uuid)
+        if idx is None:
+            message = {"message": "Target endpoint was not found"}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(404)
+            self.write(json.dumps(message))
+            return
 
-        message = {"message": "Operation was accepted."}
+        try:
+            servers: t.List[t.Tuple[str, int]] = \
+                [(server["address"], server["port"])
+                 for server in body["servers"]]
+            ss_req = requests.ServerSet(servers, endpoint_uuid)
+        except (KeyError, TypeError, requests.InvalidParameter) as e:
+            message = {"message": "Invalid servers given: {}".format(e)}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return
+
+        operation_id: str = repository.add_queue(ss_req.get_json(),
+                                                 lane)
+
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
         self.set_header("Content-Type", "application/json")
         self.write(json.dumps(message))
         self.set_status(202)
 
     def get(self, endpoint_uuid: str) -> None:
+        reader: t.Optional[r.Repository] = self.get_reader()
+        if reader is None:
+            return
+
         idx: t.Optional[t.Tuple[int]] = \
-            redis.get_endpoint_index(lb_port=None,
-                                     url_prefix=None,
-                                     endpoint_uuid=endpoint_uuid)
+            reader.get_endpoint_index(lb_port=None,
+                                      url_prefix=None,
+                                      endpoint_uuid=endpoint_uuid)
         if idx is None:
             message = {"message": "Target endpoint was not found"}
             self.set_header("Content-Type", "application/json")
@@ -176,7 +677,7 @@ class ServersHandler(tornado.web.RequestHandler):
         resource_idx = idx[0]
         route_idx = idx[1]
 
-        conf: c.EnvoyConf = redis.load_conf()
+        conf: c.EnvoyConf = reader.load_conf()
         result: str = response.make_response(conf,
                                              resource_idx,
                                              route_idx)
@@ -187,11 +688,14 @@ class ServersHandler(tornado.web.RequestHandler):
 
     def delete(self, endpoint_uuid: str, server_uuid: str) -> None:
         mode = requests.MODE_KEY_REMOVE
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
 
         idx: t.Optional[t.Tuple[int]] = \
-            redis.get_endpoint_index(lb_port=None,
-                                     url_prefix=None,
-                                     endpoint_uuid=endpoint_uuid)
+            repository.get_endpoint_index(lb_port=None,
+                                          url_prefix=None,
+                                          endpoint_uuid=endpoint_uuid)
         if idx is None:
             message = {"message": "Target endpoint was not found."}
             self.set_header("Content-Type", "application/json")
@@ -199,51 +703,536 @@ class ServersHandler(tornado.web.RequestHandler):
             self.set_status(404)
             return
 
-        eidx: t.Optional[t.Tuple[int]] = \
-            redis.get_server_info(address=None,
-                                  port=None,
-                                  server_uuid=server_uuid)
-        if eidx is None:
+        server: t.Optional[t.Tuple[str, int]] = \
+            repository.get_server_info(endpoint_uuid=endpoint_uuid,
+                                       address=None,
+                                       port=None,
+                                       server_uuid=server_uuid)
+        if server is None:
             message = {"message": "Target server was not found."}
             self.set_header("Content-Type", "application/json")
             self.write(json.dumps(message))
             self.set_status(404)
             return
 
-        resource_idx = eidx[0]
-        endpoint_idx = eidx[1]
-
-        conf: c.EnvoyConf = redis.load_conf()
-        eds_res = conf.eds.resources[resource_idx]
-        backend_endpoint = eds_res.endpoints[endpoint_idx]
-
+        address, port = server
         sr_req = requests.Server(mode,
-                                 backend_endpoint.address,
-                                 backend_endpoint.port_value,
+                                 address,
+                                 port,
                                  endpoint_uuid)
-        redis.add_queue(sr_req.get_json())
+        operation_id: str = repository.add_queue(sr_req.get_json(),
+                                                 lane)
+
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(message))
+        self.set_status(202)
+
+
+class BackendServersHandler(ReadHandler):
+    def get(self, address: str, port: str) -> None:
+        reader: t.Optional[r.Repository] = self.get_reader()
+        if reader is None:
+            return
+
+        endpoint_uuids: t.List[str] = \
+            reader.get_server_endpoints(address, int(port))
+        if not endpoint_uuids:
+            message = {"message": "Target server was not found."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(404)
+            self.write(json.dumps(message))
+            return
+
+        result = {
+            "server_uuid": r.gen_server_uuid(address, int(port)),
+            "address": address,
+            "port": int(port),
+            "endpoints": endpoint_uuids
+        }
+        self.set_header("Content-Type", "application/json")
+        self.set_status(200)
+        self.write(json.dumps(result))
+
+
+class DrainHandler(BaseHandler):
+    def post(self, address: str, port: str) -> None:
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
+
+        endpoint_uuids: t.List[str] = \
+            repository.get_server_endpoints(address, int(port))
+        if not endpoint_uuids:
+            message = {"message": "Target server was not found."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(404)
+            self.write(json.dumps(message))
+            return
+
+        try:
+            dr_req = requests.Drain(address, int(port))
+        except requests.InvalidParameter as e:
+            message = {"message": str(e)}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return
+
+        operation_id: str = repository.add_queue(dr_req.get_json(),
+                                                 lane)
+
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
+        self.set_header("Content-Type", "application/json")
+        self.write(json.dumps(message))
+        self.set_status(202)
+
+
+class BatchHandler(BaseHandler):
+    @staticmethod
+    def _load_endpoints() -> t.Dict[str, t.Tuple[str, str, str]]:
+        endpoints: t.Dict[str, t.Tuple[str, str, str]] = {}
+
+        conf: c.EnvoyConf = repository.load_conf()
+        for lds_res in conf.lds.resources:
+            for route in lds_res.routes:
+                endpoints[route.cluster_name] = (lds_res.port,
+                                                 route.prefix,
+                                                 route.host_header)
+        return endpoints
+
+    def _make_operations(
+            self,
+            items: t.List[t.Dict[str, str]]
+    ) -> t.List[t.Union[requests.Endpoint, requests.Server]]:
+        # Endpoints added in this batch, removal may refer to them.
+        added: t.Dict[str, t.Tuple[str, str, str]] = {}
+        registered: t.Optional[t.Dict[str, t.Tuple[str, str, str]]] = None
+
+        operations: t.List[t.Union[requests.Endpoint, requests.Server]] = []
+        for item in items:
+            mode: str = item["mode"]
+
+            if item["type"] == BATCH_TYPE_ENDPOINT:
+                if mode == requests.MODE_KEY_ADD:
+                    port_value: str = item["port_value"]
+                    route: str = item["route"]
+                    host_header: str = item["host_header"]
+                    config_sets: t.Optional[t.List[str]] = \
+                        parse_config_sets(item)
+                    endpoint_uuid: str = r.gen_endpoint_uuid(port_value,
+                                                             route)
+                    added[endpoint_uuid] = (port_value, route, host_header)
+                else:
+                    endpoint_uuid = item["endpoint_uuid"]
+                    if endpoint_uuid in added:
+                        port_value, route, host_header = added[endpoint_uuid]
+                    else:
+                        if registered is None:
+                            registered = self._load_endpoints()
+                        port_value, route, host_header = \
+                            registered[endpoint_uuid]
+                    config_sets = None
+
+                operations.append(requests.Endpoint(mode,
+                                                    port_value,
+                                                    route,
+                                                    host_header,
+                                                    endpoint_uuid,
+                                                    config_sets=config_sets))
+
+            elif item["type"] == BATCH_TYPE_SERVER:
+                operations.append(requests.Server(mode,
+                                                  item["address"],
+                                                  int(item["port"]),
+                                                  item["endpoint_uuid"]))
+
+            else:
+                raise requests.InvalidParameter("type")
+
+        return operations
+
+    def post(self) -> None:
+        lane: t.Optional[str] = self.get_lane()
+        if lane is None:
+            return
+
+        body: t.Dict[str, t.List[t.Dict[str, str]]] = \
+            json.loads(self.request.body)
+        items: t.List[t.Dict[str, str]] = body.get("operations", [])
+        if len(items) > MAX_BATCH_OPERATIONS:
+            message = {"message": "Too many operations in a batch."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return
+
+        try:
+            operations = self._make_operations(items)
+            batch_req = requests.Batch(operations)
+        except (KeyError, TypeError, ValueError,
+                requests.InvalidParameter) as e:
+            message = {"message": "Invalid operation given: {}".format(e)}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return
+
+        operation_id: str = repository.add_queue(batch_req.get_json(),
+                                                 lane)
 
-        message = {"message": "Operation was accepted."}
+        message = {"message": "Operation was accepted.",
+                   "operation_id": operation_id}
         self.set_header("Content-Type", "application/json")
         self.write(json.dumps(message))
         self.set_status(202)
 
 
+def make_import_operation(
+        record: t.Dict[str, str]) -> t.Union[requests.Endpoint,
+                                             requests.Server]:
+    mode = requests.MODE_KEY_ADD
+
+    if record["type"] == BATCH_TYPE_ENDPOINT:
+        port_value: str = record["port_value"]
+        route: str = record["route"]
+        return requests.Endpoint(mode,
+                                 port_value,
+                                 route,
+                                 record["host_header"],
+                                 r.gen_endpoint_uuid(port_value, route),
+                                 config_sets=parse_config_sets(record))
+
+    if record["type"] == BATCH_TYPE_SERVER:
+        endpoint_uuid: t.Optional[str] = record.get("endpoint_uuid")
+        if endpoint_uuid is None:
+            endpoint_uuid = r.gen_endpoint_uuid(record["port_value"],
+                                                record["route"])
+        return requests.Server(mode,
+                               record["address"],
+                               int(record["port"]),
+                               endpoint_uuid)
+
+    raise requests.InvalidParameter("type")
+
+
+@tornado.web.stream_request_body
+class ImportHandler(BaseHandler):
+    def prepare(self) -> None:
+        self.request.connection.set_max_body_size(IMPORT_MAX_BODY_SIZE)
+
+        self._buffer = b""
+        self._line_number = 0
+        self._records = 0
+        self._operations: t.List[t.Union[requests.Endpoint,
+                                         requests.Server]] = []
+        self._operation_ids: t.List[str] = []
+        self._error: t.Optional[str] = None
+
+        try:
+            self._lane = parse_lane(self.get_query_argument("lane",
+                                                            r.LANE_BULK))
+        except requests.InvalidParameter as e:
+            self._error = str(e)
+            return
+
+        # The rest of the rejected body is ignored.
+        if not self.admit():
+            self._error = "Request was rejected."
+
+    def data_received(self, chunk: bytes) -> None:
+        if self._error is not None:
+            return
+
+        self._buffer += chunk
+        lines: t.List[bytes] = self._buffer.split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self._add_record(line)
+
+    def _add_record(self, line: bytes) -> None:
+        if self._error is not None:
+            return
+
+        self._line_number += 1
+        if not line.strip():
+            return
+
+        try:
+            record: t.Dict[str, str] = json.loads(line)
+            if record["type"] == RECORD_TYPE_SNAPSHOT:
+                return
+
+            self._operations.append(make_import_operation(record))
+        except (KeyError, TypeError, ValueError,
+                requests.InvalidParameter) as e:
+            self._error = "Invalid record given in line {}: {}".format(
+                self._line_number, e)
+            return
+
+        self._records += 1
+        if len(self._operations) >= IMPORT_BATCH_SIZE:
+            self._flush_operations()
+
+    def _flush_operations(self) -> None:
+        if not self._operations:
+            return
+
+        batch_req = requests.Batch(self._operations, upsert=True)
+        self._operation_ids.append(repository.add_queue(batch_req.get_json(),
+                                                        self._lane))
+        self._operations = []
+
+    def post(self) -> None:
+        self._add_record(self._buffer)
+        self._buffer = b""
+
+        if self._error is None:
+            self._flush_operations()
+
+        message = {"records": self._records,
+                   "operation_ids": self._operation_ids}
+        self.set_header("Content-Type", "application/json")
+        if self._error is not None:
+            # Batches already enqueued are applied, report them.
+            message["message"] = self._error
+            self.set_status(400)
+        else:
+            message["message"] = "Operation was accepted."
+            self.set_status(202)
+        self.write(json.dumps(message))
+
+
+class ExportHandler(ReadHandler):
+    async def get(self) -> None:
+        reader: t.Optional[r.Repository] = self.get_reader()
+        if reader is None:
+            return
+
+        # The whole snapshot is loaded by one read, so every record
+        # belongs to the same config version.
+        conf: c.EnvoyConf = reader.load_conf()
+
+        config_sets: t.Dict[str, t.List[str]] = {
+            cds_res.cluster_name: cds_res.config_sets
+            for cds_res in conf.cds.resources
+            if cds_res.config_sets is not None
+        }
+        eds_map: t.Dict[str, t.List[t.Tuple[str, int]]] = {}
+        for eds_res in conf.eds.resources:
+            eds_map[eds_res.cluster_name] = \
+                [(endpoint.address, endpoint.port_value)
+                 for endpoint in eds_res.endpoints]
+
+        self.set_header("Content-Type", "application/x-ndjson")
+        self.set_status(200)
+        self.write(json.dumps({
+            "type": RECORD_TYPE_SNAPSHOT,
+            "lds_version": conf.lds.version_info,
+            "cds_version": conf.cds.version_info,
+            "eds_version": conf.eds.version_info
+        }) + "\n")
+
+        records = 0
+        for lds_res in conf.lds.resources:
+            for route in lds_res.routes:
+                endpoint_uuid: str = route.cluster_name
+                record = {
+                    "type": BATCH_TYPE_ENDPOINT,
+                    "endpoint_uuid": endpoint_uuid,
+                    "port_value": lds_res.port,
+                    "route": route.prefix,
+                    "host_header": route.host_header
+                }
+                if endpoint_uuid in config_sets:
+                    record["config_sets"] = config_sets[endpoint_uuid]
+                self.write(json.dumps(record) + "\n")
+                records += 1
+
+                for address, port in eds_map.get(endpoint_uuid, []):
+                    self.write(json.dumps({
+                        "type": BATCH_TYPE_SERVER,
+                        "endpoint_uuid": endpoint_uuid,
+                        "address": address,
+                        "port": port
+                    }) + "\n")
+                    records += 1
+
+                if records >= EXPORT_FLUSH_RECORDS:
+                    await self.flush()
+                    records = 0
+
+
+class OperationsHandler(tornado.web.RequestHandler):
+    async def get(self, operation_id: str) -> None:
+        try:
+            wait: float = parse_wait(self.get_query_argument("wait", "0"))
+        except ValueError:
+            message = {"message": "Invalid 'wait' parameter."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(400)
+            self.write(json.dumps(message))
+            return
+
+        operation: t.Optional[r.OPERATION_TYPE] = \
+            repository.get_operation(operation_id)
+        if operation is None:
+            message = {"message": "Target operation was not found."}
+            self.set_header("Content-Type", "application/json")
+            self.set_status(404)
+            self.write(json.dumps(message))
+            return
+
+        if operation["status"] == r.OPERATION_PENDING and wait > 0:
+            future = waiters.register(operation_id)
+            try:
+                # Check again after registering not to miss a notification
+                # published before the subscription was made.
+                operation = repository.get_operation(operation_id)
+                if operation["status"] == r.OPERATION_PENDING:
+                    await tornado.gen.with_timeout(
+                        datetime.timedelta(seconds=wait), future)
+                    operation = repository.get_operation(operation_id)
+            except tornado.gen.TimeoutError:
+                operation = repository.get_operation(operation_id)
+            finally:
+                waiters.unregister(operation_id, future)
+
+        latency = get_latency(operation)
+        if latency:
+            operation["latency_seconds"] = latency
+
+        self.set_header("Content-Type", "application/json")
+        self.set_status(200)
+        self.write(json.dumps(operation))
+
+
+class WatchHandler(tornado.web.RequestHandler):
+    def initialize(self) -> None:
+        self._closed = False
+        self._ndjson = False
+
+    def on_connection_close(self) -> None:
+        self._closed = True
+
+    def _write_change(self,
+                      change_id: str,
+                      event: r.CHANGE_EVENT_TYPE) -> None:
+        if self._ndjson:
+            change = {"id": change_id}
+            change.update(event)
+            self.write(json.dumps(change) + "\n")
+        else:
+            self.write("id: {}\nevent: {}\ndata: {}\n\n".format(
+                change_id, event["type"], json.dumps(event)))
+
+    def _write_keepalive(self) -> None:
+        if self._ndjson:
+            self.write("\n")
+        else:
+            self.write(": keepalive\n\n")
+
+    async def get(self) -> None:
+        self._ndjson = self.get_query_argument("format", "sse") == "ndjson"
+
+        # The stream entry ID of the last received event is the resume token.
+        last_change_id: t.Optional[str] = \
+            self.request.headers.get("Last-Event-ID") \
+            or self.get_query_argument("since", None)
+        if last_change_id is not None:
+            try:
+                parse_stream_id(last_change_id)
+            except ValueError:
+                message = {"message": "Invalid resume token."}
+                self.set_header("Content-Type", "application/json")
+                self.set_status(400)
+                self.write(json.dumps(message))
+                return
+
+        if self._ndjson:
+            self.set_header("Content-Type", "application/x-ndjson")
+        else:
+            self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+        self.set_status(200)
+
+        # Subscribe before reading missed events not to lose changes
+        # appended in between, duplicated ones are skipped by their IDs.
+        subscriber = change_feed.subscribe()
+        try:
+            if last_change_id is not None:
+                first_change_id = repository.get_first_change_id()
+                if first_change_id is not None \
+                        and parse_stream_id(last_change_id) \
+                        < parse_stream_id(first_change_id):
+                    # Missed events are no longer kept, so the client
+                    # has to fetch the whole configuration again.
+                    self._write_change(last_change_id,
+                                       {"type": CHANGE_RESYNC})
+                else:
+                    for change_id, event in \
+                            repository.get_changes(last_change_id):
+                        self._write_change(change_id, event)
+                        last_change_id = change_id
+            await self.flush()
+
+            while not self._closed:
+                try:
+                    change_id, event = await subscriber.get(
+                        timeout=datetime.timedelta(
+                            seconds=CHANGE_KEEPALIVE_SECONDS))
+                except tornado.util.TimeoutError:
+                    self._write_keepalive()
+                    await self.flush()
+                    continue
+
+                if last_change_id is not None \
+                        and parse_stream_id(change_id) \
+                        <= parse_stream_id(last_change_id):
+                    continue
+
+                self._write_change(change_id, event)
+                last_change_id = change_id
+                await self.flush()
+
+        except tornado.iostream.StreamClosedError:
+            pass
+
+        finally:
+            change_feed.unsubscribe(subscriber)
+
+
 def make_app():
     return tornado.web.Application([
         (r"/v1/endpoints", EndpointsHandler),
         (r"/v1/endpoints/(?P<endpoint_uuid>[a-zA-Z0-9-]+)",
          EndpointsWithArgHandler),
+        (r"/v1/endpoints/(?P<endpoint_uuid>[a-zA-Z0-9-]+)/stats",
+         EndpointStatsHandler),
         (r"/v1/endpoints/(?P<endpoint_uuid>[a-zA-Z0-9-]+)/servers",
          ServersHandler),
         (r"/v1/endpoints/(?P<endpoint_uuid>[a-zA-Z0-9-]+)/servers"
          + r"/(?P<server_uuid>[a-zA-Z0-9-]+)",
          ServersHandler),
+        (r"/v1/servers/(?P<address>[a-zA-Z0-9.-]+):(?P<port>[0-9]+)",
+         BackendServersHandler),
+        (r"/v1/servers/(?P<address>[a-zA-Z0-9.-]+):(?P<port>[0-9]+)/drain",
+         DrainHandler),
+        (r"/v1/batch", BatchHandler),
+        (r"/v1/import", ImportHandler),
+        (r"/v1/export", ExportHandler),
+        (r"/v1/operations/(?P<operation_id>[0-9-]+)", OperationsHandler),
+        (r"/v1/watch", WatchHandler),
     ])
 
 
 if __name__ == "__main__":
     app = make_app()
     app.listen(8888)
+    waiters.start()
+    change_feed.start()
+    stats_collector.start()
     print("API server is started on HTTP port 8888.")
     tornado.ioloop.IOLoop.current().start()
@@ -0,0 +1,113 @@
+import json
+import typing as t
+
+import database.repository as r
+import requests as req
+
+COMPACTION_DUPLICATE = "duplicate"
+COMPACTION_SUPERSEDED = "superseded"
+
+KEY_TYPE = t.Tuple[str, ...]
+
+
+def get_key(request: req.REQUEST_TYPE) -> t.Optional[KEY_TYPE]:
+    if request[req.MODE_KEY] not in (req.MODE_KEY_ADD, req.MODE_KEY_REMOVE):
+        return None
+
+    endpoint_uuid: str = request[req.ENDPOINT_UUID]
+    if req.ENDPOINTS_CASE_NAME in request:
+        return (req.ENDPOINTS_CASE_NAME, endpoint_uuid)
+
+    if req.SERVERS_CASE_NAME in request:
+        request_value: req.SERVERS_REQUEST_TYPE = \
+            request[req.SERVERS_CASE_NAME]
+        return (req.SERVERS_CASE_NAME,
+                endpoint_uuid,
+                request_value[req.ADDRESS_KEY],
+                str(request_value[req.PORT_KEY]))
+
+    return None
+
+
+def merge(earlier: req.REQUEST_TYPE,
+          later: req.REQUEST_TYPE) -> t.Optional[str]:
+    """Returns which of the two requests of the same key is dropped.
+
+    "later" is dropped as a duplicate, "earlier" is dropped as
+    superseded by the later one, and None keeps both.
+    """
+    earlier_mode: str = earlier[req.MODE_KEY]
+    later_mode: str = later[req.MODE_KEY]
+    is_endpoint = req.ENDPOINTS_CASE_NAME in later
+
+    if earlier_mode == later_mode:
+        # An endpoint added again with other values is kept to report
+        # the same result as without compaction, and a server added again
+        # with another TTL to refresh or cancel its deadline.
+        if is_endpoint and later_mode == req.MODE_KEY_ADD \
+                and json.dumps(earlier, sort_keys=True) != \
+                json.dumps(later, sort_keys=True):
+            return None
+        if later_mode == req.MODE_KEY_ADD \
+                and earlier.get(req.EXPIRES_AT_KEY) != \
+                later.get(req.EXPIRES_AT_KEY):
+            return None
+        return "later"
+
+    if earlier_mode == req.MODE_KEY_ADD:
+        # Removed anyway, whether the resource existed before or not.
+        return "earlier"
+
+    # A server is the same resource after being added again, but an
+    # endpoint may be added again with other values.
+    if is_endpoint:
+        return None
+    return "earlier"
+
+
+def compact(
+        entries: t.List[r.QUEUE_ENTRY_TYPE]
+) -> t.Tuple[t.List[r.QUEUE_ENTRY_TYPE], t.Dict[str, str]]:
+    """Drops queued operations cancelled or repeated by the others.
+
+    Operations are merged per endpoint or per server of an endpoint
+    while keeping their order. An endpoint operation is not merged across
+    server operations of the endpoint and vice versa, and operations
+    other than add and remove are not merged across at all.
+    """
+    dropped: t.Dict[str, str] = {}
+    last: t.Dict[KEY_TYPE, int] = {}
+
+    def conflicts(key: KEY_TYPE) -> t.List[KEY_TYPE]:
+        endpoint_uuid = key[1]
+        return [k for k in last
+                if k[1] == endpoint_uuid and k[0] != key[0]]
+
+    for position, (operation_id, request) in enumerate(entries):
+        key = get_key(request)
+        if key is None:
+            last.clear()
+            continue
+
+        for conflict in conflicts(key):
+            del last[conflict]
+
+        earlier_position = last.get(key)
+        if earlier_position is None:
+            last[key] = position
+            continue
+
+        earlier_id, earlier = entries[earlier_position]
+        drop = merge(earlier, request)
+        if drop == "later":
+            dropped[operation_id] = COMPACTION_DUPLICATE
+        elif drop == "earlier":
+            dropped[earlier_id] = COMPACTION_SUPERSEDED
+            last[key] = position
+        else:
+            last[key] = position
+
+    survivors = [(operation_id, request)
+                 for operation_id, request in entries
+                 if operation_id not in dropped]
+    return survivors, dropped
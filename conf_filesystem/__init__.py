@@ -2,3 +2,5 @@ CONF_DIR = "/opt/app/envoy/"
 CDS_JSON = CONF_DIR + "cds.json"
 EDS_JSON = CONF_DIR + "eds.json"
 LDS_JSON = CONF_DIR + "lds.json"
+# Files of a config set are written to its own directory.
+SETS_DIR = CONF_DIR + "sets/"
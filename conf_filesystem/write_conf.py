@@ -1,4 +1,10 @@
+import copy
+import json
+import os
+import typing as t
+
 import entity.conf as c
+import entity.diff as d
 import conf_filesystem as cf
 import conf_filesystem.read_conf as rc
 
@@ -9,21 +15,67 @@ class WriteConfFailed(Exception):
         super().__init__(error)
 
 
-def write_conf_files(conf: c.EnvoyConf) -> None:
-    with open(cf.LDS_JSON, 'w') as f:
-        f.write(conf.lds.get_json())
+def write_conf_files(conf: c.EnvoyConf,
+                     changes: t.Optional[d.ChangeSet] = None) -> None:
+    # Only the files of the changed xDS types are written with changes.
+    if changes is None or changes.lds_changed:
+        with open(cf.LDS_JSON, 'w') as f:
+            f.write(conf.lds.get_json())
+
+        if conf.lds.get_json() != rc.load_lds_conf_file():
+            raise WriteConfFailed()
+
+    if changes is None or changes.cds_changed:
+        with open(cf.CDS_JSON, 'w') as f:
+            f.write(conf.cds.get_json())
+
+        if conf.cds.get_json() != rc.load_cds_conf_file():
+            raise WriteConfFailed()
+
+    if changes is None or changes.eds_changed:
+        with open(cf.EDS_JSON, 'w') as f:
+            f.write(conf.eds.get_json())
+
+        if conf.eds.get_json() != rc.load_eds_conf_file():
+            raise WriteConfFailed()
+
+
+def get_set_dir(name: str) -> str:
+    return cf.SETS_DIR + name + "/"
+
+
+def _write_file(path: str, conf_json: str) -> None:
+    with open(path, 'w') as f:
+        f.write(conf_json)
+
+    with open(path, 'r') as f:
+        if f.read() != conf_json:
+            raise WriteConfFailed()
 
-    if conf.lds.get_json() != rc.load_lds_conf_file():
-        raise WriteConfFailed()
 
-    with open(cf.CDS_JSON, 'w') as f:
-        f.write(conf.cds.get_json())
+def write_set_files(name: str,
+                    conf: c.EnvoyConf,
+                    changes: t.Optional[d.ChangeSet] = None) -> None:
+    set_dir = get_set_dir(name)
+    os.makedirs(set_dir, exist_ok=True)
 
-    if conf.cds.get_json() != rc.load_cds_conf_file():
-        raise WriteConfFailed()
+    # Only the files of the changed xDS types are written with changes.
+    if changes is None or changes.lds_changed:
+        _write_file(set_dir + os.path.basename(cf.LDS_JSON),
+                    conf.lds.get_json())
 
-    with open(cf.EDS_JSON, 'w') as f:
-        f.write(conf.eds.get_json())
+    if changes is None or changes.cds_changed:
+        # Clusters of the set take their load assignments from the set.
+        cds_dict = copy.deepcopy(conf.cds.get_dict())
+        for resource in cds_dict["resources"]:
+            eds_config = resource["eds_cluster_config"]["eds_config"]
+            if "path" in eds_config:
+                eds_config["path"] = os.path.join(
+                    os.path.dirname(eds_config["path"]),
+                    "sets", name, os.path.basename(cf.EDS_JSON))
+        _write_file(set_dir + os.path.basename(cf.CDS_JSON),
+                    json.dumps(cds_dict))
 
-    if conf.eds.get_json() != rc.load_eds_conf_file():
-        raise WriteConfFailed()
+    if changes is None or changes.eds_changed:
+        _write_file(set_dir + os.path.basename(cf.EDS_JSON),
+                    conf.eds.get_json())
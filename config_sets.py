@@ -0,0 +1,275 @@
+import copy
+import os
+import typing as t
+from concurrent import futures
+
+import conf_filesystem.write_conf as cf
+import database.repository as r
+import entity.conf as c
+import entity.diff as d
+
+# Names of the config sets, which are the cluster IDs of their Envoy nodes.
+try:
+    CONFIG_SETS = [name for name in os.environ["CONFIG_SETS"].split(",")
+                   if name]
+except KeyError:
+    CONFIG_SETS = []
+
+try:
+    CONFIG_SET_WORKERS = int(os.environ["CONFIG_SET_WORKERS"])
+except KeyError:
+    CONFIG_SET_WORKERS = 4
+
+# Config sets of a cluster, None for all of them.
+MEMBERSHIP_TYPE = t.Optional[t.FrozenSet[str]]
+RESOURCES_TYPE = t.Dict[str, t.Dict[str, t.Any]]
+
+
+def get_membership(conf: c.EnvoyConf) -> t.Dict[str, MEMBERSHIP_TYPE]:
+    return {cds_res.cluster_name: frozenset(cds_res.config_sets)
+            if cds_res.config_sets is not None else None
+            for cds_res in conf.cds.resources}
+
+
+def get_changed_clusters(changes: d.ChangeSet) -> t.Set[str]:
+    # A route is changed without its cluster by a new host header.
+    cluster_names: t.Set[str] = set(changes.clusters)
+    cluster_names.update(changes.load_assignments)
+    cluster_names.update(r.gen_endpoint_uuid(port, prefix)
+                         for port, prefix in changes.routes)
+    return cluster_names
+
+
+def _replace(resources: RESOURCES_TYPE,
+             key: str,
+             resource: t.Optional[t.Dict[str, t.Any]],
+             changes: t.Dict[str, str]) -> None:
+    # Records the change of the resource of the key, None removes it.
+    old_resource = resources.get(key)
+    if resource is None:
+        if old_resource is not None:
+            del resources[key]
+            changes[key] = d.CHANGE_REMOVED
+    elif old_resource is None:
+        resources[key] = resource
+        changes[key] = d.CHANGE_ADDED
+    elif old_resource != resource:
+        resources[key] = resource
+        changes[key] = d.CHANGE_MODIFIED
+
+
+class ConfigSetWriter:
+    """Renders the config sets of the Envoy nodes from the config.
+
+    A config set takes the clusters assigned to it, their load assignments
+    and the listeners with the routes to them. The resources of every set
+    are kept, and a change set replaces only the ones it touches in the
+    sets of its clusters, which are written in parallel.
+    """
+
+    def __init__(self, names: t.List[str] = CONFIG_SETS) -> None:
+        self._names = names
+        self._membership: t.Dict[str, MEMBERSHIP_TYPE] = {}
+        # Port of the listener routing to a cluster.
+        self._ports: t.Dict[str, str] = {}
+        # Resources of the sets by their names and stable keys.
+        self._listeners: t.Dict[str, RESOURCES_TYPE] = {}
+        self._clusters: t.Dict[str, RESOURCES_TYPE] = {}
+        self._load_assignments: t.Dict[str, RESOURCES_TYPE] = {}
+        self._confs: t.Dict[str, c.EnvoyConf] = {}
+
+    def is_member(self, cluster_name: str, name: str) -> bool:
+        sets = self._membership.get(cluster_name, frozenset())
+        return sets is None or name in sets
+
+    def get_affected(self,
+                     conf: c.EnvoyConf,
+                     changes: t.Optional[d.ChangeSet]) -> t.List[str]:
+        if changes is None:
+            self._membership = get_membership(conf)
+            self._ports = {r.gen_endpoint_uuid(lds_res.port, route.prefix):
+                           lds_res.port
+                           for lds_res in conf.lds.resources
+                           for route in lds_res.routes}
+            return list(self._names)
+
+        cluster_names = get_changed_clusters(changes)
+        membership = {cds_res.cluster_name: frozenset(cds_res.config_sets)
+                      if cds_res.config_sets is not None else None
+                      for cds_res in conf.cds.resources
+                      if cds_res.cluster_name in cluster_names}
+        for (port, prefix), change in changes.routes.items():
+            if change == d.CHANGE_REMOVED:
+                self._ports.pop(r.gen_endpoint_uuid(port, prefix), None)
+            else:
+                self._ports[r.gen_endpoint_uuid(port, prefix)] = port
+
+        # A cluster leaves the sets it belonged to before the change.
+        affected: t.Set[str] = set()
+        for cluster_name in cluster_names:
+            for sets in (self._membership.pop(cluster_name, frozenset()),
+                         membership.get(cluster_name, frozenset())):
+                if sets is None:
+                    affected.update(self._names)
+                else:
+                    affected.update(sets)
+
+            if cluster_name in membership:
+                self._membership[cluster_name] = membership[cluster_name]
+
+        return [name for name in self._names if name in affected]
+
+    def _load(self, conf: c.EnvoyConf) -> None:
+        # Resources are copied once and shared by the sets, which only
+        # read them.
+        for name in self._names:
+            self._listeners[name] = {}
+            self._clusters[name] = {}
+            self._load_assignments[name] = {}
+
+        for lds_res in conf.lds.resources:
+            for name in self._names:
+                listener = c.filter_listener(
+                    lds_res.get_dict(),
+                    lambda cluster_name: self.is_member(cluster_name, name))
+                if listener is not None:
+                    self._listeners[name][lds_res.port] = listener
+
+        for xds_resources, set_resources in (
+                (conf.cds.resources, self._clusters),
+                (conf.eds.resources, self._load_assignments)):
+            for resource in xds_resources:
+                names = [name for name in self._names
+                         if self.is_member(resource.cluster_name, name)]
+                if not names:
+                    continue
+
+                resource_dict = copy.deepcopy(resource.get_dict())
+                for name in names:
+                    set_resources[name][resource.cluster_name] = \
+                        resource_dict
+
+    def _patch(self,
+               conf: c.EnvoyConf,
+               changes: d.ChangeSet,
+               affected: t.List[str]) -> t.Dict[str, d.ChangeSet]:
+        # Listeners of the changed clusters are filtered again, as they
+        # take or lose a route when a cluster joins or leaves a set.
+        cluster_names = get_changed_clusters(changes)
+        ports: t.Set[str] = set(changes.listeners)
+        ports.update(self._ports[cluster_name]
+                     for cluster_name in cluster_names
+                     if cluster_name in self._ports)
+
+        listeners = {lds_res.port: lds_res.get_dict()
+                     for lds_res in conf.lds.resources
+                     if lds_res.port in ports}
+        clusters = {cds_res.cluster_name: copy.deepcopy(cds_res.get_dict())
+                    for cds_res in conf.cds.resources
+                    if cds_res.cluster_name in cluster_names}
+        load_assignments = {
+            eds_res.cluster_name: copy.deepcopy(eds_res.get_dict())
+            for eds_res in conf.eds.resources
+            if eds_res.cluster_name in cluster_names}
+        versions = {xds_type for xds_type, changed
+                    in ((d.XDS_LDS, changes.lds_changed),
+                        (d.XDS_CDS, changes.cds_changed),
+                        (d.XDS_EDS, changes.eds_changed))
+                    if changed}
+
+        set_changes: t.Dict[str, d.ChangeSet] = {}
+        for name in affected:
+            def is_member(cluster_name: str) -> bool:
+                return self.is_member(cluster_name, name)
+
+            listener_changes: t.Dict[str, str] = {}
+            for port in ports:
+                listener = listeners.get(port)
+                _replace(self._listeners[name],
+                         port,
+                         c.filter_listener(listener, is_member)
+                         if listener is not None else None,
+                         listener_changes)
+
+            cluster_changes: t.Dict[str, str] = {}
+            load_assignment_changes: t.Dict[str, str] = {}
+            for cluster_name in cluster_names:
+                member = is_member(cluster_name)
+                _replace(self._clusters[name],
+                         cluster_name,
+                         clusters.get(cluster_name) if member else None,
+                         cluster_changes)
+                _replace(self._load_assignments[name],
+                         cluster_name,
+                         load_assignments.get(cluster_name)
+                         if member else None,
+                         load_assignment_changes)
+
+            # Routes and lb endpoints are not kept by the sets.
+            set_changes[name] = d.ChangeSet(listener_changes,
+                                            {},
+                                            cluster_changes,
+                                            load_assignment_changes,
+                                            {},
+                                            versions)
+        return set_changes
+
+    def render(self,
+               conf: c.EnvoyConf,
+               name: str,
+               changes: t.Optional[d.ChangeSet] = None) -> c.EnvoyConf:
+        # Only the xDS types changed are built again from the resources.
+        conf_dict: c.ENVOY_CONF_TYPE = {}
+        if changes is None or changes.lds_changed:
+            conf_dict["lds"] = {
+                "version_info": conf.lds.version_info,
+                "resources": list(self._listeners[name].values())}
+        if changes is None or changes.cds_changed:
+            conf_dict["cds"] = {
+                "version_info": conf.cds.version_info,
+                "resources": list(self._clusters[name].values())}
+        if changes is None or changes.eds_changed:
+            conf_dict["eds"] = {
+                "version_info": conf.eds.version_info,
+                "resources": list(self._load_assignments[name].values())}
+
+        set_conf = self._confs.get(name)
+        if set_conf is None:
+            set_conf = conf.replace_types(conf_dict)
+        else:
+            set_conf = set_conf.replace_types(conf_dict)
+        cf.write_set_files(name, set_conf, changes)
+        self._confs[name] = set_conf
+        return set_conf
+
+    def write(
+            self,
+            conf: c.EnvoyConf,
+            changes: t.Optional[d.ChangeSet] = None
+    ) -> t.Dict[str, t.Tuple[c.EnvoyConf, t.Optional[d.ChangeSet]]]:
+        """Returns the config sets written with their own change sets."""
+        if not self._names:
+            return {}
+
+        # The sets are rendered whole until they are loaded.
+        if not self._confs:
+            changes = None
+
+        affected = self.get_affected(conf, changes)
+        if not affected:
+            return {}
+
+        set_changes: t.Dict[str, t.Optional[d.ChangeSet]] = {}
+        if changes is None:
+            self._load(conf)
+            set_changes = {name: None for name in affected}
+        else:
+            set_changes.update(self._patch(conf, changes, affected))
+
+        with futures.ThreadPoolExecutor(
+                max_workers=CONFIG_SET_WORKERS) as executor:
+            set_confs = executor.map(
+                lambda name: self.render(conf, name, set_changes[name]),
+                affected)
+            return {name: (set_conf, set_changes[name])
+                    for name, set_conf in zip(affected, set_confs)}
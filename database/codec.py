@@ -0,0 +1,139 @@
+import abc
+import typing as t
+import zlib
+
+# Encoded value is prefixed with the magic and a codec ID byte.
+# Value without the magic is plain JSON written by former versions.
+HEADER_MAGIC = b"PXC"
+HEADER_LENGTH = len(HEADER_MAGIC) + 1
+
+CODEC_JSON = "json"
+CODEC_ZLIB = "zlib"
+CODEC_ZDICT = "zdict"
+
+ZLIB_LEVEL = 6
+
+# Preset dictionary of zdict made of the resource templates, as resources
+# repeat them. It is frozen, as a snapshot is decoded only by the
+# dictionary it was encoded with, while the templates may change.
+ZDICT = \
+    b'{"@type": "type.googleapis.com/envoy.config.cluster.v3.Cluster", "n' \
+    b'ame": "service1", "connect_timeout": "0.25s", "lb_policy": "ROUND_R' \
+    b'OBIN", "type": "EDS", "eds_cluster_config": {"service_name": "local' \
+    b'services", "eds_config": {"path": "/etc/envoy/eds.json"}}}{"@type":' \
+    b' "type.googleapis.com/envoy.config.listener.v3.Listener", "address"' \
+    b': {"socket_address": {"address": "0.0.0.0", "port_value": "18080"}}' \
+    b', "filter_chains": [{"filters": [{"name": "envoy.filters.network.ht' \
+    b'tp_connection_manager", "typed_config": {"@type": "type.googleapis.' \
+    b'com/envoy.extensions.filters.network.http_connection_manager.v3.Htt' \
+    b'pConnectionManager", "access_log": [{"name": "envoy.access_loggers.' \
+    b'file", "typed_config": {"@type": "type.googleapis.com/envoy.extensi' \
+    b'ons.access_loggers.file.v3.FileAccessLog", "path": "/dev/stdout"}}]' \
+    b', "stat_prefix": "ingress_http", "codec_type": "AUTO", "route_confi' \
+    b'g": {"name": "local_route", "virtual_hosts": [{"name": "local_servi' \
+    b'ce", "domains": ["*"], "routes": []}]}, "http_filters": [{"name": "' \
+    b'envoy.filters.http.router", "typed_config": {}}]}}]}]}{"@type": "ty' \
+    b'pe.googleapis.com/envoy.api.v2.ClusterLoadAssignment", "cluster_nam' \
+    b'e": "localservices", "endpoints": [{"lb_endpoints": []}]}{"match": ' \
+    b'{"prefix": "/"}, "request_headers_to_add": [], "route": {"cluster":' \
+    b' "service1"}}{"endpoint": {"address": {"socket_address": {"address"' \
+    b': "172.217.175.110", "port_value": 80}}}}'
+
+
+class UnknownCodec(Exception):
+    def __init__(self, codec: str) -> None:
+        error = "Unknown codec '" + codec + "'"
+        super().__init__(error)
+
+
+class Codec(abc.ABC):
+    name = ""
+    codec_id = 0
+
+    @abc.abstractmethod
+    def encode(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def decode(self, data: bytes) -> bytes:
+        raise NotImplementedError()
+
+
+class JsonCodec(Codec):
+    name = CODEC_JSON
+    codec_id = 0
+
+    def encode(self, data: bytes) -> bytes:
+        # Written without the header to be readable by former versions.
+        return data
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+class ZlibCodec(Codec):
+    name = CODEC_ZLIB
+    codec_id = 1
+
+    def encode(self, data: bytes) -> bytes:
+        return zlib.compress(data, ZLIB_LEVEL)
+
+    def decode(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZdictCodec(Codec):
+    name = CODEC_ZDICT
+    codec_id = 2
+
+    def __init__(self, zdict: t.Optional[bytes] = None) -> None:
+        self._zdict = zdict if zdict is not None else ZDICT
+
+    def encode(self, data: bytes) -> bytes:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=self._zdict)
+        return compressor.compress(data) + compressor.flush()
+
+    def decode(self, data: bytes) -> bytes:
+        decompressor = zlib.decompressobj(zdict=self._zdict)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+_codecs_by_name: t.Dict[str, Codec] = {}
+_codecs_by_id: t.Dict[int, Codec] = {}
+
+
+def register_codec(codec: Codec) -> None:
+    _codecs_by_name[codec.name] = codec
+    _codecs_by_id[codec.codec_id] = codec
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return _codecs_by_name[name]
+    except KeyError as e:
+        raise UnknownCodec(name) from e
+
+
+def encode(codec: Codec, data: bytes) -> bytes:
+    if isinstance(codec, JsonCodec):
+        return codec.encode(data)
+
+    return HEADER_MAGIC + bytes([codec.codec_id]) + codec.encode(data)
+
+
+def decode(data: bytes) -> bytes:
+    if not data.startswith(HEADER_MAGIC):
+        return data
+
+    codec_id: int = data[len(HEADER_MAGIC)]
+    try:
+        codec = _codecs_by_id[codec_id]
+    except KeyError as e:
+        raise UnknownCodec(str(codec_id)) from e
+
+    return codec.decode(data[HEADER_LENGTH:])
+
+
+register_codec(JsonCodec())
+register_codec(ZlibCodec())
+register_codec(ZdictCodec())
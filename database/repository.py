@@ -1,11 +1,17 @@
+import abc
 import hashlib
+import ipaddress
 import json
 import os
+import time
 import typing as t
 
 import redis
+import redis.cluster as rc
 
+import database.codec as cc
 import entity.conf as c
+import entity.eds.resource as ed_r
 import requests as req
 
 try:
@@ -15,6 +21,173 @@ except KeyError:
 
 REDIS_PORT = 6379
 
+REDIS_MODE_STANDALONE = "standalone"
+REDIS_MODE_CLUSTER = "cluster"
+
+try:
+    REDIS_MODE = os.environ["REDIS_MODE"]
+except KeyError:
+    REDIS_MODE = REDIS_MODE_STANDALONE
+
+# Comma separated "host:port" of replicas serving read-only calls.
+try:
+    REDIS_REPLICAS = os.environ["REDIS_REPLICAS"]
+except KeyError:
+    REDIS_REPLICAS = ""
+
+REPOSITORY_BACKEND_REDIS = "redis"
+REPOSITORY_BACKEND_SQLITE = "sqlite"
+
+try:
+    REPOSITORY_BACKEND = os.environ["REPOSITORY_BACKEND"]
+except KeyError:
+    REPOSITORY_BACKEND = REPOSITORY_BACKEND_REDIS
+
+try:
+    CONF_CODEC = os.environ["CONF_CODEC"]
+except KeyError:
+    CONF_CODEC = cc.CODEC_JSON
+
+OPERATION_CHANNEL = "operations"
+OPERATION_EXPIRE_SECONDS = 86400
+
+OPERATION_PENDING = "pending"
+OPERATION_APPLIED = "applied"
+OPERATION_UNCHANGED = "unchanged"
+OPERATION_FAILED = "failed"
+OPERATION_SUPERSEDED = "superseded"
+
+OPERATION_TYPE = t.Dict[str, t.Union[str, t.List[c.RESULT_TYPE]]]
+# Times of the stages of an operation by their field names.
+TIMINGS_TYPE = t.Dict[str, float]
+
+# Requests are queued in lanes of priority, in the order of the priority.
+LANE_EMERGENCY = "emergency"
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANES = (LANE_EMERGENCY, LANE_INTERACTIVE, LANE_BULK)
+
+QUEUE_ENTRY_TYPE = t.Tuple[str, req.REQUEST_TYPE]
+
+# Buckets of the LDS index are kept small enough for listpack encoding.
+UUID_INDEX_BUCKETS = 4096
+UUID_LENGTH = 32
+DIGEST_LENGTH = UUID_LENGTH // 2
+
+CHANGE_STREAM_MAX_LENGTH = 10000
+CHANGE_EVENT_TYPE = t.Dict[str, t.Union[str, int]]
+
+# Journal keeps the applied requests with the config version after them.
+JOURNAL_MAX_LENGTH = 10000
+JOURNAL_READ_COUNT = 100
+JOURNAL_TYPE = t.Tuple[str, int, req.REQUEST_TYPE]
+
+# Keys written by the leader worker share one hash tag, so scripts
+# checking the fencing token can access them in Redis Cluster.
+CONF_KEY = "{conf}:envoy_conf"
+CONF_META_KEY = "{conf}:meta"
+JOURNAL_KEY = "{conf}:journal"
+LEADER_KEY = "{conf}:leader"
+FENCING_TOKEN_KEY = "{conf}:fencing_token"
+# Removal requests of the resources with TTL scored by their deadlines.
+EXPIRATIONS_KEY = "{conf}:expirations"
+
+ACQUIRE_LEADER_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return redis.call('INCR', KEYS[2])
+end
+return false
+"""
+
+RENEW_LEADER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEADER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Deadlines of the applied requests are saved with the config, ARGV[5] is
+# the number of the removed ones followed by them and the added pairs.
+SAVE_CONF_SCRIPT = """
+if ARGV[1] ~= '' and redis.call('GET', KEYS[3]) ~= ARGV[1] then
+    return redis.error_reply('FENCED')
+end
+redis.call('SET', KEYS[1], ARGV[2])
+redis.call('HSET', KEYS[2], 'version', ARGV[3], 'digest', ARGV[4])
+local removed = tonumber(ARGV[5])
+for i = 6, 5 + removed do
+    redis.call('ZREM', KEYS[4], ARGV[i])
+end
+for i = 6 + removed, #ARGV, 2 do
+    redis.call('ZADD', KEYS[4], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+ADD_JOURNAL_SCRIPT = """
+if ARGV[1] ~= '' and redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return redis.error_reply('FENCED')
+end
+for i = 3, #ARGV, 3 do
+    redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*',
+               'operation_id', ARGV[i],
+               'version', ARGV[i + 1],
+               'request', ARGV[i + 2])
+end
+return 1
+"""
+
+# Refills the bucket of a client by the elapsed time and takes a token,
+# returns seconds to wait for the next token when the bucket is empty.
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens),
+           'updated_at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(wait)
+"""
+
+
+def to_operation_id(stream_id: str, lane: str) -> str:
+    # Streams of the lanes number their messages independently, so the lane
+    # is appended to keep operation IDs unique. The interactive lane uses
+    # the former request stream and its IDs as they are.
+    if lane == LANE_INTERACTIVE:
+        return stream_id
+    return "{}-{}".format(stream_id, LANES.index(lane))
+
+
+def from_operation_id(operation_id: str) -> t.Tuple[str, str]:
+    millisecond, sequence, *lane_index = operation_id.split("-")
+    stream_id = millisecond + "-" + sequence
+    if not lane_index:
+        return stream_id, LANE_INTERACTIVE
+    return stream_id, LANES[int(lane_index[0])]
+
+
+def get_conf_digest(conf: c.EnvoyConf) -> str:
+    return hashlib.sha256(conf.get_json().encode("UTF-8")).hexdigest()
+
 
 def gen_endpoint_uuid(lb_port: str, url_prefix: str) -> str:
     text = lb_port + url_prefix + "\n"
@@ -28,155 +201,989 @@ def gen_server_uuid(address: str, port: int) -> str:
     return server_uuid
 
 
-class RedisRepository:
+def uuid_to_digest(uuid: str) -> t.Optional[bytes]:
+    if len(uuid) != UUID_LENGTH:
+        return None
+
+    try:
+        return bytes.fromhex(uuid)
+    except ValueError:
+        return None
+
+
+def pack_route_idx(resource_idx: int, route_idx: int) -> int:
+    return (resource_idx << 32) | route_idx
+
+
+def unpack_route_idx(packed: int) -> t.Tuple[int, int]:
+    return packed >> 32, packed & 0xffffffff
+
+
+def pack_address_port(address: str, port: int) -> t.Union[int, str]:
+    # IPv4 address with port fits in one integer, others are kept as text.
+    try:
+        ipv4 = ipaddress.IPv4Address(address)
+    except ValueError:
+        return "{}_{}".format(address, port)
+
+    return (int(ipv4) << 16) | port
+
+
+def unpack_address_port(packed: bytes) -> t.Tuple[str, int]:
+    value: str = packed.decode("UTF-8")
+    if value.isdigit():
+        packed_int = int(value)
+        address = str(ipaddress.IPv4Address(packed_int >> 16))
+        return address, packed_int & 0xffff
+
+    address, _, port = value.rpartition("_")
+    return address, int(port)
+
+
+def target_endpoint_uuid(lb_port: t.Optional[str],
+                         url_prefix: t.Optional[str],
+                         endpoint_uuid: t.Optional[str]) -> str:
+    if endpoint_uuid:
+        return endpoint_uuid
+    if lb_port and url_prefix:
+        return gen_endpoint_uuid(lb_port, url_prefix)
+    return ""
+
+
+def target_server_uuid(address: t.Optional[str],
+                       port: t.Optional[int],
+                       server_uuid: t.Optional[str]) -> str:
+    if server_uuid:
+        return server_uuid
+    if address and port:
+        return gen_server_uuid(address, port)
+    return ""
+
+
+def _hash_tag(digest: bytes) -> bytes:
+    # Keys of an endpoint share the hash tag of its index bucket,
+    # so they are stored in the same slot of Redis Cluster.
+    bucket: int = int.from_bytes(digest[:4], "big") % UUID_INDEX_BUCKETS
+    return b"{" + "{:03x}".format(bucket).encode("UTF-8") + b"}"
+
+
+def _lds_bucket_key(digest: bytes) -> bytes:
+    return b"l:" + _hash_tag(digest)
+
+
+def _servers_key(endpoint_digest: bytes) -> bytes:
+    return b"s:" + _hash_tag(endpoint_digest) + endpoint_digest
+
+
+def _server_endpoints_key(server_digest: bytes) -> bytes:
+    return b"e:" + _hash_tag(server_digest) + server_digest
+
+
+def scan_keys(client: redis.Redis,
+              cluster: bool,
+              match: t.Optional[str] = None,
+              count: int = 1000) -> t.Iterator[bytes]:
+    # SCAN of Redis Cluster returns one page of each primary, so every
+    # primary is scanned with its own cursor until it is exhausted.
+    if not cluster:
+        yield from client.scan_iter(match=match, count=count)
+        return
+
+    for node in client.get_primaries():
+        yield from client.get_redis_connection(node).scan_iter(match=match,
+                                                               count=count)
+
+
+class LeadershipLost(Exception):
     def __init__(self) -> None:
+        error = "Leadership of the worker was lost"
+        super().__init__(error)
+
+
+class UnknownRepositoryBackend(Exception):
+    def __init__(self, backend: str) -> None:
+        error = "Unknown repository backend '" + backend + "'"
+        super().__init__(error)
+
+
+class Repository(abc.ABC):
+    @abc.abstractmethod
+    def flushall(self) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def add_queue(self,
+                  request_json: str,
+                  lane: str = LANE_INTERACTIVE) -> str:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_queue(
+            self,
+            count: int = 1,
+            block: t.Optional[int] = None
+    ) -> t.Dict[str, t.List[QUEUE_ENTRY_TYPE]]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def ack_queue(self, operation_ids: t.List[str]) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_queue_stats(self) -> t.Tuple[int, float]:
+        # Number of queued requests and age of the oldest one in seconds.
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def take_token(self, client_id: str, rate: float, burst: int) -> float:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def save_operation_result(self,
+                              operation_id: str,
+                              status: str,
+                              conf: c.EnvoyConf,
+                              error: t.Optional[str] = None,
+                              results: t.Optional[
+                                  t.List[c.RESULT_TYPE]] = None,
+                              timings: t.Optional[TIMINGS_TYPE] = None
+                              ) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def update_operation(self,
+                         operation_id: str,
+                         fields: t.Dict[str, t.Union[str, float]]) -> None:
+        # Fields are merged into the recorded operation.
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_operation(self, operation_id: str) -> t.Optional[OPERATION_TYPE]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def listen_operations(self) -> t.Iterator[str]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def add_changes(self, events: t.List[CHANGE_EVENT_TYPE]) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_changes(
+            self,
+            last_change_id: str,
+            block: t.Optional[int] = None
+    ) -> t.List[t.Tuple[str, CHANGE_EVENT_TYPE]]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_first_change_id(self) -> t.Optional[str]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_last_change_id(self) -> t.Optional[str]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def save_conf(self,
+                  conf: c.EnvoyConf,
+                  added: t.Optional[t.Dict[str, float]] = None,
+                  removed: t.Optional[t.List[str]] = None) -> None:
+        """Saves the config and the changes of the expirations at once."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def load_conf(self) -> c.EnvoyConf:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_conf_version(self) -> t.Optional[int]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_conf_meta(self) -> t.Optional[t.Tuple[int, str]]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def add_journal(self, entries: t.List[JOURNAL_TYPE]) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_journal(self, after_version: int) -> t.List[JOURNAL_TYPE]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_expirations(self) -> t.Dict[str, float]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def update_expirations(self,
+                           added: t.Dict[str, float],
+                           removed: t.List[str]) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def acquire_leader(self, worker_id: str, lease_milliseconds: int) -> bool:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def renew_leader(self, worker_id: str, lease_milliseconds: int) -> bool:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def release_leader(self, worker_id: str) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def check_leader(self) -> None:
+        # Raises LeadershipLost when the lease was taken by another worker.
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_endpoint_index(
+            self,
+            lb_port: t.Optional[str],
+            url_prefix: t.Optional[str],
+            endpoint_uuid: t.Optional[str]) -> t.Optional[t.Tuple[int]]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def setup_lds_uuid_db(self, conf: c.EnvoyConf):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_server_info(
+            self,
+            endpoint_uuid: str,
+            address: t.Optional[str],
+            port: t.Optional[int],
+            server_uuid: t.Optional[str]) -> t.Optional[t.Tuple[str, int]]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_server_endpoints(self, address: str, port: int) -> t.List[str]:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def setup_eds_uuid_db(self, conf: c.EnvoyConf):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def update_eds_uuid_db(self,
+                           conf: c.EnvoyConf,
+                           endpoint_uuids: t.Set[str]) -> None:
+        raise NotImplementedError()
+
+
+class RedisRepository(Repository):
+    def __init__(self,
+                 host: str = REDIS_SERVER,
+                 port: int = REDIS_PORT) -> None:
         self._stream_db = 0
         self._envoy_conf_db = 1
         self._lds_uuid_db = 2
         self._eds_uuid_db = 3
+        self._operation_db = 4
 
-        self._streams = redis.Redis(host=REDIS_SERVER,
-                                    port=REDIS_PORT,
-                                    db=self._stream_db)
         self._stream_name = 'request_stream'
+        # Streams of the lanes share the hash tag of the request stream,
+        # so one XREAD can wait for all of them in Redis Cluster.
+        self._lane_stream_names: t.Dict[str, str] = {
+            LANE_EMERGENCY: '{request_stream}:emergency',
+            LANE_INTERACTIVE: self._stream_name,
+            LANE_BULK: '{request_stream}:bulk'
+        }
+        self._change_stream_name = 'change_stream'
+        self._conf_codec: cc.Codec = cc.get_codec(CONF_CODEC)
+
+        # Token of the lease held by this worker, given to the writes
+        # of the config to reject them after the lease is lost.
+        self._fencing_token = ""
+        # Buckets of the LDS index last written, read again when unknown.
+        self._lds_buckets: t.Optional[
+            t.Dict[bytes, t.Dict[bytes, int]]] = None
+
+        self._cluster = REDIS_MODE == REDIS_MODE_CLUSTER
+        if self._cluster:
+            # Redis Cluster has only one database, so every kind of keys
+            # shares it with the distinct prefixes.
+            client = rc.RedisCluster(host=host, port=port)
+            self._streams = client
+            self._conf = client
+            self._lds_uuid = client
+            self._eds_uuid = client
+            self._operations = client
+        else:
+            self._streams = redis.Redis(host=host,
+                                        port=port,
+                                        db=self._stream_db)
+
+            self._conf = redis.Redis(host=host,
+                                     port=port,
+                                     db=self._envoy_conf_db)
+
+            self._lds_uuid = redis.Redis(host=host,
+                                         port=port,
+                                         db=self._lds_uuid_db)
+
+            self._eds_uuid = redis.Redis(host=host,
+                                         port=port,
+                                         db=self._eds_uuid_db)
 
-        self._conf = redis.Redis(host=REDIS_SERVER,
-                                 port=REDIS_PORT,
-                                 db=self._envoy_conf_db)
+            self._operations = redis.Redis(host=host,
+                                           port=port,
+                                           db=self._operation_db)
 
-        self._lds_uuid = redis.Redis(host=REDIS_SERVER,
-                                     port=REDIS_PORT,
-                                     db=self._lds_uuid_db)
+        self._acquire_leader = self._conf.register_script(
+            ACQUIRE_LEADER_SCRIPT)
+        self._renew_leader = self._conf.register_script(RENEW_LEADER_SCRIPT)
+        self._release_leader = self._conf.register_script(
+            RELEASE_LEADER_SCRIPT)
+        self._save_conf = self._conf.register_script(SAVE_CONF_SCRIPT)
+        self._add_journal = self._conf.register_script(ADD_JOURNAL_SCRIPT)
+        self._take_token = self._operations.register_script(
+            TAKE_TOKEN_SCRIPT)
 
-        self._eds_uuid = redis.Redis(host=REDIS_SERVER,
-                                     port=REDIS_PORT,
-                                     db=self._eds_uuid_db)
+    def _pipeline(self, client: redis.Redis, transaction: bool = True):
+        # Transaction of Redis Cluster is limited to keys in one slot,
+        # commands are sent without MULTI and grouped by the node.
+        return client.pipeline(transaction=transaction and not self._cluster)
+
+    def _flush(self, client: redis.Redis, patterns: t.List[str]) -> None:
+        if not self._cluster:
+            client.flushdb()
+            return
+
+        for pattern in patterns:
+            pipe = self._pipeline(client, transaction=False)
+            for key in scan_keys(client, self._cluster, match=pattern):
+                pipe.delete(key)
+            pipe.execute()
 
     def flushall(self) -> None:
-        self._streams.flushdb()
-        self._conf.flushdb()
-        self._lds_uuid.flushdb()
-        self._eds_uuid.flushdb()
+        # Request stream is kept, queued requests survive the restart.
+        self._streams.delete(self._change_stream_name)
+        pipe = self._pipeline(self._conf, transaction=False)
+        for key in (CONF_KEY, CONF_META_KEY, JOURNAL_KEY):
+            pipe.delete(key)
+        pipe.execute()
+        self._flush(self._lds_uuid, ["l:*"])
+        self._flush(self._eds_uuid, ["s:*", "e:*"])
+        self._lds_buckets = {}
 
-    def add_queue(self, request_json: str) -> None:
+    def add_queue(self,
+                  request_json: str,
+                  lane: str = LANE_INTERACTIVE) -> str:
         request = {"request": request_json}
-        self._streams.xadd(self._stream_name, request)
+        message_id: bytes = \
+            self._streams.xadd(self._lane_stream_names[lane], request)
+        operation_id = to_operation_id(message_id.decode("UTF-8"), lane)
+
+        # The worker may already have recorded the result of this operation,
+        # so the pending status must not overwrite it.
+        key = self._operation_key(operation_id)
+        pipe = self._pipeline(self._operations, transaction=False)
+        pipe.hsetnx(key, "status", OPERATION_PENDING)
+        pipe.hsetnx(key, "queued_at", time.time())
+        pipe.expire(key, OPERATION_EXPIRE_SECONDS)
+        pipe.execute()
+        return operation_id
+
+    def get_queue(
+            self,
+            count: int = 1,
+            block: t.Optional[int] = None
+    ) -> t.Dict[str, t.List[QUEUE_ENTRY_TYPE]]:
+        # Requests are left in the streams until they are acknowledged.
+        lanes: t.Dict[bytes, str] = {
+            stream_name.encode("UTF-8"): lane
+            for lane, stream_name in self._lane_stream_names.items()
+        }
+        gotten_messages = self._streams.xread(
+            {stream_name: b"0" for stream_name in lanes},
+            count=count,
+            block=block or 0)
+
+        requests: t.Dict[str, t.List[QUEUE_ENTRY_TYPE]] = {}
+        for stream_name, messages in gotten_messages or []:
+            lane = lanes[stream_name]
+            for message_id, message in messages:
+                request_json: str = \
+                    message["request".encode("UTF-8")].decode("UTF-8")
+                operation_id = to_operation_id(message_id.decode("UTF-8"),
+                                               lane)
+                requests.setdefault(lane, []).append(
+                    (operation_id, json.loads(request_json)))
+        return requests
+
+    def ack_queue(self, operation_ids: t.List[str]) -> None:
+        self.check_leader()
+        message_ids: t.Dict[str, t.List[str]] = {}
+        for operation_id in operation_ids:
+            stream_id, lane = from_operation_id(operation_id)
+            message_ids.setdefault(lane, []).append(stream_id)
+
+        pipe = self._pipeline(self._streams, transaction=False)
+        for lane, stream_ids in message_ids.items():
+            pipe.xdel(self._lane_stream_names[lane], *stream_ids)
+        pipe.execute()
+
+    def get_queue_stats(self) -> t.Tuple[int, float]:
+        stream_names = list(self._lane_stream_names.values())
+        pipe = self._pipeline(self._streams, transaction=False)
+        for stream_name in stream_names:
+            pipe.xlen(stream_name)
+        for stream_name in stream_names:
+            pipe.xrange(stream_name, count=1)
+        # Stream IDs are taken by the clock of Redis, so is the age.
+        # Commands without keys are not pipelined in Redis Cluster.
+        if not self._cluster:
+            pipe.time()
+        replies = pipe.execute()
+        if self._cluster:
+            seconds, microseconds = self._streams.time()
+        else:
+            seconds, microseconds = replies.pop()
+        now = seconds + microseconds / 1000000
+
+        depth: int = sum(replies[:len(stream_names)])
+        oldest: t.Optional[int] = None
+        for messages in replies[len(stream_names):]:
+            if messages:
+                # Stream IDs begin with the milliseconds when added.
+                millisecond = int(messages[0][0].split(b"-")[0])
+                if oldest is None or millisecond < oldest:
+                    oldest = millisecond
+
+        if oldest is None:
+            return depth, 0.0
+        return depth, max(0.0, now - oldest / 1000)
+
+    def take_token(self, client_id: str, rate: float, burst: int) -> float:
+        wait: bytes = self._take_token(keys=["rate_limit:" + client_id],
+                                       args=[rate, burst])
+        return float(wait)
+
+    @staticmethod
+    def _operation_key(operation_id: str) -> str:
+        return "operation:" + operation_id
+
+    def save_operation_result(self,
+                              operation_id: str,
+                              status: str,
+                              conf: c.EnvoyConf,
+                              error: t.Optional[str] = None,
+                              results: t.Optional[
+                                  t.List[c.RESULT_TYPE]] = None,
+                              timings: t.Optional[TIMINGS_TYPE] = None
+                              ) -> None:
+        operation: OPERATION_TYPE = {
+            "status": status,
+            "lds_version": conf.lds.version_info,
+            "cds_version": conf.cds.version_info,
+            "eds_version": conf.eds.version_info,
+            "conf_version": str(conf.version)
+        }
+        if error is not None:
+            operation["error"] = error
+        if results is not None:
+            operation["results"] = json.dumps(results)
+        if timings is not None:
+            operation.update(timings)
+
+        key = self._operation_key(operation_id)
+        pipe = self._pipeline(self._operations)
+        pipe.hset(key, mapping=operation)
+        pipe.expire(key, OPERATION_EXPIRE_SECONDS)
+        pipe.publish(OPERATION_CHANNEL, operation_id)
+        pipe.execute()
+
+    def update_operation(self,
+                         operation_id: str,
+                         fields: t.Dict[str, t.Union[str, float]]) -> None:
+        key = self._operation_key(operation_id)
+        pipe = self._pipeline(self._operations)
+        pipe.hset(key, mapping=fields)
+        pipe.expire(key, OPERATION_EXPIRE_SECONDS)
+        pipe.execute()
+
+    def get_operation(self, operation_id: str) -> t.Optional[OPERATION_TYPE]:
+        got_operation: t.Dict[bytes, bytes] = \
+            self._operations.hgetall(self._operation_key(operation_id))
+        if not got_operation:
+            return None
+
+        operation: OPERATION_TYPE = {"operation_id": operation_id}
+        for field, value in got_operation.items():
+            operation[field.decode("UTF-8")] = value.decode("UTF-8")
+
+        if "results" in operation:
+            operation["results"] = json.loads(operation["results"])
+        return operation
+
+    def listen_operations(self) -> t.Iterator[str]:
+        pubsub = self._operations.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(OPERATION_CHANNEL)
+        for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            yield message["data"].decode("UTF-8")
 
-    def get_queue(self) -> req.REQUEST_TYPE:
-        gotten_messages = self._streams.xread({self._stream_name: b"0"},
-                                              count=None,
-                                              block=0)
-        queue_val_list = gotten_messages[0][1]
+    def add_changes(self, events: t.List[CHANGE_EVENT_TYPE]) -> None:
+        pipe = self._pipeline(self._streams)
+        for event in events:
+            pipe.xadd(self._change_stream_name,
+                      {"event": json.dumps(event)},
+                      maxlen=CHANGE_STREAM_MAX_LENGTH,
+                      approximate=True)
+        pipe.execute()
 
-        message_id: str = queue_val_list[0][0]
-        self._streams.xdel(self._stream_name, message_id)
+    def get_changes(
+            self,
+            last_change_id: str,
+            block: t.Optional[int] = None
+    ) -> t.List[t.Tuple[str, CHANGE_EVENT_TYPE]]:
+        gotten_messages = \
+            self._streams.xread({self._change_stream_name: last_change_id},
+                                count=None,
+                                block=block)
+        if not gotten_messages:
+            return []
+
+        changes = []
+        for message_id, message in gotten_messages[0][1]:
+            event: CHANGE_EVENT_TYPE = \
+                json.loads(message["event".encode("UTF-8")].decode("UTF-8"))
+            changes.append((message_id.decode("UTF-8"), event))
+        return changes
+
+    def get_first_change_id(self) -> t.Optional[str]:
+        messages = self._streams.xrange(self._change_stream_name, count=1)
+        if not messages:
+            return None
+        return messages[0][0].decode("UTF-8")
+
+    def get_last_change_id(self) -> t.Optional[str]:
+        messages = self._streams.xrevrange(self._change_stream_name, count=1)
+        if not messages:
+            return None
+        return messages[0][0].decode("UTF-8")
+
+    def _run_fenced(self, script, keys: t.List[str], args: t.List) -> None:
+        try:
+            script(keys=keys, args=[self._fencing_token] + args)
+        except redis.ResponseError as e:
+            if "FENCED" in str(e):
+                raise LeadershipLost() from e
+            raise
 
-        request_json: str = \
-            queue_val_list[0][1]["request".encode("UTF-8")].decode("UTF-8")
-        return json.loads(request_json)
+    def save_conf(self,
+                  conf: c.EnvoyConf,
+                  added: t.Optional[t.Dict[str, float]] = None,
+                  removed: t.Optional[t.List[str]] = None) -> None:
+        conf_json: bytes = conf.get_json().encode("UTF-8")
+        args: t.List[t.Union[bytes, str, int, float]] = [
+            cc.encode(self._conf_codec, conf_json),
+            conf.version,
+            get_conf_digest(conf),
+            len(removed or [])]
+        args.extend(removed or [])
+        for removal, expires_at in (added or {}).items():
+            args.extend([expires_at, removal])
 
-    def save_conf(self, conf: c.EnvoyConf) -> None:
-        self._conf.set("envoy_conf", conf.get_json())
+        self._run_fenced(self._save_conf,
+                         [CONF_KEY, CONF_META_KEY, FENCING_TOKEN_KEY,
+                          EXPIRATIONS_KEY],
+                         args)
 
     def load_conf(self) -> c.EnvoyConf:
-        conf_dict: c.ENVOY_CONF_TYPE = \
-            json.loads(self._conf.get("envoy_conf").decode("UTF-8"))
+        conf_json: bytes = cc.decode(self._conf.get(CONF_KEY))
+        conf_dict: c.ENVOY_CONF_TYPE = json.loads(conf_json.decode("UTF-8"))
 
         conf = c.EnvoyConf()
         conf.load_from_db(conf_dict)
         return conf
 
-    def _save_lds_uuid(self,
-                       endpoint_uuid: str,
-                       resource_route_idx: str) -> None:
-        self._lds_uuid.set(endpoint_uuid, resource_route_idx)
+    def get_conf_version(self) -> t.Optional[int]:
+        version: t.Optional[bytes] = self._conf.hget(CONF_META_KEY, "version")
+        if version is None:
+            return None
+        return int(version)
+
+    def get_conf_meta(self) -> t.Optional[t.Tuple[int, str]]:
+        meta: t.Dict[bytes, bytes] = self._conf.hgetall(CONF_META_KEY)
+        if not meta:
+            return None
+        return int(meta[b"version"]), meta[b"digest"].decode("UTF-8")
+
+    def add_journal(self, entries: t.List[JOURNAL_TYPE]) -> None:
+        args: t.List[t.Union[str, int]] = [JOURNAL_MAX_LENGTH]
+        for operation_id, version, request in entries:
+            args.extend([operation_id, version, json.dumps(request)])
+
+        self._run_fenced(self._add_journal,
+                         [JOURNAL_KEY, FENCING_TOKEN_KEY],
+                         args)
+
+    def get_journal(self, after_version: int) -> t.List[JOURNAL_TYPE]:
+        # Entries are read from the newest one back to the given version.
+        # The first read gets only the newest one, which is enough for
+        # a standby polling the journal with no new entry.
+        entries: t.List[JOURNAL_TYPE] = []
+        max_id: t.Union[str, bytes] = "+"
+        count = 1
+        while True:
+            messages = self._conf.xrevrange(JOURNAL_KEY,
+                                            max=max_id,
+                                            count=count)
+            for message_id, message in messages:
+                if message_id == max_id:
+                    continue
 
-    def set_lds_uuid_removed(self, endpoint_uuid: str) -> None:
-        self._lds_uuid.delete(endpoint_uuid)
+                version = int(message[b"version"])
+                if version <= after_version:
+                    return list(reversed(entries))
+
+                entries.append((message[b"operation_id"].decode("UTF-8"),
+                                version,
+                                json.loads(message[b"request"])))
+
+            if len(messages) < count:
+                return list(reversed(entries))
+            max_id = messages[-1][0]
+            count = JOURNAL_READ_COUNT
+
+    def get_expirations(self) -> t.Dict[str, float]:
+        return {member.decode("UTF-8"): score
+                for member, score
+                in self._conf.zrange(EXPIRATIONS_KEY, 0, -1, withscores=True)}
+
+    def update_expirations(self,
+                           added: t.Dict[str, float],
+                           removed: t.List[str]) -> None:
+        pipe = self._pipeline(self._conf)
+        if removed:
+            pipe.zrem(EXPIRATIONS_KEY, *removed)
+        if added:
+            pipe.zadd(EXPIRATIONS_KEY, added)
+        pipe.execute()
+
+    def acquire_leader(self, worker_id: str, lease_milliseconds: int) -> bool:
+        token: t.Optional[int] = self._acquire_leader(
+            keys=[LEADER_KEY, FENCING_TOKEN_KEY],
+            args=[worker_id, lease_milliseconds])
+        if token is None:
+            return False
+
+        self._fencing_token = str(token)
+        # Another leader may have written the index since.
+        self._lds_buckets = None
+        return True
+
+    def renew_leader(self, worker_id: str, lease_milliseconds: int) -> bool:
+        return bool(self._renew_leader(keys=[LEADER_KEY],
+                                       args=[worker_id, lease_milliseconds]))
+
+    def release_leader(self, worker_id: str) -> None:
+        self._release_leader(keys=[LEADER_KEY], args=[worker_id])
+        self._fencing_token = ""
+
+    def check_leader(self) -> None:
+        # Indexes and queue are in other databases or slots than the token,
+        # so their writes are checked by the token before instead of fenced.
+        if not self._fencing_token:
+            return
+
+        token: t.Optional[bytes] = self._conf.get(FENCING_TOKEN_KEY)
+        if token is None or token.decode("UTF-8") != self._fencing_token:
+            raise LeadershipLost()
 
     def get_endpoint_index(
             self,
             lb_port: t.Optional[str],
             url_prefix: t.Optional[str],
             endpoint_uuid: t.Optional[str]) -> t.Optional[t.Tuple[int]]:
-        target_endpoint_uuid = ""
-
-        if not endpoint_uuid:
-            if lb_port and url_prefix:
-                target_endpoint_uuid = gen_endpoint_uuid(lb_port,
-                                                         url_prefix)
-        else:
-            target_endpoint_uuid = endpoint_uuid
-
-        if not target_endpoint_uuid:
+        digest: t.Optional[bytes] = uuid_to_digest(
+            target_endpoint_uuid(lb_port, url_prefix, endpoint_uuid))
+        if digest is None:
             return None
 
-        got_idx: t.Union[bytes] = self._lds_uuid.get(target_endpoint_uuid)
+        got_idx: t.Optional[bytes] = \
+            self._lds_uuid.hget(_lds_bucket_key(digest), digest)
         if got_idx is None:
             return None
 
-        resource_route_idx: str = got_idx.decode("UTF-8")
-        resource_route_idx_list: t.List[str] = resource_route_idx.split("_")
-        endpoint_idx: int = int(resource_route_idx_list[0])
-        route_idx: int = int(resource_route_idx_list[1])
-        return endpoint_idx, route_idx
+        return unpack_route_idx(int(got_idx))
+
+    def _read_lds_buckets(self) -> t.Dict[bytes, t.Dict[bytes, int]]:
+        keys: t.List[bytes] = list(
+            scan_keys(self._lds_uuid, self._cluster, match="l:*"))
+        pipe = self._pipeline(self._lds_uuid, transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        return {key: {digest: int(idx) for digest, idx in mapping.items()}
+                for key, mapping in zip(keys, pipe.execute())}
 
     def setup_lds_uuid_db(self, conf: c.EnvoyConf):
-        self._lds_uuid.flushdb()
+        # Only the entries which moved are written, so readers never see
+        # the index emptied while it is rebuilt.
+        self.check_leader()
+        indexed: t.Dict[bytes, t.Dict[bytes, int]] = \
+            self._lds_buckets if self._lds_buckets is not None \
+            else self._read_lds_buckets()
 
+        buckets: t.Dict[bytes, t.Dict[bytes, int]] = {}
         for ridx, lds_res in enumerate(conf.lds.resources):
             lb_port: str = lds_res.port
             for tidx, route in enumerate(lds_res.routes):
                 url_prefix: str = route.prefix
 
                 endpoint_uuid: str = gen_endpoint_uuid(lb_port,  url_prefix)
-                resource_route_idx: str = "{}_{}".format(ridx, tidx)
-                self._save_lds_uuid(endpoint_uuid, resource_route_idx)
-
-    def _save_eds_uuid(self,
-                       server_uuid: str,
-                       address_port: str) -> None:
-        self._eds_uuid.set(server_uuid, address_port)
+                digest: bytes = bytes.fromhex(endpoint_uuid)
+                buckets.setdefault(_lds_bucket_key(digest), {})[digest] = \
+                    pack_route_idx(ridx, tidx)
 
-    def set_eds_uuid_removed(self, server_uuid: str) -> None:
-        self._eds_uuid.delete(server_uuid)
+        pipe = self._pipeline(self._lds_uuid, transaction=False)
+        for key in buckets.keys() | indexed.keys():
+            mapping = buckets.get(key, {})
+            old_mapping = indexed.get(key, {})
+            removed = old_mapping.keys() - mapping.keys()
+            if removed:
+                pipe.hdel(key, *removed)
+            moved = {digest: idx for digest, idx in mapping.items()
+                     if old_mapping.get(digest) != idx}
+            if moved:
+                pipe.hset(key, mapping=moved)
+        # Read again after a failed write.
+        self._lds_buckets = None
+        pipe.execute()
+        self._lds_buckets = buckets
 
     def get_server_info(
             self,
+            endpoint_uuid: str,
             address: t.Optional[str],
             port: t.Optional[int],
-            server_uuid: t.Optional[str]) -> t.Optional[t.Tuple[int]]:
-        target_server_uuid = ""
-
-        if not server_uuid:
-            if address and port:
-                target_server_uuid = gen_server_uuid(address, port)
-        else:
-            target_server_uuid = server_uuid
-
-        if not target_server_uuid:
+            server_uuid: t.Optional[str]) -> t.Optional[t.Tuple[str, int]]:
+        endpoint_digest: t.Optional[bytes] = uuid_to_digest(endpoint_uuid)
+        server_digest: t.Optional[bytes] = uuid_to_digest(
+            target_server_uuid(address, port, server_uuid))
+        if endpoint_digest is None or server_digest is None:
             return None
 
-        got_address_port: t.Union[bytes] = \
-            self._eds_uuid.get(target_server_uuid)
+        got_address_port: t.Optional[bytes] = \
+            self._eds_uuid.hget(_servers_key(endpoint_digest), server_digest)
         if got_address_port is None:
             return None
 
-        resource_endpoint_idx: str = got_address_port.decode("UTF-8")
-        resource_endpoint_idx_list: t.List[str] = \
-            resource_endpoint_idx.split("_")
-        resource_idx: int = int(resource_endpoint_idx_list[0])
-        endpoint_idx: int = int(resource_endpoint_idx_list[1])
-        return resource_idx, endpoint_idx
+        return unpack_address_port(got_address_port)
+
+    def get_server_endpoints(self, address: str, port: int) -> t.List[str]:
+        server_digest: bytes = bytes.fromhex(gen_server_uuid(address, port))
+        endpoint_digests: t.Set[bytes] = \
+            self._eds_uuid.smembers(_server_endpoints_key(server_digest))
+        return sorted(digest.hex() for digest in endpoint_digests)
+
+    @staticmethod
+    def _get_servers(
+            eds_res: ed_r.Resource) -> t.Dict[bytes, t.Union[int, str]]:
+        servers: t.Dict[bytes, t.Union[int, str]] = {}
+        for endpoint in eds_res.endpoints:
+            address: str = endpoint.address
+            port: int = endpoint.port_value
+
+            server_digest = bytes.fromhex(gen_server_uuid(address, port))
+            servers[server_digest] = pack_address_port(address, port)
+        return servers
 
     def setup_eds_uuid_db(self, conf: c.EnvoyConf):
-        self._eds_uuid.flushdb()
+        # Only the entries which changed are written, so readers never see
+        # the index emptied while it is rebuilt.
+        endpoint_uuids: t.Set[str] = {
+            key[-DIGEST_LENGTH:].hex()
+            for key in scan_keys(self._eds_uuid, self._cluster, match="s:*")}
+        endpoint_uuids.update(eds_res.cluster_name
+                              for eds_res in conf.eds.resources)
+        self.update_eds_uuid_db(conf, endpoint_uuids)
+
+        # Reverse index is compared as a whole, as an update stopped on
+        # the way may have left it apart from the servers of endpoints.
+        reverse: t.Dict[bytes, t.Set[bytes]] = {}
+        for eds_res in conf.eds.resources:
+            endpoint_digest = bytes.fromhex(eds_res.cluster_name)
+            for server_digest in self._get_servers(eds_res):
+                reverse.setdefault(_server_endpoints_key(server_digest),
+                                   set()).add(endpoint_digest)
+
+        keys: t.List[bytes] = list(
+            scan_keys(self._eds_uuid, self._cluster, match="e:*"))
+        pipe = self._pipeline(self._eds_uuid, transaction=False)
+        for key in keys:
+            pipe.smembers(key)
+        indexed: t.Dict[bytes, t.Set[bytes]] = dict(zip(keys, pipe.execute()))
+
+        for key in reverse.keys() | indexed.keys():
+            endpoint_digests = reverse.get(key, set())
+            old_endpoint_digests = indexed.get(key, set())
+            removed = old_endpoint_digests - endpoint_digests
+            if removed:
+                pipe.srem(key, *removed)
+            added = endpoint_digests - old_endpoint_digests
+            if added:
+                pipe.sadd(key, *added)
+        pipe.execute()
+
+    def update_eds_uuid_db(self,
+                           conf: c.EnvoyConf,
+                           endpoint_uuids: t.Set[str]) -> None:
+        target_uuids: t.List[str] = sorted(set(endpoint_uuids))
+        if not target_uuids:
+            return
+
+        self.check_leader()
+
+        current_servers: t.Dict[str, t.Dict[bytes, t.Union[int, str]]] = {}
+        for eds_res in conf.eds.resources:
+            if eds_res.cluster_name in endpoint_uuids:
+                current_servers[eds_res.cluster_name] = \
+                    self._get_servers(eds_res)
+
+        pipe = self._pipeline(self._eds_uuid, transaction=False)
+        for endpoint_uuid in target_uuids:
+            pipe.hkeys(_servers_key(bytes.fromhex(endpoint_uuid)))
+        indexed_servers: t.List[t.List[bytes]] = pipe.execute()
+
+        for endpoint_uuid, indexed in zip(target_uuids, indexed_servers):
+            servers: t.Dict[bytes, t.Union[int, str]] = \
+                current_servers.get(endpoint_uuid, {})
+            old_server_digests: t.Set[bytes] = set(indexed)
+
+            endpoint_digest = bytes.fromhex(endpoint_uuid)
+            key = _servers_key(endpoint_digest)
+            removed = old_server_digests - servers.keys()
+            if removed:
+                pipe.hdel(key, *removed)
+            # A server digest is taken from its address and port,
+            # so the indexed ones are already up to date.
+            added = servers.keys() - old_server_digests
+            if added:
+                pipe.hset(key, mapping={server_digest: servers[server_digest]
+                                        for server_digest in added})
+
+            for server_digest in removed:
+                pipe.srem(_server_endpoints_key(server_digest),
+                          endpoint_digest)
+            for server_digest in added:
+                pipe.sadd(_server_endpoints_key(server_digest),
+                          endpoint_digest)
+        pipe.execute()
+
+    def migrate_uuid_db(self) -> t.Tuple[int, int]:
+        # Convert indexes written in the former layout, one string key
+        # per route and hex UUIDs in per-cluster hashes and sets.
+        lds_migrated = 0
+        for key in scan_keys(self._lds_uuid, self._cluster):
+            if len(key) != UUID_LENGTH:
+                continue
+
+            digest = uuid_to_digest(key.decode("UTF-8"))
+            value: t.Optional[bytes] = self._lds_uuid.get(key)
+            if digest is None or value is None:
+                continue
+
+            ridx, tidx = value.decode("UTF-8").split("_")
+            pipe = self._pipeline(self._lds_uuid)
+            pipe.hset(_lds_bucket_key(digest),
+                      digest,
+                      pack_route_idx(int(ridx), int(tidx)))
+            pipe.delete(key)
+            pipe.execute()
+            lds_migrated += 1
+
+        eds_migrated = 0
+        for key in scan_keys(self._eds_uuid, self._cluster,
+                             match="servers:*"):
+            endpoint_digest = uuid_to_digest(
+                key.decode("UTF-8")[len("servers:"):])
+            if endpoint_digest is None:
+                continue
+
+            servers: t.Dict[bytes, t.Union[int, str]] = {}
+            for server_uuid, address_port in \
+                    self._eds_uuid.hgetall(key).items():
+                address, _, port = address_port.decode("UTF-8") \
+                    .rpartition("_")
+                servers[bytes.fromhex(server_uuid.decode("UTF-8"))] = \
+                    pack_address_port(address, int(port))
+
+            pipe = self._pipeline(self._eds_uuid)
+            if servers:
+                pipe.hset(_servers_key(endpoint_digest), mapping=servers)
+            for server_digest in servers:
+                pipe.sadd(_server_endpoints_key(server_digest),
+                          endpoint_digest)
+            pipe.delete(key)
+            pipe.execute()
+            eds_migrated += 1
+
+        for key in scan_keys(self._eds_uuid, self._cluster,
+                             match="endpoints:*"):
+            self._eds_uuid.delete(key)
+
+        return lds_migrated, eds_migrated
+
+
+class ReadReplicas:
+    def __init__(self,
+                 primary: Repository,
+                 replicas: t.List[Repository]) -> None:
+        self._primary = primary
+        self._replicas = replicas
+        self._next = 0
+
+    def select(self,
+               min_version: int) -> t.Tuple[Repository, t.Optional[int]]:
+        # Replicas are tried in turn, and the primary serves the read
+        # when every replica lags behind the requested version.
+        for _ in range(len(self._replicas)):
+            replica = self._replicas[self._next]
+            self._next = (self._next + 1) % len(self._replicas)
+
+            try:
+                version: t.Optional[int] = replica.get_conf_version()
+            except redis.RedisError:
+                continue
+
+            if version is not None and version >= min_version:
+                return replica, version
+
+        return self._primary, self._primary.get_conf_version()
+
+
+def new_repository() -> Repository:
+    if REPOSITORY_BACKEND == REPOSITORY_BACKEND_REDIS:
+        return RedisRepository()
+
+    if REPOSITORY_BACKEND == REPOSITORY_BACKEND_SQLITE:
+        # Imported here, the SQLite backend depends on this module.
+        import database.sqlite_repository as sr
+        return sr.SqliteRepository()
+
+    raise UnknownRepositoryBackend(REPOSITORY_BACKEND)
+
+
+def new_read_replicas(primary: Repository) -> ReadReplicas:
+    replicas: t.List[Repository] = []
+    if REPOSITORY_BACKEND == REPOSITORY_BACKEND_REDIS and \
+            REDIS_MODE == REDIS_MODE_STANDALONE:
+        for replica in REDIS_REPLICAS.split(","):
+            if not replica:
+                continue
 
-        for ridx, eds_res in enumerate(conf.eds.resources):
-            for eidx, endpoint in enumerate(eds_res.endpoints):
-                address: str = endpoint.address
-                port: int = endpoint.port_value
+            host, _, port = replica.rpartition(":")
+            if not host:
+                host, port = port, str(REDIS_PORT)
+            replicas.append(RedisRepository(host, int(port)))
 
-                server_uuid: str = gen_server_uuid(address,  port)
-                resource_endpoint_idx: str = "{}_{}".format(ridx, eidx)
-                self._save_eds_uuid(server_uuid, resource_endpoint_idx)
+    return ReadReplicas(primary, replicas)
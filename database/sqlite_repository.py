@@ -0,0 +1,644 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+
+import database.codec as cc
+import database.repository as r
+import entity.conf as c
+import entity.eds.resource as ed_r
+
+try:
+    SQLITE_PATH = os.environ["SQLITE_PATH"]
+except KeyError:
+    SQLITE_PATH = "/opt/app/data/proxy-api.db"
+
+BUSY_TIMEOUT_SECONDS = 5
+
+# Commits of other connections are noticed by polling PRAGMA data_version,
+# which is read from the shared memory of WAL without any disk I/O. The
+# interval backs off from the first one to the max while nothing changes.
+POLL_INTERVAL_SECONDS = 0.01
+POLL_INTERVAL_MAX_SECONDS = 0.1
+
+OPERATION_EVENT_MAX_LENGTH = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request TEXT NOT NULL,
+    lane TEXT NOT NULL DEFAULT 'interactive'
+);
+CREATE TABLE IF NOT EXISTS operations (
+    operation_id TEXT PRIMARY KEY,
+    operation TEXT NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS operations_updated_at
+    ON operations (updated_at);
+CREATE TABLE IF NOT EXISTS operation_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    request TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS journal_version ON journal (version);
+CREATE TABLE IF NOT EXISTS expirations (
+    removal TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rate_limits (
+    client_id TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leader (
+    name TEXT PRIMARY KEY,
+    worker_id TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    fencing_token INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS envoy_conf (
+    name TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lds_uuid (
+    endpoint_uuid BLOB PRIMARY KEY,
+    route_idx INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS eds_uuid (
+    endpoint_uuid BLOB NOT NULL,
+    server_uuid BLOB NOT NULL,
+    address TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    PRIMARY KEY (endpoint_uuid, server_uuid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS eds_uuid_server
+    ON eds_uuid (server_uuid, endpoint_uuid);
+"""
+
+# Lane is added to a queue table created by former versions before indexing.
+LANE_COLUMN = "ALTER TABLE request_queue " \
+    "ADD COLUMN lane TEXT NOT NULL DEFAULT 'interactive'"
+LANE_INDEX = "CREATE INDEX IF NOT EXISTS request_queue_lane " \
+    "ON request_queue (lane, id)"
+
+
+def to_stream_id(row_id: int) -> str:
+    # IDs are formatted like Redis stream IDs to keep them comparable
+    # by the API server in the same way.
+    return "{}-0".format(row_id)
+
+
+def from_stream_id(stream_id: str) -> int:
+    return int(stream_id.split("-")[0])
+
+
+class SqliteRepository(r.Repository):
+    def __init__(self, path: str = SQLITE_PATH) -> None:
+        self._path = path
+        self._local = threading.local()
+        self._conf_codec: cc.Codec = cc.get_codec(r.CONF_CODEC)
+        self._fencing_token: t.Optional[int] = None
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db.executescript(SCHEMA)
+
+        columns = {row[1] for row
+                   in self._db.execute("PRAGMA table_info(request_queue)")}
+        if "lane" not in columns:
+            self._db.execute(LANE_COLUMN)
+        self._db.execute(LANE_INDEX)
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # sqlite3 connection can not be shared between threads.
+        db: t.Optional[sqlite3.Connection] = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self._path,
+                                 timeout=BUSY_TIMEOUT_SECONDS,
+                                 isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def _transaction(self) -> t.Iterator[sqlite3.Connection]:
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _data_version(self) -> int:
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    def _wait_commit(self,
+                     data_version: int,
+                     timeout: t.Optional[float] = None) -> bool:
+        deadline: t.Optional[float] = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        interval = POLL_INTERVAL_SECONDS
+        while self._data_version() == data_version:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            if deadline is not None:
+                interval = min(interval, deadline - now)
+            time.sleep(interval)
+            interval = min(interval * 2, POLL_INTERVAL_MAX_SECONDS)
+        return True
+
+    def _check_fencing_token(self, db: sqlite3.Connection) -> None:
+        if self._fencing_token is None:
+            return
+
+        row = db.execute("SELECT fencing_token FROM leader "
+                         "WHERE name = ?", ("worker",)).fetchone()
+        if row is None or row[0] != self._fencing_token:
+            raise r.LeadershipLost()
+
+    def flushall(self) -> None:
+        with self._transaction() as db:
+            db.execute("DELETE FROM changes")
+            db.execute("DELETE FROM journal")
+            db.execute("DELETE FROM envoy_conf")
+            db.execute("DELETE FROM lds_uuid")
+            db.execute("DELETE FROM eds_uuid")
+
+    def add_queue(self,
+                  request_json: str,
+                  lane: str = r.LANE_INTERACTIVE) -> str:
+        now = time.time()
+        pending: r.OPERATION_TYPE = {"status": r.OPERATION_PENDING,
+                                     "queued_at": now}
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT INTO request_queue (request, lane) VALUES (?, ?)",
+                (request_json, lane))
+            operation_id: str = to_stream_id(cursor.lastrowid)
+            db.execute("INSERT OR IGNORE INTO operations "
+                       "(operation_id, operation, updated_at) "
+                       "VALUES (?, ?, ?)",
+                       (operation_id, json.dumps(pending), now))
+        return operation_id
+
+    def get_queue(
+            self,
+            count: int = 1,
+            block: t.Optional[int] = None
+    ) -> t.Dict[str, t.List[r.QUEUE_ENTRY_TYPE]]:
+        # block is given in milliseconds and 0 blocks forever, as XREAD.
+        timeout: t.Optional[float] = None
+        if block:
+            timeout = block / 1000
+
+        # Row IDs are unique across the lanes, so they are used as
+        # operation IDs as they are.
+        while True:
+            data_version = self._data_version()
+            requests: t.Dict[str, t.List[r.QUEUE_ENTRY_TYPE]] = {}
+            for lane in r.LANES:
+                rows = self._db.execute("SELECT id, request "
+                                        "FROM request_queue "
+                                        "WHERE lane = ? ORDER BY id LIMIT ?",
+                                        (lane, count)).fetchall()
+                if rows:
+                    requests[lane] = [(to_stream_id(row_id),
+                                       json.loads(request_json))
+                                      for row_id, request_json in rows]
+            if requests:
+                return requests
+            if not self._wait_commit(data_version, timeout):
+                return {}
+
+    def ack_queue(self, operation_ids: t.List[str]) -> None:
+        with self._transaction() as db:
+            self._check_fencing_token(db)
+            db.executemany("DELETE FROM request_queue WHERE id = ?",
+                           [(from_stream_id(operation_id),)
+                            for operation_id in operation_ids])
+
+    def get_queue_stats(self) -> t.Tuple[int, float]:
+        # Row IDs carry no time, the oldest request is aged by its
+        # pending operation recorded at the same time.
+        depth, oldest_id = self._db.execute(
+            "SELECT COUNT(*), MIN(id) FROM request_queue").fetchone()
+        if oldest_id is None:
+            return 0, 0.0
+
+        row = self._db.execute("SELECT updated_at FROM operations "
+                               "WHERE operation_id = ?",
+                               (to_stream_id(oldest_id),)).fetchone()
+        if row is None:
+            return depth, 0.0
+        return depth, max(0.0, time.time() - row[0])
+
+    def take_token(self, client_id: str, rate: float, burst: int) -> float:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT tokens, updated_at FROM rate_limits "
+                             "WHERE client_id = ?", (client_id,)).fetchone()
+            tokens = float(burst)
+            if row is not None:
+                tokens = min(burst,
+                             row[0] + max(0.0, now - row[1]) * rate)
+
+            wait = 0.0
+            if tokens < 1:
+                wait = (1 - tokens) / rate
+            else:
+                tokens -= 1
+
+            db.execute("INSERT OR REPLACE INTO rate_limits "
+                       "(client_id, tokens, updated_at) VALUES (?, ?, ?)",
+                       (client_id, tokens, now))
+            # Buckets refilled up to the burst are the same as no bucket.
+            db.execute("DELETE FROM rate_limits WHERE updated_at < ?",
+                       (now - burst / rate,))
+        return wait
+
+    def save_operation_result(self,
+                              operation_id: str,
+                              status: str,
+                              conf: c.EnvoyConf,
+                              error: t.Optional[str] = None,
+                              results: t.Optional[
+                                  t.List[c.RESULT_TYPE]] = None,
+                              timings: t.Optional[r.TIMINGS_TYPE] = None
+                              ) -> None:
+        operation: r.OPERATION_TYPE = {
+            "status": status,
+            "lds_version": conf.lds.version_info,
+            "cds_version": conf.cds.version_info,
+            "eds_version": conf.eds.version_info,
+            "conf_version": str(conf.version)
+        }
+        if error is not None:
+            operation["error"] = error
+        if results is not None:
+            operation["results"] = results
+        if timings is not None:
+            operation.update(timings)
+
+        now = time.time()
+        with self._transaction() as db:
+            self._merge_operation(db, operation_id, operation, now)
+            db.execute("DELETE FROM operations WHERE updated_at < ?",
+                       (now - r.OPERATION_EXPIRE_SECONDS,))
+
+            cursor = db.execute(
+                "INSERT INTO operation_events (operation_id) VALUES (?)",
+                (operation_id,))
+            db.execute("DELETE FROM operation_events WHERE id <= ?",
+                       (cursor.lastrowid - OPERATION_EVENT_MAX_LENGTH,))
+
+    @staticmethod
+    def _merge_operation(db: sqlite3.Connection,
+                         operation_id: str,
+                         fields: t.Dict[str, t.Any],
+                         now: float) -> None:
+        # Fields are merged as a hash of Redis, so the time queued by
+        # the API server is kept.
+        db.execute("INSERT INTO operations "
+                   "(operation_id, operation, updated_at) "
+                   "VALUES (?, ?, ?) "
+                   "ON CONFLICT (operation_id) DO UPDATE SET "
+                   "operation = json_patch(operation, excluded.operation), "
+                   "updated_at = excluded.updated_at",
+                   (operation_id, json.dumps(fields), now))
+
+    def update_operation(self,
+                         operation_id: str,
+                         fields: t.Dict[str, t.Union[str, float]]) -> None:
+        with self._transaction() as db:
+            self._merge_operation(db, operation_id, fields, time.time())
+
+    def get_operation(self, operation_id: str) -> t.Optional[r.OPERATION_TYPE]:
+        row = self._db.execute("SELECT operation, updated_at FROM operations "
+                               "WHERE operation_id = ?",
+                               (operation_id,)).fetchone()
+        if row is None:
+            return None
+
+        operation_json, updated_at = row
+        if updated_at < time.time() - r.OPERATION_EXPIRE_SECONDS:
+            return None
+
+        operation: r.OPERATION_TYPE = {"operation_id": operation_id}
+        operation.update(json.loads(operation_json))
+        return operation
+
+    def listen_operations(self) -> t.Iterator[str]:
+        row = self._db.execute(
+            "SELECT MAX(id) FROM operation_events").fetchone()
+        last_event_id: int = row[0] or 0
+
+        while True:
+            data_version = self._data_version()
+            rows = self._db.execute("SELECT id, operation_id "
+                                    "FROM operation_events WHERE id > ? "
+                                    "ORDER BY id",
+                                    (last_event_id,)).fetchall()
+            for event_id, operation_id in rows:
+                last_event_id = event_id
+                yield operation_id
+
+            if not rows:
+                self._wait_commit(data_version)
+
+    def add_changes(self, events: t.List[r.CHANGE_EVENT_TYPE]) -> None:
+        if not events:
+            return
+
+        with self._transaction() as db:
+            cursor = None
+            for event in events:
+                cursor = db.execute("INSERT INTO changes (event) VALUES (?)",
+                                    (json.dumps(event),))
+            db.execute("DELETE FROM changes WHERE id <= ?",
+                       (cursor.lastrowid - r.CHANGE_STREAM_MAX_LENGTH,))
+
+    def get_changes(
+            self,
+            last_change_id: str,
+            block: t.Optional[int] = None
+    ) -> t.List[t.Tuple[str, r.CHANGE_EVENT_TYPE]]:
+        last_row_id: int = from_stream_id(last_change_id)
+
+        # block is given in milliseconds and 0 blocks forever, as XREAD.
+        timeout: t.Optional[float] = None
+        if block:
+            timeout = block / 1000
+
+        while True:
+            data_version = self._data_version()
+            rows = self._db.execute("SELECT id, event FROM changes "
+                                    "WHERE id > ? ORDER BY id",
+                                    (last_row_id,)).fetchall()
+            if rows or block is None:
+                break
+            if not self._wait_commit(data_version, timeout):
+                break
+
+        return [(to_stream_id(row_id), json.loads(event))
+                for row_id, event in rows]
+
+    def get_first_change_id(self) -> t.Optional[str]:
+        row = self._db.execute("SELECT MIN(id) FROM changes").fetchone()
+        if row[0] is None:
+            return None
+        return to_stream_id(row[0])
+
+    def get_last_change_id(self) -> t.Optional[str]:
+        row = self._db.execute("SELECT MAX(id) FROM changes").fetchone()
+        if row[0] is None:
+            return None
+        return to_stream_id(row[0])
+
+    def save_conf(self,
+                  conf: c.EnvoyConf,
+                  added: t.Optional[t.Dict[str, float]] = None,
+                  removed: t.Optional[t.List[str]] = None) -> None:
+        conf_json: bytes = conf.get_json().encode("UTF-8")
+        with self._transaction() as db:
+            self._check_fencing_token(db)
+            db.executemany("INSERT OR REPLACE INTO envoy_conf (name, value) "
+                           "VALUES (?, ?)",
+                           [("envoy_conf",
+                             cc.encode(self._conf_codec, conf_json)),
+                            ("conf_version", conf.version),
+                            ("conf_digest", r.get_conf_digest(conf))])
+            self._update_expirations(db, added or {}, removed or [])
+
+    def load_conf(self) -> c.EnvoyConf:
+        row = self._db.execute("SELECT value FROM envoy_conf "
+                               "WHERE name = ?", ("envoy_conf",)).fetchone()
+        conf_json: bytes = cc.decode(row[0])
+        conf_dict: c.ENVOY_CONF_TYPE = json.loads(conf_json.decode("UTF-8"))
+
+        conf = c.EnvoyConf()
+        conf.load_from_db(conf_dict)
+        return conf
+
+    def get_conf_version(self) -> t.Optional[int]:
+        row = self._db.execute("SELECT value FROM envoy_conf "
+                               "WHERE name = ?",
+                               ("conf_version",)).fetchone()
+        if row is None:
+            return None
+        return int(row[0])
+
+    def get_conf_meta(self) -> t.Optional[t.Tuple[int, str]]:
+        rows = self._db.execute("SELECT name, value FROM envoy_conf "
+                                "WHERE name IN (?, ?)",
+                                ("conf_version", "conf_digest")).fetchall()
+        meta: t.Dict[str, t.Any] = dict(rows)
+        if len(meta) != 2:
+            return None
+        return int(meta["conf_version"]), meta["conf_digest"]
+
+    def add_journal(self, entries: t.List[r.JOURNAL_TYPE]) -> None:
+        with self._transaction() as db:
+            self._check_fencing_token(db)
+            db.executemany("INSERT INTO journal "
+                           "(operation_id, version, request) "
+                           "VALUES (?, ?, ?)",
+                           [(operation_id, version, json.dumps(request))
+                            for operation_id, version, request in entries])
+            row = db.execute("SELECT MAX(id) FROM journal").fetchone()
+            db.execute("DELETE FROM journal WHERE id <= ?",
+                       ((row[0] or 0) - r.JOURNAL_MAX_LENGTH,))
+
+    def get_journal(self, after_version: int) -> t.List[r.JOURNAL_TYPE]:
+        rows = self._db.execute("SELECT operation_id, version, request "
+                                "FROM journal WHERE version > ? ORDER BY id",
+                                (after_version,)).fetchall()
+        return [(operation_id, version, json.loads(request))
+                for operation_id, version, request in rows]
+
+    def get_expirations(self) -> t.Dict[str, float]:
+        rows = self._db.execute("SELECT removal, expires_at "
+                                "FROM expirations").fetchall()
+        return {removal: expires_at for removal, expires_at in rows}
+
+    def update_expirations(self,
+                           added: t.Dict[str, float],
+                           removed: t.List[str]) -> None:
+        with self._transaction() as db:
+            self._update_expirations(db, added, removed)
+
+    @staticmethod
+    def _update_expirations(db: sqlite3.Connection,
+                            added: t.Dict[str, float],
+                            removed: t.List[str]) -> None:
+        db.executemany("DELETE FROM expirations WHERE removal = ?",
+                       [(removal,) for removal in removed])
+        db.executemany("INSERT OR REPLACE INTO expirations "
+                       "(removal, expires_at) VALUES (?, ?)",
+                       added.items())
+
+    def acquire_leader(self, worker_id: str, lease_milliseconds: int) -> bool:
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT expires_at, fencing_token FROM leader "
+                             "WHERE name = ?", ("worker",)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+
+            fencing_token: int = 1 if row is None else row[1] + 1
+            db.execute("INSERT OR REPLACE INTO leader "
+                       "(name, worker_id, expires_at, fencing_token) "
+                       "VALUES (?, ?, ?, ?)",
+                       ("worker",
+                        worker_id,
+                        now + lease_milliseconds / 1000,
+                        fencing_token))
+
+        self._fencing_token = fencing_token
+        return True
+
+    def renew_leader(self, worker_id: str, lease_milliseconds: int) -> bool:
+        now = time.time()
+        cursor = self._db.execute("UPDATE leader SET expires_at = ? "
+                                  "WHERE name = ? AND worker_id = ? "
+                                  "AND expires_at > ?",
+                                  (now + lease_milliseconds / 1000,
+                                   "worker",
+                                   worker_id,
+                                   now))
+        return cursor.rowcount == 1
+
+    def release_leader(self, worker_id: str) -> None:
+        self._db.execute("UPDATE leader SET expires_at = 0 "
+                         "WHERE name = ? AND worker_id = ?",
+                         ("worker", worker_id))
+        self._fencing_token = None
+
+    def check_leader(self) -> None:
+        self._check_fencing_token(self._db)
+
+    def get_endpoint_index(
+            self,
+            lb_port: t.Optional[str],
+            url_prefix: t.Optional[str],
+            endpoint_uuid: t.Optional[str]) -> t.Optional[t.Tuple[int]]:
+        digest: t.Optional[bytes] = r.uuid_to_digest(
+            r.target_endpoint_uuid(lb_port, url_prefix, endpoint_uuid))
+        if digest is None:
+            return None
+
+        row = self._db.execute("SELECT route_idx FROM lds_uuid "
+                               "WHERE endpoint_uuid = ?",
+                               (digest,)).fetchone()
+        if row is None:
+            return None
+
+        return r.unpack_route_idx(row[0])
+
+    def setup_lds_uuid_db(self, conf: c.EnvoyConf):
+        rows: t.List[t.Tuple[bytes, int]] = []
+        for ridx, lds_res in enumerate(conf.lds.resources):
+            lb_port: str = lds_res.port
+            for tidx, route in enumerate(lds_res.routes):
+                url_prefix: str = route.prefix
+
+                endpoint_uuid: str = r.gen_endpoint_uuid(lb_port, url_prefix)
+                rows.append((bytes.fromhex(endpoint_uuid),
+                             r.pack_route_idx(ridx, tidx)))
+
+        with self._transaction() as db:
+            self._check_fencing_token(db)
+            db.execute("DELETE FROM lds_uuid")
+            db.executemany("INSERT OR REPLACE INTO lds_uuid "
+                           "(endpoint_uuid, route_idx) VALUES (?, ?)", rows)
+
+    def get_server_info(
+            self,
+            endpoint_uuid: str,
+            address: t.Optional[str],
+            port: t.Optional[int],
+            server_uuid: t.Optional[str]) -> t.Optional[t.Tuple[str, int]]:
+        endpoint_digest: t.Optional[bytes] = r.uuid_to_digest(endpoint_uuid)
+        server_digest: t.Optional[bytes] = r.uuid_to_digest(
+            r.target_server_uuid(address, port, server_uuid))
+        if endpoint_digest is None or server_digest is None:
+            return None
+
+        row = self._db.execute("SELECT address, port FROM eds_uuid "
+                               "WHERE endpoint_uuid = ? AND server_uuid = ?",
+                               (endpoint_digest, server_digest)).fetchone()
+        if row is None:
+            return None
+
+        return row[0], row[1]
+
+    def get_server_endpoints(self, address: str, port: int) -> t.List[str]:
+        server_digest: bytes = bytes.fromhex(r.gen_server_uuid(address, port))
+        rows = self._db.execute("SELECT endpoint_uuid FROM eds_uuid "
+                                "WHERE server_uuid = ? "
+                                "ORDER BY endpoint_uuid",
+                                (server_digest,)).fetchall()
+        return [row[0].hex() for row in rows]
+
+    @staticmethod
+    def _get_servers(
+            eds_res: ed_r.Resource) -> t.List[t.Tuple[bytes, bytes, str, int]]:
+        endpoint_digest = bytes.fromhex(eds_res.cluster_name)
+
+        servers: t.List[t.Tuple[bytes, bytes, str, int]] = []
+        for endpoint in eds_res.endpoints:
+            address: str = endpoint.address
+            port: int = endpoint.port_value
+
+            server_digest = bytes.fromhex(r.gen_server_uuid(address, port))
+            servers.append((endpoint_digest, server_digest, address, port))
+        return servers
+
+    def setup_eds_uuid_db(self, conf: c.EnvoyConf):
+        with self._transaction() as db:
+            self._check_fencing_token(db)
+            db.execute("DELETE FROM eds_uuid")
+            for eds_res in conf.eds.resources:
+                db.executemany("INSERT OR REPLACE INTO eds_uuid "
+                               "(endpoint_uuid, server_uuid, address, port) "
+                               "VALUES (?, ?, ?, ?)",
+                               self._get_servers(eds_res))
+
+    def update_eds_uuid_db(self,
+                           conf: c.EnvoyConf,
+                           endpoint_uuids: t.Set[str]) -> None:
+        if not endpoint_uuids:
+            return
+
+        with self._transaction() as db:
+            self._check_fencing_token(db)
+            db.executemany("DELETE FROM eds_uuid WHERE endpoint_uuid = ?",
+                           [(bytes.fromhex(endpoint_uuid),)
+                            for endpoint_uuid in sorted(endpoint_uuids)])
+            for eds_res in conf.eds.resources:
+                if eds_res.cluster_name not in endpoint_uuids:
+                    continue
+                db.executemany("INSERT OR REPLACE INTO eds_uuid "
+                               "(endpoint_uuid, server_uuid, address, port) "
+                               "VALUES (?, ?, ?, ?)",
+                               self._get_servers(eds_res))
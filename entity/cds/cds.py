@@ -1,3 +1,4 @@
+import copy
 import json
 import typing as t
 
@@ -41,17 +42,21 @@ class Cds:
         self._resources = current_resources
 
     @staticmethod
-    def _create_new_resource(endpoint_uuid: str) -> r.Resource:
+    def _create_new_resource(
+            endpoint_uuid: str,
+            config_sets: t.Optional[t.List[str]] = None) -> r.Resource:
 
-        new_resource = r.Resource(r.ResourceTemplate)
-        new_resource.apply_request(endpoint_uuid)
+        new_resource = r.Resource(copy.deepcopy(r.ResourceTemplate))
+        new_resource.apply_request(endpoint_uuid, config_sets)
 
         return new_resource
 
-    def apply_request(self, endpoint_uuid: str) -> None:
+    def apply_request(self,
+                      endpoint_uuid: str,
+                      config_sets: t.Optional[t.List[str]] = None) -> None:
         self._resources = []
 
-        new_resource = self._create_new_resource(endpoint_uuid)
+        new_resource = self._create_new_resource(endpoint_uuid, config_sets)
         self._resources.append(new_resource)
 
         self._rebuild_dict()
@@ -59,10 +64,10 @@ class Cds:
     def remove_without_request(self, endpoint_uuid: str) -> None:
         remove_idx_list = []
         for idx, resource in enumerate(self._resources):
-            if resource.cluster_name == endpoint_uuid:
+            if resource.cluster_name != endpoint_uuid:
                 remove_idx_list.append(idx)
 
-        for dx in remove_idx_list:
+        for dx in reversed(remove_idx_list):
             self._resources.pop(dx)
 
         self._rebuild_dict()
@@ -138,6 +143,10 @@ class Cds:
     def version_info(self) -> str:
         return self._version_info
 
+    def set_version_info(self, version_info: str) -> None:
+        self._version_info = version_info
+        self._cds_conf["version_info"] = version_info
+
     @property
     def resources(self) -> t.List[r.Resource]:
         return self._resources
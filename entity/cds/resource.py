@@ -5,11 +5,16 @@ EDS_CLUSTER_CONFIG_TYPE = t.Dict[str, t.Union[str,
                                               t.Dict[str, str]]]
 RESOURCE_TYPE = t.Dict[str, t.Union[str, EDS_CLUSTER_CONFIG_TYPE]]
 
+# Config sets of the cluster are kept in its metadata, which Envoy ignores.
+METADATA_NAMESPACE = "proxy_api"
+CONFIG_SETS_KEY = "config_sets"
+
 
 class Resource:
     _lb_policy = ""
     _cluster_name = ""
     _service_name = ""
+    _config_sets: t.Optional[t.List[str]] = None
 
     _resource_conf: RESOURCE_TYPE = {}
 
@@ -18,11 +23,18 @@ class Resource:
         self._lb_policy = resource["lb_policy"]
         self._cluster_name = resource["name"]
         self._service_name = resource["eds_cluster_config"]["service_name"]
+        self._config_sets = resource.get("metadata", {}) \
+            .get("filter_metadata", {}) \
+            .get(METADATA_NAMESPACE, {}) \
+            .get(CONFIG_SETS_KEY)
 
-    def apply_request(self, endpoint_uuid: str) -> None:
+    def apply_request(self,
+                      endpoint_uuid: str,
+                      config_sets: t.Optional[t.List[str]] = None) -> None:
         self._lb_policy = "ROUND_ROBIN"
         self._cluster_name = endpoint_uuid
         self._service_name = endpoint_uuid
+        self._config_sets = config_sets
         self._rebuild_dict()
 
     def _rebuild_dict(self) -> None:
@@ -30,6 +42,14 @@ class Resource:
         self._resource_conf["name"] = self._cluster_name
         self._resource_conf["eds_cluster_config"]["service_name"] = \
             self._service_name
+        if self._config_sets is None:
+            self._resource_conf.pop("metadata", None)
+        else:
+            self._resource_conf["metadata"] = {
+                "filter_metadata": {
+                    METADATA_NAMESPACE: {CONFIG_SETS_KEY: self._config_sets}
+                }
+            }
 
     def get_dict(self) -> RESOURCE_TYPE:
         return self._resource_conf
@@ -49,6 +69,10 @@ class Resource:
     def service_name(self) -> str:
         return self._service_name
 
+    @property
+    def config_sets(self) -> t.Optional[t.List[str]]:
+        return self._config_sets
+
 
 ResourceTemplate = {
     "@type": "type.googleapis.com/envoy.config.cluster.v3.Cluster",
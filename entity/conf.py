@@ -1,8 +1,10 @@
+import copy
 import json
 import logging
 import typing as t
 
 import entity.lds.lds as ld
+import entity.lds.resource as ld_r
 import entity.cds.cds as cd
 import entity.eds.eds as ed
 
@@ -11,9 +13,40 @@ import requests as req
 ENVOY_CONF_TYPE = t.Dict[str, t.Union[ld.LDS_TYPE,
                                       cd.CDS_TYPE,
                                       ed.EDS_TYPE]]
+RESULT_TYPE = t.Dict[str, str]
+
+RESULT_APPLIED = "applied"
+RESULT_UNCHANGED = "unchanged"
+RESULT_FAILED = "failed"
+RESULT_ABORTED = "aborted"
+
+ERROR_CONFLICT = "conflict"
+ERROR_NOT_FOUND = "not_found"
 LOG = logging.getLogger(__name__)
 
 
+def filter_listener(
+        listener: ld_r.RESOURCE_TYPE,
+        is_member: t.Callable[[str], bool]
+) -> t.Optional[ld_r.RESOURCE_TYPE]:
+    """Returns a copy of the listener with the routes to the clusters taken
+    by is_member, None when no route is left.
+    """
+    listener = copy.deepcopy(listener)
+    routes = 0
+    for filter_chain in listener["filter_chains"]:
+        for filter_dict in filter_chain["filters"]:
+            route_config = filter_dict["typed_config"]["route_config"]
+            for virtual_host in route_config["virtual_hosts"]:
+                virtual_host["routes"] = \
+                    [route for route in virtual_host["routes"]
+                     if is_member(route["route"]["cluster"])]
+                routes += len(virtual_host["routes"])
+    if not routes:
+        return None
+    return listener
+
+
 class EnvoyConf:
     _lds = ld.Lds()
     _cds = cd.Cds()
@@ -45,6 +78,58 @@ class EnvoyConf:
         new_conf._eds = new_eds
         return new_conf
 
+    def copy_subset(self, cluster_names: t.Set[str]) -> "EnvoyConf":
+        listeners: t.List[t.Any] = []
+        for lds_res in self._lds.resources:
+            listener = filter_listener(
+                lds_res.get_dict(),
+                lambda cluster_name: cluster_name in cluster_names)
+            if listener is not None:
+                listeners.append(listener)
+
+        new_lds = ld.Lds()
+        new_lds.load_from_db({"version_info": self._lds.version_info,
+                              "resources": listeners})
+
+        new_cds = cd.Cds()
+        new_cds.load_from_db({
+            "version_info": self._cds.version_info,
+            "resources": [copy.deepcopy(cds_res.get_dict())
+                          for cds_res in self._cds.resources
+                          if cds_res.cluster_name in cluster_names]
+        })
+
+        new_eds = ed.Eds()
+        new_eds.load_from_db({
+            "version_info": self._eds.version_info,
+            "resources": [copy.deepcopy(eds_res.get_dict())
+                          for eds_res in self._eds.resources
+                          if eds_res.cluster_name in cluster_names]
+        })
+
+        new_conf = EnvoyConf()
+        new_conf._lds = new_lds
+        new_conf._cds = new_cds
+        new_conf._eds = new_eds
+        return new_conf
+
+    def replace_types(self, conf_dict: ENVOY_CONF_TYPE) -> "EnvoyConf":
+        # xDS types missing in the dict are shared with this config.
+        new_conf = EnvoyConf()
+        new_conf._lds = self._lds
+        new_conf._cds = self._cds
+        new_conf._eds = self._eds
+        if "lds" in conf_dict:
+            new_conf._lds = ld.Lds()
+            new_conf._lds.load_from_db(conf_dict["lds"])
+        if "cds" in conf_dict:
+            new_conf._cds = cd.Cds()
+            new_conf._cds.load_from_db(conf_dict["cds"])
+        if "eds" in conf_dict:
+            new_conf._eds = ed.Eds()
+            new_conf._eds.load_from_db(conf_dict["eds"])
+        return new_conf
+
     def apply_request(self, request: req.REQUEST_TYPE) -> None:
 
         endpoint_uuid: str = request[req.ENDPOINT_UUID]
@@ -53,12 +138,16 @@ class EnvoyConf:
                 request[req.ENDPOINTS_CASE_NAME]
 
             self._lds.apply_request(request_value, endpoint_uuid)
-            self._cds.apply_request(endpoint_uuid)
+            self._cds.apply_request(endpoint_uuid,
+                                    request_value.get(req.CONFIG_SETS_KEY))
+            self._eds.set_resource_empty()
 
         elif req.SERVERS_CASE_NAME in request:
+            self._lds.set_resource_empty()
+            self._cds.set_resource_empty()
+
             request_value: req.SERVERS_REQUEST_TYPE = \
                 request[req.SERVERS_CASE_NAME]
-
             self._eds.apply_request(request_value, endpoint_uuid)
 
         else:
@@ -116,6 +205,224 @@ class EnvoyConf:
 
         return changed
 
+    def _create_request_conf(self) -> t.Any:
+        new_lds = ld.Lds()
+        new_lds.load_from_db({"version_info": self._lds.version_info,
+                              "resources": []})
+
+        new_cds = cd.Cds()
+        new_cds.load_from_db({"version_info": self._cds.version_info,
+                              "resources": []})
+
+        new_eds = ed.Eds()
+        new_eds.load_from_db({"version_info": self._eds.version_info,
+                              "resources": []})
+
+        new_conf = EnvoyConf()
+        new_conf._lds = new_lds
+        new_conf._cds = new_cds
+        new_conf._eds = new_eds
+        return new_conf
+
+    def apply(self, request: req.REQUEST_TYPE) -> bool:
+        mode: str = request[req.MODE_KEY]
+
+        # add() and remove() match resources by their keys only, so the
+        # requested resources are enough without copying whole config.
+        new_conf: EnvoyConf = self._create_request_conf()
+        new_conf.apply_request(request)
+
+        LOG.debug("Requested config:")
+        LOG.debug(new_conf.get_json())
+
+        changed = False
+        if mode == req.MODE_KEY_ADD:
+            LOG.debug("Add requested config")
+            changed = self.add(new_conf)
+        elif mode == req.MODE_KEY_REMOVE:
+            LOG.debug("Remove requested config")
+            changed = self.remove(new_conf)
+        else:
+            pass
+
+        return changed
+
+    def replace_servers(
+            self,
+            request: req.SERVER_SET_REQUEST_TYPE
+    ) -> t.Tuple[t.List[t.Tuple[str, int]], t.List[t.Tuple[str, int]]]:
+        endpoint_uuid: str = request[req.ENDPOINT_UUID]
+        # Endpoint removed after the request was accepted takes no servers,
+        # they would be a load assignment without its cluster.
+        if not any(cds_res.cluster_name == endpoint_uuid
+                   for cds_res in self._cds.resources):
+            return [], []
+
+        servers: t.List[t.Tuple[str, int]] = []
+        for request_value in request[req.SERVER_SET_CASE_NAME]:
+            servers.append((request_value[req.ADDRESS_KEY],
+                            int(request_value[req.PORT_KEY])))
+
+        return self._eds.replace_endpoints(endpoint_uuid, servers)
+
+    def drain_server(self, request: req.SERVER_REQUEST_TYPE) -> t.List[str]:
+        request_value: req.SERVERS_REQUEST_TYPE = \
+            request[req.SERVERS_CASE_NAME]
+        return self._eds.remove_endpoint_from_all(
+            request_value[req.ADDRESS_KEY],
+            int(request_value[req.PORT_KEY]))
+
+    def set_weights(self, request: req.WEIGHT_REQUEST_TYPE) -> bool:
+        weights: t.Dict[str, t.Dict[t.Tuple[str, int], t.Optional[int]]] = {}
+        for endpoint_uuid, request_values in request[req.WEIGHTS_KEY].items():
+            servers = weights.setdefault(endpoint_uuid, {})
+            for request_value in request_values:
+                server = (request_value[req.ADDRESS_KEY],
+                          int(request_value[req.PORT_KEY]))
+                servers[server] = request_value[req.WEIGHT_KEY]
+        return self._eds.set_weights(weights)
+
+    def _get_keys(self) -> t.Tuple[t.Set[str], t.Set[t.Tuple[str, str, int]]]:
+        endpoint_uuids: t.Set[str] = set()
+        for lds_res in self._lds.resources:
+            for route in lds_res.routes:
+                endpoint_uuids.add(route.cluster_name)
+
+        servers: t.Set[t.Tuple[str, str, int]] = set()
+        for eds_res in self._eds.resources:
+            for endpoint in eds_res.endpoints:
+                servers.add((eds_res.cluster_name,
+                             endpoint.address,
+                             endpoint.port_value))
+
+        return endpoint_uuids, servers
+
+    @staticmethod
+    def _check_request(
+            request: req.REQUEST_TYPE,
+            endpoint_uuids: t.Set[str],
+            servers: t.Set[t.Tuple[str, str, int]],
+            upsert: bool) -> t.Optional[str]:
+        mode: str = request[req.MODE_KEY]
+        endpoint_uuid: str = request[req.ENDPOINT_UUID]
+
+        if req.ENDPOINTS_CASE_NAME in request:
+            if mode == req.MODE_KEY_ADD and endpoint_uuid in endpoint_uuids \
+                    and not upsert:
+                return ERROR_CONFLICT
+            if mode == req.MODE_KEY_REMOVE \
+                    and endpoint_uuid not in endpoint_uuids:
+                return ERROR_NOT_FOUND
+
+        elif req.SERVERS_CASE_NAME in request:
+            request_value: req.SERVERS_REQUEST_TYPE = \
+                request[req.SERVERS_CASE_NAME]
+            server = (endpoint_uuid,
+                      request_value[req.ADDRESS_KEY],
+                      int(request_value[req.PORT_KEY]))
+
+            if endpoint_uuid not in endpoint_uuids:
+                return ERROR_NOT_FOUND
+            if mode == req.MODE_KEY_ADD and server in servers \
+                    and not upsert:
+                return ERROR_CONFLICT
+            if mode == req.MODE_KEY_REMOVE and server not in servers:
+                return ERROR_NOT_FOUND
+
+        return None
+
+    @staticmethod
+    def _update_keys(request: req.REQUEST_TYPE,
+                     endpoint_uuids: t.Set[str],
+                     servers: t.Set[t.Tuple[str, str, int]]) -> None:
+        mode: str = request[req.MODE_KEY]
+        endpoint_uuid: str = request[req.ENDPOINT_UUID]
+
+        if req.ENDPOINTS_CASE_NAME in request:
+            if mode == req.MODE_KEY_ADD:
+                endpoint_uuids.add(endpoint_uuid)
+            else:
+                endpoint_uuids.discard(endpoint_uuid)
+
+        elif req.SERVERS_CASE_NAME in request:
+            request_value: req.SERVERS_REQUEST_TYPE = \
+                request[req.SERVERS_CASE_NAME]
+            server = (endpoint_uuid,
+                      request_value[req.ADDRESS_KEY],
+                      int(request_value[req.PORT_KEY]))
+            if mode == req.MODE_KEY_ADD:
+                servers.add(server)
+            else:
+                servers.discard(server)
+
+    def apply_batch(
+            self,
+            requests: t.List[req.REQUEST_TYPE],
+            upsert: bool = False
+    ) -> t.Tuple[bool, t.List[RESULT_TYPE]]:
+        # Requests are applied to a staged copy, and the staged copy
+        # replaces the current config only when every request succeeded.
+        staged: EnvoyConf = self.copy_conf()
+        endpoint_uuids, servers = staged._get_keys()
+
+        results: t.List[RESULT_TYPE] = []
+        failed = False
+        for request in requests:
+            error = self._check_request(request,
+                                        endpoint_uuids,
+                                        servers,
+                                        upsert)
+            if error is not None:
+                results.append({"status": RESULT_FAILED, "error": error})
+                failed = True
+                continue
+
+            if staged.apply(request):
+                results.append({"status": RESULT_APPLIED})
+            else:
+                results.append({"status": RESULT_UNCHANGED})
+            self._update_keys(request, endpoint_uuids, servers)
+
+        if failed:
+            for result in results:
+                if result["status"] != RESULT_FAILED:
+                    result["status"] = RESULT_ABORTED
+            return False, results
+
+        # Whole batch is one generation, so each version is bumped once.
+        changed = False
+        for current, new in ((self._lds, staged.lds),
+                             (self._cds, staged.cds),
+                             (self._eds, staged.eds)):
+            if new.version_info != current.version_info:
+                new.set_version_info(str(int(current.version_info) + 1))
+                changed = True
+
+        if changed:
+            self._lds = staged.lds
+            self._cds = staged.cds
+            self._eds = staged.eds
+
+        return changed, results
+
+    def apply_expired(
+            self,
+            requests: t.List[req.REQUEST_TYPE]
+    ) -> t.Tuple[bool, t.List[req.REQUEST_TYPE]]:
+        # Expired resources are removed as one generation. Unlike a batch,
+        # resources removed already are skipped without scanning whole
+        # config, so the cost follows the number of expired resources.
+        versions = [(resource, int(resource.version_info))
+                    for resource in (self._lds, self._cds, self._eds)]
+
+        removed = [request for request in requests if self.apply(request)]
+
+        for resource, version in versions:
+            if int(resource.version_info) != version:
+                resource.set_version_info(str(version + 1))
+
+        return bool(removed), removed
+
     def get_json(self) -> str:
         envoy_conf = {
             "lds": self._lds.get_dict(),
@@ -124,6 +431,14 @@ class EnvoyConf:
         }
         return json.dumps(envoy_conf)
 
+    @property
+    def version(self) -> int:
+        # Every change bumps at least one of the versions,
+        # so the sum of them grows with each applied change.
+        return int(self._lds.version_info) + \
+            int(self._cds.version_info) + \
+            int(self._eds.version_info)
+
     @property
     def lds(self) -> ld.Lds:
         return self._lds
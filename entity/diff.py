@@ -0,0 +1,239 @@
+import json
+import typing as t
+
+import entity.conf as c
+import requests as req
+
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_MODIFIED = "modified"
+
+XDS_LDS = "lds"
+XDS_CDS = "cds"
+XDS_EDS = "eds"
+
+# Stable keys of the resources.
+LISTENER_KEY_TYPE = str
+ROUTE_KEY_TYPE = t.Tuple[str, str]
+CLUSTER_KEY_TYPE = str
+LB_ENDPOINT_KEY_TYPE = t.Tuple[str, str, int]
+
+
+class Generation:
+    """Resources of a config generation in JSON by their stable keys.
+
+    Listeners are keyed by port, routes by port and prefix, clusters and
+    load assignments by cluster name, and lb endpoints by cluster name,
+    address and port. A generation may hold only the resources touched
+    by the requests.
+    """
+
+    def __init__(self) -> None:
+        self._listeners: t.Dict[LISTENER_KEY_TYPE, str] = {}
+        self._routes: t.Dict[ROUTE_KEY_TYPE, str] = {}
+        self._clusters: t.Dict[CLUSTER_KEY_TYPE, str] = {}
+        self._load_assignments: t.Dict[CLUSTER_KEY_TYPE, str] = {}
+        self._lb_endpoints: t.Dict[LB_ENDPOINT_KEY_TYPE, str] = {}
+        self._versions: t.Dict[str, str] = {}
+
+    @property
+    def listeners(self) -> t.Dict[LISTENER_KEY_TYPE, str]:
+        return self._listeners
+
+    @property
+    def routes(self) -> t.Dict[ROUTE_KEY_TYPE, str]:
+        return self._routes
+
+    @property
+    def clusters(self) -> t.Dict[CLUSTER_KEY_TYPE, str]:
+        return self._clusters
+
+    @property
+    def load_assignments(self) -> t.Dict[CLUSTER_KEY_TYPE, str]:
+        return self._load_assignments
+
+    @property
+    def lb_endpoints(self) -> t.Dict[LB_ENDPOINT_KEY_TYPE, str]:
+        return self._lb_endpoints
+
+    @property
+    def versions(self) -> t.Dict[str, str]:
+        return self._versions
+
+
+class ChangeSet:
+    """Resources added, removed or modified between two generations.
+
+    Every map is from the stable key of a resource to one of
+    CHANGE_ADDED, CHANGE_REMOVED and CHANGE_MODIFIED. A listener or a load
+    assignment is modified by a change of its routes or lb endpoints.
+    An xDS type is changed by a change of its resources or version.
+    """
+
+    def __init__(self,
+                 listeners: t.Dict[LISTENER_KEY_TYPE, str],
+                 routes: t.Dict[ROUTE_KEY_TYPE, str],
+                 clusters: t.Dict[CLUSTER_KEY_TYPE, str],
+                 load_assignments: t.Dict[CLUSTER_KEY_TYPE, str],
+                 lb_endpoints: t.Dict[LB_ENDPOINT_KEY_TYPE, str],
+                 versions: t.Set[str]) -> None:
+        self._listeners = listeners
+        self._routes = routes
+        self._clusters = clusters
+        self._load_assignments = load_assignments
+        self._lb_endpoints = lb_endpoints
+        self._changed_types: t.Set[str] = set(versions)
+        if listeners:
+            self._changed_types.add(XDS_LDS)
+        if clusters:
+            self._changed_types.add(XDS_CDS)
+        if load_assignments:
+            self._changed_types.add(XDS_EDS)
+
+    @property
+    def listeners(self) -> t.Dict[LISTENER_KEY_TYPE, str]:
+        return self._listeners
+
+    @property
+    def routes(self) -> t.Dict[ROUTE_KEY_TYPE, str]:
+        return self._routes
+
+    @property
+    def clusters(self) -> t.Dict[CLUSTER_KEY_TYPE, str]:
+        return self._clusters
+
+    @property
+    def load_assignments(self) -> t.Dict[CLUSTER_KEY_TYPE, str]:
+        return self._load_assignments
+
+    @property
+    def lb_endpoints(self) -> t.Dict[LB_ENDPOINT_KEY_TYPE, str]:
+        return self._lb_endpoints
+
+    @property
+    def lds_changed(self) -> bool:
+        return XDS_LDS in self._changed_types
+
+    @property
+    def cds_changed(self) -> bool:
+        return XDS_CDS in self._changed_types
+
+    @property
+    def eds_changed(self) -> bool:
+        return XDS_EDS in self._changed_types
+
+    @property
+    def empty(self) -> bool:
+        return not self._changed_types
+
+
+def _dumps(resource: t.Dict[str, t.Any]) -> str:
+    return json.dumps(resource, sort_keys=True)
+
+
+def snapshot(conf: c.EnvoyConf,
+             ports: t.Optional[t.Set[str]] = None,
+             cluster_names: t.Optional[t.Set[str]] = None) -> Generation:
+    # Only the resources of the given ports and clusters are serialized,
+    # None takes all of them.
+    generation = Generation()
+    generation.versions[XDS_LDS] = conf.lds.version_info
+    generation.versions[XDS_CDS] = conf.cds.version_info
+    generation.versions[XDS_EDS] = conf.eds.version_info
+
+    for lds_res in conf.lds.resources:
+        if ports is not None and lds_res.port not in ports:
+            continue
+
+        generation.listeners[lds_res.port] = _dumps(lds_res.get_dict())
+        for route in lds_res.routes:
+            generation.routes[(lds_res.port, route.prefix)] = \
+                _dumps(route.get_dict())
+
+    for cds_res in conf.cds.resources:
+        if cluster_names is not None \
+                and cds_res.cluster_name not in cluster_names:
+            continue
+
+        generation.clusters[cds_res.cluster_name] = \
+            _dumps(cds_res.get_dict())
+
+    for eds_res in conf.eds.resources:
+        if cluster_names is not None \
+                and eds_res.cluster_name not in cluster_names:
+            continue
+
+        generation.load_assignments[eds_res.cluster_name] = \
+            _dumps(eds_res.get_dict())
+        for endpoint in eds_res.endpoints:
+            key = (eds_res.cluster_name, endpoint.address, endpoint.port_value)
+            generation.lb_endpoints[key] = _dumps(endpoint.get_dict())
+
+    return generation
+
+
+def get_touched(
+        requests: t.List[req.REQUEST_TYPE],
+        conf: c.EnvoyConf) -> t.Tuple[t.Set[str], t.Set[str]]:
+    """Returns ports and cluster names the requests may change."""
+    ports: t.Set[str] = set()
+    cluster_names: t.Set[str] = set()
+
+    pending = list(requests)
+    while pending:
+        request = pending.pop()
+        mode: str = request[req.MODE_KEY]
+
+        if mode in (req.MODE_KEY_BATCH, req.MODE_KEY_EXPIRE):
+            pending.extend(request[req.OPERATIONS_KEY])
+
+        elif mode == req.MODE_KEY_WEIGHT:
+            cluster_names.update(request[req.WEIGHTS_KEY])
+
+        elif mode == req.MODE_KEY_DRAIN:
+            request_value: req.SERVERS_REQUEST_TYPE = \
+                request[req.SERVERS_CASE_NAME]
+            server = (request_value[req.ADDRESS_KEY],
+                      int(request_value[req.PORT_KEY]))
+            for eds_res in conf.eds.resources:
+                if any((endpoint.address, endpoint.port_value) == server
+                       for endpoint in eds_res.endpoints):
+                    cluster_names.add(eds_res.cluster_name)
+
+        else:
+            cluster_names.add(request[req.ENDPOINT_UUID])
+            if req.ENDPOINTS_CASE_NAME in request:
+                ports.add(str(request[req.ENDPOINTS_CASE_NAME][
+                    req.PORT_VALUE_KEY]))
+
+    return ports, cluster_names
+
+
+def _diff_map(old: t.Dict[t.Any, str],
+              new: t.Dict[t.Any, str]) -> t.Dict[t.Any, str]:
+    changes: t.Dict[t.Any, str] = {}
+    for key, value in old.items():
+        if key not in new:
+            changes[key] = CHANGE_REMOVED
+        elif new[key] != value:
+            changes[key] = CHANGE_MODIFIED
+
+    for key in new:
+        if key not in old:
+            changes[key] = CHANGE_ADDED
+
+    return changes
+
+
+def diff(old: Generation, new: Generation) -> ChangeSet:
+    return ChangeSet(_diff_map(old.listeners, new.listeners),
+                     _diff_map(old.routes, new.routes),
+                     _diff_map(old.clusters, new.clusters),
+                     _diff_map(old.load_assignments, new.load_assignments),
+                     _diff_map(old.lb_endpoints, new.lb_endpoints),
+                     {xds_type for xds_type, version in new.versions.items()
+                      if old.versions.get(xds_type) != version})
+
+
+def diff_conf(old: c.EnvoyConf, new: c.EnvoyConf) -> ChangeSet:
+    return diff(snapshot(old), snapshot(new))
@@ -1,3 +1,4 @@
+import copy
 import json
 import typing as t
 
@@ -46,7 +47,7 @@ class Eds:
     def _create_new_resource(port_request: str,
                              address_request: str,
                              endpoint_uuid: str) -> r.Resource:
-        new_resource = r.Resource(r.ResourceTemplate)
+        new_resource = r.Resource(copy.deepcopy(r.ResourceTemplate))
         new_resource.apply_request(port_request,
                                    address_request,
                                    endpoint_uuid)
@@ -88,7 +89,7 @@ class Eds:
                         remove_eidx_list.append(eidx)
 
                 if match:
-                    for edx in remove_eidx_list:
+                    for edx in reversed(remove_eidx_list):
                         self._resources[idx]._endpoints.pop(edx)
 
                     self._resources[idx].rebuild_dict()
@@ -98,7 +99,7 @@ class Eds:
             else:
                 remove_idx_list.append(idx)
 
-        for dx in remove_idx_list:
+        for dx in reversed(remove_idx_list):
             self._resources.pop(dx)
 
         self._rebuild_dict()
@@ -129,14 +130,21 @@ class Eds:
 
                 n_addresses: t.Dict[str, int] = {}
                 for n_ix, n_endpoint in enumerate(new_endpoints):
-                    n_addresses[n_endpoint.address] = n_ix
+                    n_a_p = "{}_{}".format(n_endpoint.address,
+                                           n_endpoint.port_value)
+                    n_addresses[n_a_p] = n_ix
 
                 idx: int = cluster_names[nc]
                 addresses: t.Dict[str, int] = {}
                 for ix, endpoint in enumerate(self._resources[idx].endpoints):
-                    addresses[endpoint.address] = ix
+                    a_p = "{}_{}".format(endpoint.address, endpoint.port_value)
+                    addresses[a_p] = ix
 
                 for n_ad, n_ix in n_addresses.items():
+                    if n_ad in addresses:
+                        # skip Endpoint already registered.
+                        continue
+
                     new_endpoint: ep.Endpoint = new_endpoints[n_ix]
                     self._resources[idx]._endpoints.append(new_endpoint)
                     changed = True
@@ -206,6 +214,98 @@ class Eds:
 
         return changed
 
+    def replace_endpoints(
+            self,
+            cluster_name: str,
+            servers: t.List[t.Tuple[str, int]]
+    ) -> t.Tuple[t.List[t.Tuple[str, int]], t.List[t.Tuple[str, int]]]:
+        idx: t.Optional[int] = None
+        for ix, resource in enumerate(self._resources):
+            if resource.cluster_name == cluster_name:
+                idx = ix
+                break
+
+        if idx is None:
+            if not servers:
+                return [], []
+
+            # add new Resource.
+            address, port = servers[0]
+            new_resource = self._create_new_resource(str(port),
+                                                     address,
+                                                     cluster_name)
+            self._resources.append(new_resource)
+            idx = len(self._resources) - 1
+
+            added, removed = new_resource.replace_endpoints(servers)
+            added.insert(0, (address, port))
+        else:
+            added, removed = self._resources[idx].replace_endpoints(servers)
+
+        if not added and not removed:
+            return added, removed
+
+        if not self._resources[idx].endpoints:
+            # delete Resource that has no Endpoints.
+            self._resources.pop(idx)
+
+        version = int(self._version_info)
+        version += 1
+        self._version_info = str(version)
+
+        self._rebuild_dict()
+        return added, removed
+
+    def set_weights(
+            self,
+            weights: t.Dict[str, t.Dict[t.Tuple[str, int], t.Optional[int]]]
+    ) -> bool:
+        # Servers removed since the weights were given are skipped.
+        changed = False
+        for resource in self._resources:
+            if resource.cluster_name in weights:
+                changed |= resource.set_weights(
+                    weights[resource.cluster_name])
+
+        if changed:
+            version = int(self._version_info)
+            version += 1
+            self._version_info = str(version)
+
+            self._rebuild_dict()
+        return changed
+
+    def remove_endpoint_from_all(self,
+                                 address: str,
+                                 port: int) -> t.List[str]:
+        removed: t.List[str] = []
+
+        current_resources: t.List[r.Resource] = []
+        for resource in self._resources:
+            endpoints = [endpoint for endpoint in resource.endpoints
+                         if endpoint.address != address
+                         or endpoint.port_value != port]
+            if len(endpoints) == len(resource.endpoints):
+                current_resources.append(resource)
+                continue
+
+            removed.append(resource.cluster_name)
+            if endpoints:
+                resource._endpoints = endpoints
+                resource.rebuild_dict()
+                current_resources.append(resource)
+
+        if removed:
+            self._resources = current_resources
+
+            version = int(self._version_info)
+            version += 1
+            self._version_info = str(version)
+
+            self._rebuild_dict()
+
+        return removed
+
     def get_dict(self) -> EDS_TYPE:
         return self._eds_conf
 
@@ -216,6 +316,10 @@ class Eds:
     def version_info(self) -> str:
         return self._version_info
 
+    def set_version_info(self, version_info: str) -> None:
+        self._version_info = version_info
+        self._eds_conf["version_info"] = version_info
+
     @property
     def resources(self) -> t.List[r.Resource]:
         return self._resources
@@ -10,6 +10,7 @@ LB_ENDPOINTS_TYPE = t.Dict[str, t.List[ENDPOINT_TYPE]]
 class Endpoint:
     _address = ""
     _port_value = 0
+    _load_balancing_weight: t.Optional[int] = None
     _endpoint_conf: LB_ENDPOINTS_TYPE = {}
 
     def __init__(self, endpoint: LB_ENDPOINTS_TYPE) -> None:
@@ -18,6 +19,7 @@ class Endpoint:
         address: ADDRESS_TYPE = endpoint["endpoint"]["address"]
         self._address = address["socket_address"]["address"]
         self._port_value = int(address["socket_address"]["port_value"])
+        self._load_balancing_weight = endpoint.get("load_balancing_weight")
 
     def apply_request(self,
                       port_request: str,
@@ -27,6 +29,15 @@ class Endpoint:
 
         self._rebuild_dict()
 
+    def set_load_balancing_weight(self, weight: t.Optional[int]) -> bool:
+        # None leaves the weight to Envoy, which is equal for every server.
+        if weight == self._load_balancing_weight:
+            return False
+
+        self._load_balancing_weight = weight
+        self._rebuild_dict()
+        return True
+
     def _rebuild_dict(self) -> None:
         self._endpoint_conf["endpoint"]["address"]["socket_address"][
             "address"] = self._address
@@ -34,6 +45,12 @@ class Endpoint:
         self._endpoint_conf["endpoint"]["address"]["socket_address"][
             "port_value"] = self._port_value
 
+        if self._load_balancing_weight is None:
+            self._endpoint_conf.pop("load_balancing_weight", None)
+        else:
+            self._endpoint_conf["load_balancing_weight"] = \
+                self._load_balancing_weight
+
     def get_dict(self) -> LB_ENDPOINTS_TYPE:
         return self._endpoint_conf
 
@@ -48,6 +65,10 @@ class Endpoint:
     def port_value(self) -> int:
         return self._port_value
 
+    @property
+    def load_balancing_weight(self) -> t.Optional[int]:
+        return self._load_balancing_weight
+
 
 EndpointTemplate = {
     "endpoint": {
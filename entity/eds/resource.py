@@ -1,3 +1,4 @@
+import copy
 import json
 import typing as t
 
@@ -31,7 +32,7 @@ class Resource:
     @staticmethod
     def _create_new_route(port_request: str,
                           address_request: str) -> ep.Endpoint:
-        new_endpoint = ep.Endpoint(ep.EndpointTemplate)
+        new_endpoint = ep.Endpoint(copy.deepcopy(ep.EndpointTemplate))
         new_endpoint.apply_request(address_request=address_request,
                                    port_request=port_request)
         return new_endpoint
@@ -49,6 +50,48 @@ class Resource:
 
         self._rebuild_dict()
 
+    def replace_endpoints(
+            self,
+            servers: t.List[t.Tuple[str, int]]
+    ) -> t.Tuple[t.List[t.Tuple[str, int]], t.List[t.Tuple[str, int]]]:
+        desired: t.Dict[t.Tuple[str, int], None] = dict.fromkeys(servers)
+
+        current: t.Dict[t.Tuple[str, int], ep.Endpoint] = {}
+        for endpoint in self._endpoints:
+            current[(endpoint.address, endpoint.port_value)] = endpoint
+
+        added = [server for server in desired if server not in current]
+        removed = [server for server in current if server not in desired]
+        if not added and not removed:
+            return added, removed
+
+        new_endpoints: t.List[ep.Endpoint] = []
+        for endpoint in self._endpoints:
+            if (endpoint.address, endpoint.port_value) in desired:
+                new_endpoints.append(endpoint)
+
+        for address, port in added:
+            new_endpoints.append(
+                self._create_new_route(address_request=address,
+                                       port_request=str(port)))
+
+        self._endpoints = new_endpoints
+        self._rebuild_dict()
+        return added, removed
+
+    def set_weights(
+            self,
+            weights: t.Dict[t.Tuple[str, int], t.Optional[int]]) -> bool:
+        changed = False
+        for endpoint in self._endpoints:
+            server = (endpoint.address, endpoint.port_value)
+            if server in weights:
+                changed |= endpoint.set_load_balancing_weight(weights[server])
+
+        if changed:
+            self._rebuild_dict()
+        return changed
+
     def rebuild_dict(self) -> None:
         self._rebuild_dict()
 
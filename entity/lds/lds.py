@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import typing as t
@@ -48,7 +49,7 @@ class Lds:
     def _create_new_resource(port_value_request: str,
                              route_request: req.ROUTE_REQUEST_TYPE,
                              endpoint_uuid: str) -> r.Resource:
-        new_resource = r.Resource(r.ResourceTemplate)
+        new_resource = r.Resource(copy.deepcopy(r.ResourceTemplate))
         new_resource.apply_request(port_value_request,
                                    route_request,
                                    endpoint_uuid)
@@ -83,14 +84,14 @@ class Lds:
                     remove_ridx_list.append(ridx)
 
             if match:
-                for rdx in remove_ridx_list:
+                for rdx in reversed(remove_ridx_list):
                     self._resources[idx]._routes.pop(rdx)
 
                 self._resources[idx].rebuild_dict()
             else:
                 remove_idx_list.append(idx)
 
-        for dx in remove_idx_list:
+        for dx in reversed(remove_idx_list):
             self._resources.pop(dx)
 
         self._rebuild_dict()
@@ -223,6 +224,10 @@ class Lds:
     def version_info(self) -> str:
         return self._version_info
 
+    def set_version_info(self, version_info: str) -> None:
+        self._version_info = version_info
+        self._lds_conf["version_info"] = version_info
+
     @property
     def resources(self) -> t.List[r.Resource]:
         return self._resources
@@ -1,3 +1,4 @@
+import copy
 import json
 import typing as t
 
@@ -58,7 +59,7 @@ class Resource:
     @staticmethod
     def _create_new_route(route_value_request: req.ROUTE_REQUEST_TYPE,
                           endpoint_uuid: str) -> r.Route:
-        new_route = r.Route(r.RouteTemplate)
+        new_route = r.Route(copy.deepcopy(r.RouteTemplate))
         new_route.apply_request(route_value_request, endpoint_uuid)
         return new_route
 
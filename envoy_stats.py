@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import typing as t
+import urllib.request
+
+import database.repository as r
+import envoy_tracker as et
+
+LOG = logging.getLogger(__name__)
+
+try:
+    ENVOY_STATS_INTERVAL_SECONDS = \
+        float(os.environ["ENVOY_STATS_INTERVAL_SECONDS"])
+except KeyError:
+    ENVOY_STATS_INTERVAL_SECONDS = 10.0
+
+# Clusters of the endpoints are named by the endpoint UUIDs.
+CLUSTER_NAME_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+STATS_PATH = "/stats?format=json&filter=%5Ecluster%5C."
+CLUSTERS_PATH = "/clusters?format=json"
+
+CLUSTER_COUNTERS = ("upstream_rq_total",
+                    "upstream_rq_5xx",
+                    "upstream_rq_timeout",
+                    "upstream_cx_connect_fail")
+CLUSTER_GAUGES = ("upstream_cx_active", "upstream_rq_active")
+LATENCY_HISTOGRAM = "upstream_rq_time"
+LATENCY_QUANTILES = {50.0: "p50", 90.0: "p90", 99.0: "p99"}
+
+HOST_COUNTERS = ("rq_total", "rq_error", "rq_timeout")
+HOST_GAUGES = ("cx_active", "rq_active")
+
+HEALTH_HEALTHY = "healthy"
+HEALTH_DEGRADED = "degraded"
+HEALTH_UNHEALTHY = "unhealthy"
+# Flags set on a host by health checks and outlier detection.
+UNHEALTHY_FLAGS = ("failed_active_health_check", "failed_outlier_check")
+DEGRADED_FLAGS = ("failed_active_degraded_check",)
+UNHEALTHY_EDS_STATUSES = ("UNHEALTHY", "DRAINING", "TIMEOUT")
+DEGRADED_EDS_STATUSES = ("DEGRADED",)
+
+SERVER_STATS_TYPE = t.Dict[str, t.Any]
+CLUSTER_STATS_TYPE = t.Dict[str, t.Any]
+
+
+def new_cluster_stats() -> CLUSTER_STATS_TYPE:
+    stats: CLUSTER_STATS_TYPE = {"upstream_rq_per_second": None}
+    for name in CLUSTER_COUNTERS + CLUSTER_GAUGES:
+        stats[name] = 0
+    stats["upstream_rq_time_ms"] = \
+        {quantile: None for quantile in LATENCY_QUANTILES.values()}
+    stats["servers"] = []
+    return stats
+
+
+def _split_cluster_stat(name: str) -> t.Optional[t.Tuple[str, str]]:
+    # cluster.<cluster name>.<stat name>
+    parts = name.split(".", 2)
+    if len(parts) != 3 or parts[0] != "cluster" \
+            or not CLUSTER_NAME_PATTERN.match(parts[1]):
+        return None
+    return parts[1], parts[2]
+
+
+def parse_stats(
+        dump: t.Dict[str, t.Any]) -> t.Dict[str, CLUSTER_STATS_TYPE]:
+    clusters: t.Dict[str, CLUSTER_STATS_TYPE] = {}
+    for stat in dump.get("stats", []):
+        if "histograms" in stat:
+            histograms = stat["histograms"]
+            quantiles = [float(quantile) for quantile
+                         in histograms.get("supported_quantiles", [])]
+            for histogram in histograms.get("computed_quantiles", []):
+                split = _split_cluster_stat(histogram.get("name", ""))
+                if split is None or split[1] != LATENCY_HISTOGRAM:
+                    continue
+
+                # Quantiles of the last flush interval, None without
+                # requests in it.
+                latency = clusters.setdefault(
+                    split[0], new_cluster_stats())["upstream_rq_time_ms"]
+                for quantile, values in zip(quantiles,
+                                            histogram.get("values", [])):
+                    if quantile in LATENCY_QUANTILES:
+                        latency[LATENCY_QUANTILES[quantile]] = \
+                            values.get("interval")
+            continue
+
+        split = _split_cluster_stat(stat.get("name", ""))
+        if split is None or split[1] not in CLUSTER_COUNTERS + CLUSTER_GAUGES:
+            continue
+        clusters.setdefault(split[0], new_cluster_stats())[split[1]] = \
+            int(stat.get("value", 0))
+    return clusters
+
+
+def get_health(
+        health_status: t.Dict[str, t.Any]) -> t.Tuple[str, t.List[str]]:
+    # Flags set on the host, with the EDS status other than healthy.
+    flags = [flag for flag in UNHEALTHY_FLAGS + DEGRADED_FLAGS
+             if health_status.get(flag) is True]
+    eds_status = health_status.get("eds_health_status", "HEALTHY")
+    if eds_status != "HEALTHY":
+        flags.append("eds_" + eds_status.lower())
+
+    if eds_status in UNHEALTHY_EDS_STATUSES \
+            or any(flag in UNHEALTHY_FLAGS for flag in flags):
+        return HEALTH_UNHEALTHY, flags
+    if eds_status in DEGRADED_EDS_STATUSES \
+            or any(flag in DEGRADED_FLAGS for flag in flags):
+        return HEALTH_DEGRADED, flags
+    return HEALTH_HEALTHY, flags
+
+
+def parse_clusters(dump: t.Dict[str, t.Any],
+                   clusters: t.Dict[str, CLUSTER_STATS_TYPE]) -> None:
+    for cluster_status in dump.get("cluster_statuses", []):
+        cluster_name = cluster_status.get("name", "")
+        if not CLUSTER_NAME_PATTERN.match(cluster_name):
+            continue
+
+        servers: t.List[SERVER_STATS_TYPE] = []
+        for host_status in cluster_status.get("host_statuses", []):
+            socket_address = host_status.get("address", {}) \
+                .get("socket_address", {})
+            address = socket_address.get("address", "")
+            port = int(socket_address.get("port_value", 0))
+            # Counters and gauges are uint64, which are strings in JSON.
+            host_stats = {stat.get("name"): int(stat.get("value", 0))
+                          for stat in host_status.get("stats", [])}
+            health, flags = get_health(host_status.get("health_status", {}))
+
+            server: SERVER_STATS_TYPE = {
+                "server_uuid": r.gen_server_uuid(address, port),
+                "address": address,
+                "port": port,
+                "health": health,
+                "health_flags": flags,
+                "weight": int(host_status.get("weight", 1)),
+                "rq_per_second": None
+            }
+            for name in HOST_COUNTERS + HOST_GAUGES:
+                server[name] = host_stats.get(name, 0)
+            servers.append(server)
+
+        clusters.setdefault(cluster_name, new_cluster_stats())["servers"] = \
+            servers
+
+
+def _get_json(url: str) -> t.Dict[str, t.Any]:
+    with urllib.request.urlopen(
+            url, timeout=et.ADMIN_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read())
+
+
+def fetch_stats(admin_url: str) -> t.Dict[str, CLUSTER_STATS_TYPE]:
+    clusters = parse_stats(_get_json(admin_url + STATS_PATH))
+    parse_clusters(_get_json(admin_url + CLUSTERS_PATH), clusters)
+    return clusters
+
+
+def _get_rate(current: int,
+              previous: t.Optional[int],
+              elapsed: t.Optional[float]) -> t.Optional[float]:
+    # A counter going back was reset by a restart of Envoy.
+    if previous is None or not elapsed or current < previous:
+        return None
+    return round((current - previous) / elapsed, 3)
+
+
+def add_rates(stats: t.Dict[str, CLUSTER_STATS_TYPE],
+              previous: t.Dict[str, CLUSTER_STATS_TYPE],
+              elapsed: t.Optional[float]) -> None:
+    for cluster_name, cluster in stats.items():
+        previous_cluster = previous.get(cluster_name, {})
+        cluster["upstream_rq_per_second"] = \
+            _get_rate(cluster["upstream_rq_total"],
+                      previous_cluster.get("upstream_rq_total"),
+                      elapsed)
+
+        previous_servers = {server["server_uuid"]: server
+                            for server in previous_cluster.get("servers", [])}
+        for server in cluster["servers"]:
+            server["rq_per_second"] = \
+                _get_rate(server["rq_total"],
+                          previous_servers.get(server["server_uuid"], {})
+                          .get("rq_total"),
+                          elapsed)
+
+
+class StatsCollector:
+    """Keeps the stats of the endpoint clusters scraped from the Envoy admin.
+
+    A single thread scrapes /stats and /clusters once per interval and
+    requests read the last scrape, so the number of requests does not add
+    load to Envoy. Request rates are taken from the counters of the last
+    two scrapes.
+    """
+
+    def __init__(self, admin_url: str = et.ENVOY_ADMIN_URL) -> None:
+        self._admin_url = admin_url
+        self._lock = threading.Lock()
+        self._stats: t.Dict[str, CLUSTER_STATS_TYPE] = {}
+        self._collected_at: t.Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._admin_url)
+
+    def start(self) -> None:
+        if not self.enabled:
+            return
+
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.collect(time.time())
+            except Exception:
+                LOG.exception("Failed to collect the stats of Envoy.")
+            time.sleep(ENVOY_STATS_INTERVAL_SECONDS)
+
+    def collect(self, now: float) -> None:
+        stats = fetch_stats(self._admin_url)
+        with self._lock:
+            previous, collected_at = self._stats, self._collected_at
+
+        add_rates(stats,
+                  previous,
+                  now - collected_at if collected_at is not None else None)
+        with self._lock:
+            self._stats = stats
+            self._collected_at = now
+
+    def get(self, cluster_name: str) \
+            -> t.Tuple[t.Optional[CLUSTER_STATS_TYPE], t.Optional[float]]:
+        with self._lock:
+            return self._stats.get(cluster_name), self._collected_at
@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import threading
+import time
+import typing as t
+import urllib.request
+
+import database.repository as r
+import xds_server as xs
+
+LOG = logging.getLogger(__name__)
+
+# Admin of Envoy polled for the applied config, none without it.
+try:
+    ENVOY_ADMIN_URL = os.environ["ENVOY_ADMIN_URL"]
+except KeyError:
+    ENVOY_ADMIN_URL = ""
+
+try:
+    ENVOY_POLL_INTERVAL_SECONDS = \
+        float(os.environ["ENVOY_POLL_INTERVAL_SECONDS"])
+except KeyError:
+    ENVOY_POLL_INTERVAL_SECONDS = 0.5
+
+# Operations not applied by Envoy within the time are given up.
+try:
+    ENVOY_ACK_TIMEOUT_SECONDS = float(os.environ["ENVOY_ACK_TIMEOUT_SECONDS"])
+except KeyError:
+    ENVOY_ACK_TIMEOUT_SECONDS = 30.0
+
+ADMIN_TIMEOUT_SECONDS = 2
+
+ENVOY_ACKED = "acked"
+ENVOY_REJECTED = "rejected"
+ENVOY_TIMEOUT = "timeout"
+
+XDS_LDS = "lds"
+XDS_CDS = "cds"
+XDS_EDS = "eds"
+
+# Config version by xDS type.
+VERSIONS_TYPE = t.Dict[str, int]
+# Version and error rejected by xDS type.
+REJECTED_TYPE = t.Dict[str, t.Tuple[int, str]]
+# Versions applied and rejected by the nodes of a config set.
+APPLIED_TYPE = t.Dict[str, t.Tuple[VERSIONS_TYPE, REJECTED_TYPE]]
+FETCH_TYPE = t.Callable[[], APPLIED_TYPE]
+
+CONFIG_DUMP_TYPES = {
+    "ListenersConfigDump": XDS_LDS,
+    "ClustersConfigDump": XDS_CDS,
+    "EndpointsConfigDump": XDS_EDS
+}
+ADS_TYPES = {
+    xs.TYPE_LISTENER: XDS_LDS,
+    xs.TYPE_CLUSTER: XDS_CDS,
+    xs.TYPE_LOAD_ASSIGNMENT: XDS_EDS
+}
+
+
+def _to_version(version_info: t.Any) -> t.Optional[int]:
+    try:
+        return int(version_info)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_config_dump(
+        dump: t.Dict[str, t.Any]) -> VERSIONS_TYPE:
+    versions: VERSIONS_TYPE = {}
+    for config in dump.get("configs", []):
+        xds_type = CONFIG_DUMP_TYPES.get(config.get("@type", "")
+                                         .rsplit(".", 1)[-1])
+        if xds_type is None:
+            continue
+
+        if xds_type == XDS_EDS:
+            # Load assignments are loaded per cluster from the same file.
+            endpoint_versions = [
+                _to_version(endpoint_config.get("version_info"))
+                for endpoint_config
+                in config.get("dynamic_endpoint_configs", [])
+            ]
+            version = max((v for v in endpoint_versions if v is not None),
+                          default=None)
+        else:
+            version = _to_version(config.get("version_info"))
+
+        if version is not None:
+            versions[xds_type] = version
+    return versions
+
+
+def fetch_admin(admin_url: str = ENVOY_ADMIN_URL) -> APPLIED_TYPE:
+    # A rejected file is left out of the dump, so it is found only by
+    # the timeout. Envoy of the admin reads the files of the whole config.
+    with urllib.request.urlopen(admin_url + "/config_dump?include_eds",
+                                timeout=ADMIN_TIMEOUT_SECONDS) as response:
+        dump: t.Dict[str, t.Any] = json.loads(response.read())
+    return {xs.DEFAULT_CONFIG_SET: (parse_config_dump(dump), {})}
+
+
+def add_applied(versions: VERSIONS_TYPE,
+                rejected: REJECTED_TYPE,
+                xds_type: str,
+                version: int,
+                error: t.Optional[str] = None) -> None:
+    # A version is applied when every node acknowledged it, and rejected
+    # when any node did not.
+    if error is not None:
+        if version > rejected.get(xds_type, (-1, ""))[0]:
+            rejected[xds_type] = (version, error)
+    else:
+        versions[xds_type] = min(versions.get(xds_type, version), version)
+
+
+def fetch_ads(ads: xs.AdsServer) -> APPLIED_TYPE:
+    applied: APPLIED_TYPE = {}
+    for acks in ads.get_all_acks().values():
+        for type_url, ack in acks.items():
+            version = _to_version(ack["version"])
+            if version is None:
+                continue
+
+            versions, rejected = applied.setdefault(
+                ack["config_set"] or xs.DEFAULT_CONFIG_SET, ({}, {}))
+            add_applied(versions,
+                        rejected,
+                        ADS_TYPES[type_url],
+                        version,
+                        (ack["error"] or "")
+                        if ack["status"] == xs.ACK_NACKED else None)
+    return applied
+
+
+def get_applied(
+        applied: APPLIED_TYPE,
+        config_sets: t.List[str]) -> t.Tuple[VERSIONS_TYPE, REJECTED_TYPE]:
+    # Nodes of the config sets the change was not published to stay at
+    # the versions before it.
+    versions: VERSIONS_TYPE = {}
+    rejected: REJECTED_TYPE = {}
+    for config_set in config_sets:
+        set_versions, set_rejected = applied.get(config_set, ({}, {}))
+        for xds_type, version in set_versions.items():
+            add_applied(versions, rejected, xds_type, version)
+        for xds_type, (version, error) in set_rejected.items():
+            add_applied(versions, rejected, xds_type, version, error)
+    return versions, rejected
+
+
+def is_applied(target: VERSIONS_TYPE,
+               applied: VERSIONS_TYPE,
+               partial_eds: bool = False) -> bool:
+    for xds_type, version in target.items():
+        default = version if partial_eds and xds_type == XDS_EDS else -1
+        if applied.get(xds_type, default) < version:
+            return False
+    return True
+
+
+def get_rejected_error(target: VERSIONS_TYPE,
+                       rejected: REJECTED_TYPE) -> t.Optional[str]:
+    for xds_type, version in target.items():
+        rejected_version, error = rejected.get(xds_type, (-1, ""))
+        if rejected_version >= version:
+            return error
+    return None
+
+
+class EnvoyTracker:
+    """Records when Envoy applies the config versions of the operations.
+
+    Operations saved together are tracked by the versions of the xDS
+    types they changed, and versions only grow, so the oldest ones are
+    settled first. Only the nodes of the config sets the change was
+    published to are compared. Load assignments are dumped by the admin
+    only for the clusters, so with partial_eds they are taken as applied
+    while Envoy has none.
+    """
+
+    def __init__(self,
+                 repository: r.Repository,
+                 fetch: FETCH_TYPE,
+                 partial_eds: bool = False) -> None:
+        self._repository = repository
+        self._fetch = fetch
+        self._partial_eds = partial_eds
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # Target versions, config sets, time written and operation IDs of
+        # the batches.
+        self._pending: t.List[t.Tuple[VERSIONS_TYPE,
+                                      t.List[str],
+                                      float,
+                                      t.List[str]]] = []
+
+    def track(self,
+              operation_ids: t.List[str],
+              target: VERSIONS_TYPE,
+              written_at: float,
+              config_sets: t.Optional[t.List[str]] = None) -> None:
+        if not operation_ids or not target:
+            return
+
+        if config_sets is None:
+            config_sets = [xs.DEFAULT_CONFIG_SET]
+        with self._lock:
+            self._pending.append((target,
+                                  config_sets,
+                                  written_at,
+                                  operation_ids))
+        self._wakeup.set()
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if not self._pending:
+                    self._wakeup.clear()
+                    continue
+
+            try:
+                self.check(self._fetch(), time.time())
+            except Exception:
+                LOG.exception("Failed to check the config applied by Envoy.")
+            time.sleep(ENVOY_POLL_INTERVAL_SECONDS)
+
+    def check(self, applied_by_set: APPLIED_TYPE, now: float) -> None:
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+
+        remaining = []
+        for target, config_sets, written_at, operation_ids in pending:
+            applied, rejected = get_applied(applied_by_set, config_sets)
+            fields: t.Dict[str, t.Union[str, float]]
+            error = get_rejected_error(target, rejected)
+            if error is not None:
+                fields = {"envoy_status": ENVOY_REJECTED,
+                          "envoy_error": error}
+            elif is_applied(target, applied, self._partial_eds):
+                fields = {"envoy_status": ENVOY_ACKED,
+                          "envoy_acked_at": now}
+            elif now - written_at > ENVOY_ACK_TIMEOUT_SECONDS:
+                fields = {"envoy_status": ENVOY_TIMEOUT}
+            else:
+                remaining.append((target,
+                                  config_sets,
+                                  written_at,
+                                  operation_ids))
+                continue
+
+            if fields["envoy_status"] != ENVOY_ACKED:
+                LOG.warning("Envoy did not apply operations %s: %s",
+                            ",".join(operation_ids), fields["envoy_status"])
+            for operation_id in operation_ids:
+                self._repository.update_operation(operation_id, fields)
+
+        with self._lock:
+            self._pending[:0] = remaining
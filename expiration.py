@@ -0,0 +1,94 @@
+import heapq
+import json
+import typing as t
+
+import compaction
+import requests as req
+
+HEAP_ENTRY_TYPE = t.Tuple[float, str]
+
+
+def make_removal(request: req.REQUEST_TYPE) -> req.REQUEST_TYPE:
+    removal = {key: value for key, value in request.items()
+               if key != req.EXPIRES_AT_KEY}
+    removal[req.MODE_KEY] = req.MODE_KEY_REMOVE
+    return removal
+
+
+class ExpirationTimer:
+    """Keeps deadlines of the endpoints and servers added with TTL.
+
+    Deadlines are kept in a heap, so taking the expired ones costs by
+    their number. A deadline replaced or cancelled is left in the heap and
+    skipped when it comes to the top.
+    """
+
+    def __init__(self) -> None:
+        self._heap: t.List[HEAP_ENTRY_TYPE] = []
+        # Deadline of a resource by its removal request in JSON, which is
+        # found from the requests on the resource by the key.
+        self._deadlines: t.Dict[str, float] = {}
+        self._removals: t.Dict[compaction.KEY_TYPE, str] = {}
+
+    def load(self, expirations: t.Dict[str, float]) -> None:
+        self._deadlines = {}
+        self._removals = {}
+        for removal_json, expires_at in expirations.items():
+            key = compaction.get_key(json.loads(removal_json))
+            if key is not None:
+                self._deadlines[removal_json] = expires_at
+                self._removals[key] = removal_json
+
+        self._heap = [(expires_at, removal_json)
+                      for removal_json, expires_at in self._deadlines.items()]
+        heapq.heapify(self._heap)
+
+    def track(
+            self,
+            applied: t.List[req.REQUEST_TYPE]
+    ) -> t.Tuple[t.Dict[str, float], t.List[str]]:
+        """Updates the deadlines by the applied requests.
+
+        Returns the deadlines set and the ones cancelled to save them.
+        An add without TTL or a remove cancels the deadline of the resource.
+        """
+        added: t.Dict[str, float] = {}
+        cancelled: t.List[str] = []
+        for request in applied:
+            key = compaction.get_key(request)
+            if key is None:
+                continue
+
+            previous: t.Optional[str] = self._removals.pop(key, None)
+            if previous is not None:
+                del self._deadlines[previous]
+                added.pop(previous, None)
+                cancelled.append(previous)
+
+            expires_at: t.Optional[float] = request.get(req.EXPIRES_AT_KEY)
+            if request[req.MODE_KEY] != req.MODE_KEY_ADD \
+                    or expires_at is None:
+                continue
+
+            removal_json = json.dumps(make_removal(request), sort_keys=True)
+            self._deadlines[removal_json] = expires_at
+            self._removals[key] = removal_json
+            heapq.heappush(self._heap, (expires_at, removal_json))
+            added[removal_json] = expires_at
+            if removal_json in cancelled:
+                cancelled.remove(removal_json)
+
+        return added, cancelled
+
+    def pop_expired(self, now: float) -> t.List[str]:
+        expired: t.List[str] = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, removal_json = heapq.heappop(self._heap)
+            if self._deadlines.get(removal_json) != expires_at:
+                continue
+
+            del self._deadlines[removal_json]
+            key = compaction.get_key(json.loads(removal_json))
+            self._removals.pop(key, None)
+            expired.append(removal_json)
+        return expired
@@ -0,0 +1,83 @@
+import argparse
+import json
+import typing as t
+
+import tornado.httpclient
+import tornado.ioloop
+
+CHUNK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 3600
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Import endpoints and servers from a NDJSON file.")
+    parser.add_argument("file",
+                        help="NDJSON file exported by /v1/export.")
+    parser.add_argument("--url",
+                        default="http://localhost:8888",
+                        help="Base URL of the API server.")
+    parser.add_argument("--lane",
+                        default="bulk",
+                        choices=["emergency", "interactive", "bulk"],
+                        help="Queue lane of the imported batches.")
+    parser.add_argument("--wait",
+                        action="store_true",
+                        help="Wait until every imported batch is applied.")
+    return parser.parse_args()
+
+
+async def import_file(url: str,
+                      path: str,
+                      lane: str) -> t.Dict[str, t.Any]:
+    async def body_producer(write: t.Callable) -> None:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await write(chunk)
+
+    client = tornado.httpclient.AsyncHTTPClient()
+    response = await client.fetch(url + "/v1/import?lane=" + lane,
+                                  method="POST",
+                                  headers={"Content-Type":
+                                           "application/x-ndjson"},
+                                  body_producer=body_producer,
+                                  request_timeout=REQUEST_TIMEOUT,
+                                  raise_error=False)
+    return json.loads(response.body)
+
+
+async def wait_operations(url: str,
+                          operation_ids: t.List[str]) -> t.List[str]:
+    client = tornado.httpclient.AsyncHTTPClient()
+
+    statuses = []
+    for operation_id in operation_ids:
+        while True:
+            response = await client.fetch(
+                url + "/v1/operations/" + operation_id + "?wait=60s",
+                request_timeout=REQUEST_TIMEOUT)
+            operation = json.loads(response.body)
+            if operation["status"] != "pending":
+                break
+        statuses.append(operation["status"])
+
+    return statuses
+
+
+async def main() -> None:
+    args = parse_args()
+
+    result = await import_file(args.url, args.file, args.lane)
+    print(json.dumps(result))
+
+    if args.wait:
+        statuses = await wait_operations(args.url, result["operation_ids"])
+        for operation_id, status in zip(result["operation_ids"], statuses):
+            print(operation_id, status)
+
+
+if __name__ == "__main__":
+    tornado.ioloop.IOLoop.current().run_sync(main)
@@ -0,0 +1,216 @@
+import logging
+import os
+import threading
+import time
+import typing as t
+
+import database.repository as r
+import envoy_stats as es
+import envoy_tracker as et
+import requests as req
+
+LOG = logging.getLogger(__name__)
+
+# Servers are weighted by their errors once per interval, 0 disables it.
+try:
+    WEIGHT_INTERVAL_SECONDS = float(os.environ["WEIGHT_INTERVAL_SECONDS"])
+except KeyError:
+    WEIGHT_INTERVAL_SECONDS = 0.0
+
+# Servers with fewer requests in an interval keep their weight, and their
+# requests are added up over the intervals until there are enough.
+try:
+    WEIGHT_MIN_REQUESTS = int(os.environ["WEIGHT_MIN_REQUESTS"])
+except KeyError:
+    WEIGHT_MIN_REQUESTS = 20
+
+# A weight is lowered only when the target is the step or more below it.
+try:
+    WEIGHT_LOWER_THRESHOLD = int(os.environ["WEIGHT_LOWER_THRESHOLD"])
+except KeyError:
+    WEIGHT_LOWER_THRESHOLD = 20
+
+# A weight is raised only when the target is the step or more above it,
+# or the server has no errors at all.
+try:
+    WEIGHT_RAISE_THRESHOLD = int(os.environ["WEIGHT_RAISE_THRESHOLD"])
+except KeyError:
+    WEIGHT_RAISE_THRESHOLD = 10
+
+# A weight is raised by at most the step in an interval, so a recovering
+# server takes back its traffic gradually.
+try:
+    WEIGHT_RAISE_STEP = int(os.environ["WEIGHT_RAISE_STEP"])
+except KeyError:
+    WEIGHT_RAISE_STEP = 20
+
+WEIGHT_MAX = 100
+# Degraded servers keep a share of the traffic to show their recovery.
+WEIGHT_MIN = 5
+# Weight lost by the ratio of errors, 20% of errors takes all of it.
+ERROR_PENALTY = 5.0
+# Weight of the servers Envoy is given none.
+ENVOY_DEFAULT_WEIGHT = 1
+
+STATS_TYPE = t.Dict[str, t.Dict[str, es.SERVER_STATS_TYPE]]
+SERVER_WEIGHT_TYPE = t.Tuple[str, int, t.Optional[int]]
+
+
+def get_target_weight(
+        server: es.SERVER_STATS_TYPE,
+        previous: t.Optional[es.SERVER_STATS_TYPE]) -> t.Optional[int]:
+    """Returns the weight by the errors since the previous stats,
+    None without enough requests to tell.
+    """
+    if previous is None:
+        return None
+
+    # Envoy has no latency of a host, so timeouts stand in for it.
+    requests = server["rq_total"] - previous["rq_total"]
+    errors = server["rq_error"] - previous["rq_error"] \
+        + server["rq_timeout"] - previous["rq_timeout"]
+    if requests < WEIGHT_MIN_REQUESTS or errors < 0:
+        return None
+
+    error_ratio = min(1.0, errors / requests)
+    weight = round(WEIGHT_MAX * (1 - ERROR_PENALTY * error_ratio))
+    return max(WEIGHT_MIN, weight)
+
+
+def get_next_weight(current: int, target: t.Optional[int]) -> int:
+    # Lowered at once, raised in steps, and kept within the thresholds,
+    # so a server failing now and then does not swing between them.
+    if target is None:
+        return current
+    if current - target >= WEIGHT_LOWER_THRESHOLD:
+        return target
+    if target - current >= WEIGHT_RAISE_THRESHOLD \
+            or (target == WEIGHT_MAX and current < target):
+        return min(target, current + WEIGHT_RAISE_STEP)
+    return current
+
+
+def get_baseline(
+        server: es.SERVER_STATS_TYPE,
+        previous: t.Optional[es.SERVER_STATS_TYPE]
+) -> es.SERVER_STATS_TYPE:
+    """Returns the stats the next interval of the server is counted from."""
+    if previous is not None \
+            and 0 <= server["rq_total"] - previous["rq_total"] \
+            < WEIGHT_MIN_REQUESTS:
+        return previous
+    return server
+
+
+def get_weights(
+        servers: t.List[es.SERVER_STATS_TYPE],
+        previous: t.Dict[str, es.SERVER_STATS_TYPE]
+) -> t.Optional[t.List[SERVER_WEIGHT_TYPE]]:
+    """Returns new weights of the servers, None to keep the current ones.
+
+    Equal weights are given back to Envoy as no weights at all, so the
+    servers without weights are at the full weight while none is set.
+    """
+    if len(servers) < 2:
+        return None
+
+    weighted = any(server["weight"] != ENVOY_DEFAULT_WEIGHT
+                   for server in servers)
+    current: t.List[int] = []
+    weights: t.List[int] = []
+    for server in servers:
+        current_weight = server["weight"] if weighted else WEIGHT_MAX
+        target_weight = get_target_weight(
+            server, previous.get(server["server_uuid"]))
+
+        current.append(current_weight)
+        weights.append(get_next_weight(current_weight, target_weight))
+
+    if weights == current:
+        return None
+
+    if len(set(weights)) == 1:
+        if not weighted:
+            return None
+        return [(server["address"], server["port"], None)
+                for server in servers]
+
+    return [(server["address"], server["port"], weight)
+            for server, weight in zip(servers, weights)]
+
+
+class WeightController:
+    """Weights the servers of the endpoints by their errors seen by Envoy.
+
+    The weights are changed by a request queued with the others, so they
+    are journaled and applied in order. Every change of an interval is
+    queued as a single request, and none while the last one is pending,
+    so Envoy is updated at most once per interval.
+    """
+
+    def __init__(self,
+                 repository: r.Repository,
+                 admin_url: str = et.ENVOY_ADMIN_URL) -> None:
+        self._repository = repository
+        self._admin_url = admin_url
+        self._previous: STATS_TYPE = {}
+        self._operation_id: t.Optional[str] = None
+        # A thread of an earlier leadership stops by the term.
+        self._term = 0
+
+    @property
+    def enabled(self) -> bool:
+        return WEIGHT_INTERVAL_SECONDS > 0 and bool(self._admin_url)
+
+    def start(self, is_leader: t.Callable[[], bool]) -> None:
+        self._term += 1
+        thread = threading.Thread(target=self._run,
+                                  args=(self._term, is_leader),
+                                  daemon=True)
+        thread.start()
+
+    def _run(self, term: int, is_leader: t.Callable[[], bool]) -> None:
+        self._previous = {}
+        while term == self._term and is_leader():
+            try:
+                self.adjust(es.fetch_stats(self._admin_url))
+            except Exception:
+                LOG.exception("Failed to weight the servers.")
+            time.sleep(WEIGHT_INTERVAL_SECONDS)
+
+    def _is_pending(self) -> bool:
+        if self._operation_id is None:
+            return False
+
+        operation: t.Optional[r.OPERATION_TYPE] = \
+            self._repository.get_operation(self._operation_id)
+        return operation is not None \
+            and operation["status"] == r.OPERATION_PENDING
+
+    def adjust(self,
+               stats: t.Dict[str, es.CLUSTER_STATS_TYPE]) -> t.Optional[str]:
+        weights: t.Dict[str, t.List[SERVER_WEIGHT_TYPE]] = {}
+        if not self._is_pending():
+            for cluster_name, cluster in stats.items():
+                servers = get_weights(cluster["servers"],
+                                      self._previous.get(cluster_name, {}))
+                if servers is not None:
+                    weights[cluster_name] = servers
+
+        self._previous = {
+            cluster_name: {
+                server["server_uuid"]: get_baseline(
+                    server,
+                    self._previous.get(cluster_name, {})
+                    .get(server["server_uuid"]))
+                for server in cluster["servers"]}
+            for cluster_name, cluster in stats.items()
+        }
+        if not weights:
+            return None
+
+        wt_req = req.Weight(weights)
+        self._operation_id = self._repository.add_queue(wt_req.get_json())
+        LOG.info("Operation %s weights the servers of %d endpoints.",
+                 self._operation_id, len(weights))
+        return self._operation_id
@@ -0,0 +1,7 @@
+import database.repository as r
+
+if __name__ == "__main__":
+    redis = r.RedisRepository()
+    lds_migrated, eds_migrated = redis.migrate_uuid_db()
+    print("Migrated {} routes and {} clusters.".format(lds_migrated,
+                                                       eds_migrated))
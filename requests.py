@@ -1,4 +1,5 @@
 import json
+import re
 import typing as t
 
 # Endpoints request type
@@ -24,12 +25,31 @@ REQUEST_TYPE = t.Union[ENDPOINT_REQUEST_TYPE,
                        DELETE_ENDPOINT_REQUEST_TYPE,
                        SERVER_REQUEST_TYPE]
 
+# Server set request type
+SERVER_SET_REQUEST_TYPE = t.Dict[str, t.Union[str,
+                                              t.List[SERVERS_REQUEST_TYPE]]]
+
+# Batch request type
+BATCH_REQUEST_TYPE = t.Dict[str, t.Union[str, t.List[REQUEST_TYPE]]]
+
+# Weight request type
+WEIGHT_VALUE_TYPE = t.Dict[str, t.Union[str, int, None]]
+WEIGHT_REQUEST_TYPE = \
+    t.Dict[str, t.Union[str, t.Dict[str, t.List[WEIGHT_VALUE_TYPE]]]]
+
 MODE_KEY = "mode"
 MODE_KEY_ADD = "add"
 MODE_KEY_REMOVE = "remove"
+MODE_KEY_BATCH = "batch"
+MODE_KEY_REPLACE = "replace"
+MODE_KEY_DRAIN = "drain"
+MODE_KEY_EXPIRE = "expire"
+MODE_KEY_WEIGHT = "weight"
 
 IDX_KEY = "idx"
 ENDPOINT_UUID = "endpoint_uuid"
+# UNIX time when the worker removes the added endpoint or server.
+EXPIRES_AT_KEY = "expires_at"
 
 # Endpoints request keys
 ENDPOINTS_CASE_NAME = "endpoints"
@@ -37,12 +57,28 @@ PORT_VALUE_KEY = "port_value"
 ROUTE_KEY = "route"
 PREFIX_KEY = "prefix"
 REQUEST_HEADERS_TO_ADD_KEY = "request_headers_to_add"
+# Config sets the endpoint is rendered to, all of them without it.
+CONFIG_SETS_KEY = "config_sets"
+# Names of the config sets are the names of their directories.
+CONFIG_SET_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
 
 # Servers request keys
 SERVERS_CASE_NAME = "servers"
 PORT_KEY = "port"
 ADDRESS_KEY = "address"
 
+# Server set request keys
+SERVER_SET_CASE_NAME = "server_set"
+
+# Batch request keys
+OPERATIONS_KEY = "operations"
+UPSERT_KEY = "upsert"
+
+# Weight request keys
+WEIGHTS_KEY = "weights"
+# Load balancing weight of a server, None for the default of Envoy.
+WEIGHT_KEY = "weight"
+
 
 class InvalidParameter(Exception):
     def __init__(self, message: str) -> None:
@@ -56,7 +92,9 @@ class Endpoint:
                  port_value: str,
                  route: str,
                  host_header: str,
-                 endpoint_uuid: str) -> None:
+                 endpoint_uuid: str,
+                 expires_at: t.Optional[float] = None,
+                 config_sets: t.Optional[t.List[str]] = None) -> None:
         try:
             int(port_value)
         except ValueError as e:
@@ -77,13 +115,28 @@ class Endpoint:
         if not endpoint_uuid or len(endpoint_uuid) != 32:
             raise InvalidParameter("endpoint_uuid")
 
+        if expires_at is not None and mode != MODE_KEY_ADD:
+            raise InvalidParameter("expires_at")
+
+        if config_sets is not None \
+                and (mode != MODE_KEY_ADD
+                     or not isinstance(config_sets, list)
+                     or not config_sets
+                     or not all(isinstance(name, str)
+                                and CONFIG_SET_NAME_PATTERN.match(name)
+                                for name in config_sets)):
+            raise InvalidParameter("config_sets")
+
         self._mode = mode
         self._port_value = str(port_value)
         self._route = route
         self._host_header = host_header
         self._endpoint_uuid = endpoint_uuid
+        self._expires_at = expires_at
+        self._config_sets = sorted(set(config_sets)) \
+            if config_sets is not None else None
 
-    def get_json(self) -> str:
+    def get_dict(self) -> ENDPOINT_REQUEST_TYPE:
         request = {
             MODE_KEY: self._mode,
             ENDPOINTS_CASE_NAME: {
@@ -99,7 +152,14 @@ class Endpoint:
             },
             ENDPOINT_UUID: self._endpoint_uuid
         }
-        return json.dumps(request)
+        if self._config_sets is not None:
+            request[ENDPOINTS_CASE_NAME][CONFIG_SETS_KEY] = self._config_sets
+        if self._expires_at is not None:
+            request[EXPIRES_AT_KEY] = self._expires_at
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
 
 
 class Server:
@@ -107,7 +167,8 @@ class Server:
                  mode: str,
                  address: str,
                  port: int,
-                 endpoint_uuid: str) -> None:
+                 endpoint_uuid: str,
+                 expires_at: t.Optional[float] = None) -> None:
         super().__init__()
 
         if mode not in (MODE_KEY_ADD, MODE_KEY_REMOVE):
@@ -127,12 +188,16 @@ class Server:
         if not endpoint_uuid or len(endpoint_uuid) != 32:
             raise InvalidParameter("endpoint_uuid")
 
+        if expires_at is not None and mode != MODE_KEY_ADD:
+            raise InvalidParameter("expires_at")
+
         self._mode = mode
         self._port = int(port)
         self._address = address
         self._endpoint_uuid = endpoint_uuid
+        self._expires_at = expires_at
 
-    def get_json(self) -> str:
+    def get_dict(self) -> SERVER_REQUEST_TYPE:
         request = {
             MODE_KEY: self._mode,
             SERVERS_CASE_NAME: {
@@ -141,4 +206,146 @@ class Server:
             },
             ENDPOINT_UUID: self._endpoint_uuid
         }
-        return json.dumps(request)
+        if self._expires_at is not None:
+            request[EXPIRES_AT_KEY] = self._expires_at
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
+
+
+class ServerSet:
+    def __init__(self,
+                 servers: t.List[t.Tuple[str, int]],
+                 endpoint_uuid: str) -> None:
+        current_servers: t.List[t.Tuple[str, int]] = []
+        for address, port in servers:
+            try:
+                int(port)
+            except (TypeError, ValueError) as e:
+                raise InvalidParameter("port") from e
+
+            if not address or "." not in address:
+                raise InvalidParameter("address")
+
+            current_servers.append((address, int(port)))
+
+        if not endpoint_uuid or len(endpoint_uuid) != 32:
+            raise InvalidParameter("endpoint_uuid")
+
+        self._servers = current_servers
+        self._endpoint_uuid = endpoint_uuid
+
+    def get_dict(self) -> SERVER_SET_REQUEST_TYPE:
+        request = {
+            MODE_KEY: MODE_KEY_REPLACE,
+            SERVER_SET_CASE_NAME: [
+                {PORT_KEY: port, ADDRESS_KEY: address}
+                for address, port in self._servers
+            ],
+            ENDPOINT_UUID: self._endpoint_uuid
+        }
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
+
+
+class Drain:
+    def __init__(self,
+                 address: str,
+                 port: int) -> None:
+        if not port:
+            raise InvalidParameter("port")
+
+        try:
+            int(port)
+        except ValueError as e:
+            raise InvalidParameter("port") from e
+
+        if not address or "." not in address:
+            raise InvalidParameter("address")
+
+        self._port = int(port)
+        self._address = address
+
+    def get_dict(self) -> SERVER_REQUEST_TYPE:
+        request = {
+            MODE_KEY: MODE_KEY_DRAIN,
+            SERVERS_CASE_NAME: {
+                PORT_KEY: self._port,
+                ADDRESS_KEY: self._address
+            }
+        }
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
+
+
+class Batch:
+    def __init__(self,
+                 operations: t.List[t.Union[Endpoint, Server]],
+                 upsert: bool = False) -> None:
+        if not operations:
+            raise InvalidParameter("operations")
+
+        self._operations = operations
+        self._upsert = upsert
+
+    def get_dict(self) -> BATCH_REQUEST_TYPE:
+        request = {
+            MODE_KEY: MODE_KEY_BATCH,
+            OPERATIONS_KEY: [operation.get_dict()
+                             for operation in self._operations],
+            UPSERT_KEY: self._upsert
+        }
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
+
+
+class Expire:
+    def __init__(self, operations: t.List[REQUEST_TYPE]) -> None:
+        if not operations:
+            raise InvalidParameter("operations")
+
+        self._operations = operations
+
+    def get_dict(self) -> BATCH_REQUEST_TYPE:
+        request = {
+            MODE_KEY: MODE_KEY_EXPIRE,
+            OPERATIONS_KEY: self._operations
+        }
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
+
+
+class Weight:
+    def __init__(
+            self,
+            weights: t.Dict[str, t.List[t.Tuple[str, int, t.Optional[int]]]]
+    ) -> None:
+        if not weights:
+            raise InvalidParameter("weights")
+
+        self._weights = weights
+
+    def get_dict(self) -> WEIGHT_REQUEST_TYPE:
+        request = {
+            MODE_KEY: MODE_KEY_WEIGHT,
+            WEIGHTS_KEY: {
+                endpoint_uuid: [
+                    {ADDRESS_KEY: address, PORT_KEY: port, WEIGHT_KEY: weight}
+                    for address, port, weight in servers
+                ]
+                for endpoint_uuid, servers in self._weights.items()
+            }
+        }
+        return request
+
+    def get_json(self) -> str:
+        return json.dumps(self.get_dict())
@@ -0,0 +1,50 @@
+import typing as t
+
+import database.repository as r
+
+# A lane with pending requests takes turns in proportion to its weight,
+# so the lower lanes keep progressing while the higher ones are busy.
+LANE_WEIGHTS: t.Dict[str, int] = {
+    r.LANE_EMERGENCY: 16,
+    r.LANE_INTERACTIVE: 4,
+    r.LANE_BULK: 1
+}
+
+
+class LaneScheduler:
+    """Orders pending requests of the lanes by smooth weighted round robin.
+
+    Requests keep their order within a lane. Credits of the lanes are
+    carried over between the calls, so the turns stay fair across batches.
+    """
+
+    def __init__(self, weights: t.Dict[str, int] = LANE_WEIGHTS) -> None:
+        self._weights = weights
+        self._credits: t.Dict[str, int] = {lane: 0 for lane in weights}
+
+    def schedule(self,
+                 pending: t.Dict[str, t.List[r.QUEUE_ENTRY_TYPE]],
+                 count: int) -> t.List[r.QUEUE_ENTRY_TYPE]:
+        queues: t.Dict[str, t.List[r.QUEUE_ENTRY_TYPE]] = {
+            lane: list(reversed(entries))
+            for lane, entries in pending.items() if entries
+        }
+
+        scheduled: t.List[r.QUEUE_ENTRY_TYPE] = []
+        while queues and len(scheduled) < count:
+            total = 0
+            for lane in queues:
+                self._credits[lane] += self._weights[lane]
+                total += self._weights[lane]
+
+            # Ties go to the higher lane.
+            lane = max(queues,
+                       key=lambda name: (self._credits[name],
+                                         -r.LANES.index(name)))
+            self._credits[lane] -= total
+
+            scheduled.append(queues[lane].pop())
+            if not queues[lane]:
+                del queues[lane]
+
+        return scheduled
@@ -0,0 +1,19 @@
+import json
+import os
+
+import entity.conf as c
+
+ENVOY_DIR = os.path.join(os.path.dirname(__file__), "..", "envoy")
+
+
+def load_conf() -> c.EnvoyConf:
+    """Returns the config of the example Envoy files."""
+    conf_dict = {}
+    for xds_type in ("lds", "cds", "eds"):
+        with open(os.path.join(ENVOY_DIR, xds_type + ".json")) as f:
+            conf_dict[xds_type] = json.load(f)
+
+    # Loaded into the shared resources, so a copy is taken apart.
+    conf = c.EnvoyConf()
+    conf.load_from_db(conf_dict)
+    return conf.copy_conf()
@@ -0,0 +1,41 @@
+import os
+import unittest
+import zlib
+
+import database.codec as cc
+
+# Snapshots in the storage are decoded by this dictionary.
+ZDICT_ADLER32 = 0x45ccdb58
+
+
+class CodecTest(unittest.TestCase):
+    def setUp(self) -> None:
+        # Config files of the example Envoy stand in for a snapshot.
+        path = os.path.join(os.path.dirname(__file__), "..", "envoy")
+        self.data = b""
+        for name in ("lds.json", "cds.json", "eds.json"):
+            with open(os.path.join(path, name), "rb") as f:
+                self.data += f.read()
+
+    def test_round_trip(self) -> None:
+        for name in (cc.CODEC_JSON, cc.CODEC_ZLIB, cc.CODEC_ZDICT):
+            encoded = cc.encode(cc.get_codec(name), self.data)
+            self.assertEqual(cc.decode(encoded), self.data)
+
+    def test_plain_json(self) -> None:
+        self.assertEqual(cc.encode(cc.get_codec(cc.CODEC_JSON), self.data),
+                         self.data)
+        self.assertEqual(cc.decode(self.data), self.data)
+
+    def test_frozen_dictionary(self) -> None:
+        self.assertEqual(zlib.adler32(cc.ZDICT), ZDICT_ADLER32)
+
+    def test_unknown_codec(self) -> None:
+        with self.assertRaises(cc.UnknownCodec):
+            cc.get_codec("lz4")
+        with self.assertRaises(cc.UnknownCodec):
+            cc.decode(cc.HEADER_MAGIC + bytes([255]) + self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import typing as t
+import unittest
+
+import compaction
+import database.repository as r
+import requests as req
+
+ENDPOINT_UUID = "abd9aef89a54956244894f9360ff9ba0"
+
+
+def endpoint(mode: str, host_header: str = "example.com") -> req.REQUEST_TYPE:
+    return req.Endpoint(mode,
+                        "18080",
+                        "/",
+                        host_header,
+                        ENDPOINT_UUID).get_dict()
+
+
+def server(mode: str,
+           address: str = "10.0.0.1",
+           expires_at: t.Optional[float] = None) -> req.REQUEST_TYPE:
+    return req.Server(mode,
+                      address,
+                      80,
+                      ENDPOINT_UUID,
+                      expires_at).get_dict()
+
+
+def compact(
+        *requests: req.REQUEST_TYPE
+) -> t.Tuple[t.List[r.QUEUE_ENTRY_TYPE], t.Dict[str, str]]:
+    return compaction.compact([(str(position), request)
+                               for position, request in enumerate(requests)])
+
+
+class CompactTest(unittest.TestCase):
+    def test_duplicate(self) -> None:
+        survivors, dropped = compact(server(req.MODE_KEY_ADD),
+                                     server(req.MODE_KEY_ADD))
+
+        self.assertEqual([operation_id for operation_id, _ in survivors],
+                         ["0"])
+        self.assertEqual(dropped, {"1": compaction.COMPACTION_DUPLICATE})
+
+    def test_superseded(self) -> None:
+        survivors, dropped = compact(server(req.MODE_KEY_ADD),
+                                     server(req.MODE_KEY_REMOVE),
+                                     server(req.MODE_KEY_ADD))
+
+        self.assertEqual([operation_id for operation_id, _ in survivors],
+                         ["2"])
+        self.assertEqual(dropped, {"0": compaction.COMPACTION_SUPERSEDED,
+                                   "1": compaction.COMPACTION_SUPERSEDED})
+
+    def test_other_servers(self) -> None:
+        survivors, dropped = compact(server(req.MODE_KEY_ADD, "10.0.0.1"),
+                                     server(req.MODE_KEY_ADD, "10.0.0.2"))
+
+        self.assertEqual(len(survivors), 2)
+        self.assertEqual(dropped, {})
+
+    def test_server_with_other_ttl(self) -> None:
+        survivors, dropped = compact(
+            server(req.MODE_KEY_ADD, expires_at=100.0),
+            server(req.MODE_KEY_ADD, expires_at=200.0),
+            server(req.MODE_KEY_ADD))
+
+        self.assertEqual(len(survivors), 3)
+        self.assertEqual(dropped, {})
+
+    def test_endpoint_with_other_values(self) -> None:
+        survivors, dropped = compact(endpoint(req.MODE_KEY_ADD),
+                                     endpoint(req.MODE_KEY_ADD, "other.com"),
+                                     endpoint(req.MODE_KEY_REMOVE),
+                                     endpoint(req.MODE_KEY_ADD))
+
+        self.assertEqual([operation_id for operation_id, _ in survivors],
+                         ["0", "2", "3"])
+        self.assertEqual(dropped, {"1": compaction.COMPACTION_SUPERSEDED})
+
+    def test_not_across_endpoint_and_servers(self) -> None:
+        survivors, dropped = compact(server(req.MODE_KEY_ADD),
+                                     endpoint(req.MODE_KEY_REMOVE),
+                                     server(req.MODE_KEY_ADD))
+
+        self.assertEqual(len(survivors), 3)
+        self.assertEqual(dropped, {})
+
+    def test_not_across_other_modes(self) -> None:
+        drain = req.Drain("10.0.0.1", 80).get_dict()
+        survivors, dropped = compact(server(req.MODE_KEY_ADD),
+                                     drain,
+                                     server(req.MODE_KEY_ADD))
+
+        self.assertEqual(len(survivors), 3)
+        self.assertEqual(dropped, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import database.repository as r
+import requests as req
+from tests import load_conf
+
+ENDPOINT_UUID = r.gen_endpoint_uuid("18080", "/")
+
+
+class ReplaceServersTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conf = load_conf()
+
+    def test_replace(self) -> None:
+        request = req.ServerSet([("10.0.0.1", 80)], ENDPOINT_UUID)
+        added, removed = self.conf.replace_servers(request.get_dict())
+
+        self.assertEqual(added, [("10.0.0.1", 80)])
+        self.assertEqual(removed, [("172.217.175.110", 80)])
+        self.assertEqual(self.conf.eds.version_info, "1")
+
+    def test_removed_endpoint(self) -> None:
+        endpoint = req.Endpoint(req.MODE_KEY_REMOVE,
+                                "18080",
+                                "/",
+                                "example.com",
+                                ENDPOINT_UUID)
+        self.conf.apply(endpoint.get_dict())
+        server = req.Server(req.MODE_KEY_REMOVE,
+                            "172.217.175.110",
+                            80,
+                            ENDPOINT_UUID)
+        self.conf.apply(server.get_dict())
+        eds_version = self.conf.eds.version_info
+
+        request = req.ServerSet([("10.0.0.1", 80)], ENDPOINT_UUID)
+        self.assertEqual(self.conf.replace_servers(request.get_dict()),
+                         ([], []))
+        self.assertEqual(self.conf.eds.resources, [])
+        self.assertEqual(self.conf.eds.version_info, eds_version)
+
+
+if __name__ == "__main__":
+    unittest.main()
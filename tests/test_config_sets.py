@@ -0,0 +1,150 @@
+import tempfile
+import typing as t
+import unittest
+import unittest.mock
+
+import conf_filesystem as cfs
+import config_sets as cs
+import database.repository as r
+import entity.conf as c
+import entity.diff as d
+import requests as req
+from tests import load_conf
+
+ENDPOINT_A = r.gen_endpoint_uuid("18081", "/a")
+ENDPOINT_B = r.gen_endpoint_uuid("18082", "/b")
+ENDPOINT_C = r.gen_endpoint_uuid("18081", "/c")
+NAMES = ["a", "b"]
+
+
+def endpoint(mode: str,
+             port: str,
+             route: str,
+             config_sets: t.Optional[t.List[str]]) -> req.REQUEST_TYPE:
+    return req.Endpoint(mode,
+                        port,
+                        route,
+                        "example.com",
+                        r.gen_endpoint_uuid(port, route),
+                        config_sets=config_sets).get_dict()
+
+
+def server(address: str, endpoint_uuid: str) -> req.REQUEST_TYPE:
+    return req.Server(req.MODE_KEY_ADD, address, 80, endpoint_uuid).get_dict()
+
+
+def by_key(conf: c.EnvoyConf) -> t.Dict[str, t.Dict[str, t.Any]]:
+    """Returns the resources of the config by their stable keys."""
+    return {"lds": {lds_res.port: lds_res.get_dict()
+                    for lds_res in conf.lds.resources},
+            "cds": {cds_res.cluster_name: cds_res.get_dict()
+                    for cds_res in conf.cds.resources},
+            "eds": {eds_res.cluster_name: eds_res.get_dict()
+                    for eds_res in conf.eds.resources},
+            "versions": (conf.lds.version_info,
+                         conf.cds.version_info,
+                         conf.eds.version_info)}
+
+
+class ConfigSetWriterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = unittest.mock.patch.object(
+            cfs, "SETS_DIR", self.directory.name + "/")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.directory.cleanup)
+
+        self.conf = load_conf()
+        self.writer = cs.ConfigSetWriter(NAMES)
+        self.set_confs = {name: set_conf for name, (set_conf, _)
+                          in self.writer.write(self.conf).items()}
+
+    def apply(
+            self,
+            request: req.REQUEST_TYPE
+    ) -> t.Dict[str, t.Tuple[c.EnvoyConf, t.Optional[d.ChangeSet]]]:
+        ports, cluster_names = d.get_touched([request], self.conf)
+        before = d.snapshot(self.conf, ports, cluster_names)
+        self.assertTrue(self.conf.apply(request))
+        changes = d.diff(before,
+                         d.snapshot(self.conf, ports, cluster_names))
+
+        written = self.writer.write(self.conf, changes)
+        for name, (set_conf, _) in written.items():
+            self.set_confs[name] = set_conf
+        self.assert_rendered()
+        return written
+
+    def assert_rendered(self) -> None:
+        # Patched sets hold the same resources as the sets rendered whole.
+        membership = cs.get_membership(self.conf)
+        for name, set_conf in self.set_confs.items():
+            cluster_names = {cluster_name
+                             for cluster_name, sets in membership.items()
+                             if sets is None or name in sets}
+            expected = by_key(self.conf.copy_subset(cluster_names))
+            got = by_key(set_conf)
+            for xds_type in ("lds", "cds", "eds"):
+                self.assertEqual(got[xds_type], expected[xds_type],
+                                 (name, xds_type))
+
+    def test_full_render(self) -> None:
+        # Clusters without sets are rendered to every set.
+        for set_conf in self.set_confs.values():
+            self.assertEqual(by_key(set_conf)["versions"],
+                             by_key(self.conf)["versions"])
+            self.assertEqual(len(set_conf.cds.resources), 1)
+
+    def test_changes_of_the_sets(self) -> None:
+        written = self.apply(endpoint(req.MODE_KEY_ADD, "18081", "/a", ["a"]))
+        self.assertEqual(list(written), ["a"])
+        changes = written["a"][1]
+        self.assertEqual(changes.listeners, {"18081": d.CHANGE_ADDED})
+        self.assertEqual(changes.clusters, {ENDPOINT_A: d.CHANGE_ADDED})
+        self.assertEqual(written["a"][0].cds.version_info,
+                         self.conf.cds.version_info)
+
+        written = self.apply(
+            endpoint(req.MODE_KEY_ADD, "18082", "/b", ["a", "b"]))
+        self.assertEqual(sorted(written), NAMES)
+
+        # The load assignment is made by the first server.
+        written = self.apply(server("10.0.0.1", ENDPOINT_A))
+        self.assertEqual(list(written), ["a"])
+        changes = written["a"][1]
+        self.assertEqual(changes.load_assignments,
+                         {ENDPOINT_A: d.CHANGE_ADDED})
+        self.assertFalse(changes.lds_changed)
+        self.assertFalse(changes.cds_changed)
+
+        self.apply(endpoint(req.MODE_KEY_ADD, "18081", "/c", None))
+        self.apply(server("10.0.0.2", ENDPOINT_C))
+
+    def test_cluster_moved(self) -> None:
+        self.apply(endpoint(req.MODE_KEY_ADD, "18081", "/a", ["a"]))
+        self.apply(endpoint(req.MODE_KEY_ADD, "18081", "/c", ["a", "b"]))
+
+        # The listener of the moved cluster is changed in both sets, while
+        # the change set of the whole config has no change of it.
+        written = self.apply(endpoint(req.MODE_KEY_ADD, "18081", "/a", ["b"]))
+        self.assertEqual(sorted(written), NAMES)
+        self.assertEqual(written["a"][1].clusters,
+                         {ENDPOINT_A: d.CHANGE_REMOVED})
+        self.assertEqual(written["a"][1].listeners,
+                         {"18081": d.CHANGE_MODIFIED})
+        self.assertEqual(written["b"][1].clusters,
+                         {ENDPOINT_A: d.CHANGE_ADDED})
+        self.assertEqual(written["b"][1].listeners,
+                         {"18081": d.CHANGE_MODIFIED})
+
+    def test_endpoint_removed(self) -> None:
+        self.apply(endpoint(req.MODE_KEY_ADD, "18082", "/b", ["b"]))
+        self.apply(server("10.0.0.1", ENDPOINT_B))
+
+        written = self.apply(
+            endpoint(req.MODE_KEY_REMOVE, "18082", "/b", None))
+        self.assertEqual(list(written), ["b"])
+        changes = written["b"][1]
+        self.assertEqual(changes.listeners, {"18082": d.CHANGE_REMOVED})
+        self.assertEqual(changes.clusters, {ENDPOINT_B: d.CHANGE_REMOVED})
@@ -0,0 +1,158 @@
+import unittest
+
+import database.repository as r
+import entity.diff as d
+import requests as req
+from tests import load_conf
+
+# Endpoint and server of the example config.
+PORT = "18080"
+ROUTE = "/"
+ENDPOINT_UUID = r.gen_endpoint_uuid(PORT, ROUTE)
+SERVER = ("172.217.175.110", 80)
+
+
+def endpoint(mode: str, port: str, route: str) -> req.REQUEST_TYPE:
+    return req.Endpoint(mode,
+                        port,
+                        route,
+                        "example.com",
+                        r.gen_endpoint_uuid(port, route)).get_dict()
+
+
+def server(mode: str, address: str, port: int) -> req.REQUEST_TYPE:
+    return req.Server(mode, address, port, ENDPOINT_UUID).get_dict()
+
+
+class DiffTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conf = load_conf()
+
+    def apply(self, request: req.REQUEST_TYPE) -> d.ChangeSet:
+        before = d.snapshot(self.conf)
+        self.assertTrue(self.conf.apply(request))
+        return d.diff(before, d.snapshot(self.conf))
+
+    def test_add_endpoint(self) -> None:
+        changes = self.apply(endpoint(req.MODE_KEY_ADD, "18081", "/a"))
+        endpoint_uuid = r.gen_endpoint_uuid("18081", "/a")
+
+        self.assertEqual(changes.listeners, {"18081": d.CHANGE_ADDED})
+        self.assertEqual(changes.routes, {("18081", "/a"): d.CHANGE_ADDED})
+        self.assertEqual(changes.clusters, {endpoint_uuid: d.CHANGE_ADDED})
+        self.assertTrue(changes.lds_changed)
+        self.assertTrue(changes.cds_changed)
+
+    def test_add_route(self) -> None:
+        changes = self.apply(endpoint(req.MODE_KEY_ADD, PORT, "/a"))
+
+        self.assertEqual(changes.listeners, {PORT: d.CHANGE_MODIFIED})
+        self.assertEqual(changes.routes, {(PORT, "/a"): d.CHANGE_ADDED})
+
+    def test_remove_endpoint(self) -> None:
+        changes = self.apply(endpoint(req.MODE_KEY_REMOVE, PORT, ROUTE))
+
+        self.assertEqual(changes.listeners, {PORT: d.CHANGE_REMOVED})
+        self.assertEqual(changes.routes, {(PORT, ROUTE): d.CHANGE_REMOVED})
+        self.assertEqual(changes.clusters, {ENDPOINT_UUID: d.CHANGE_REMOVED})
+        # Load assignment is left to the removal of its servers.
+        self.assertEqual(changes.load_assignments, {})
+
+    def test_add_server(self) -> None:
+        changes = self.apply(server(req.MODE_KEY_ADD, "10.0.0.1", 80))
+
+        self.assertEqual(changes.load_assignments,
+                         {ENDPOINT_UUID: d.CHANGE_MODIFIED})
+        self.assertEqual(changes.lb_endpoints,
+                         {(ENDPOINT_UUID, "10.0.0.1", 80): d.CHANGE_ADDED})
+        self.assertEqual(changes.listeners, {})
+        self.assertEqual(changes.clusters, {})
+        self.assertFalse(changes.lds_changed)
+        self.assertFalse(changes.cds_changed)
+        self.assertTrue(changes.eds_changed)
+
+    def test_remove_server(self) -> None:
+        changes = self.apply(server(req.MODE_KEY_REMOVE, *SERVER))
+
+        self.assertEqual(changes.lb_endpoints,
+                         {(ENDPOINT_UUID,) + SERVER: d.CHANGE_REMOVED})
+
+    def test_modify_server(self) -> None:
+        before = d.snapshot(self.conf)
+        weight = req.Weight({ENDPOINT_UUID: [SERVER + (50,)]})
+        self.assertTrue(self.conf.set_weights(weight.get_dict()))
+        changes = d.diff(before, d.snapshot(self.conf))
+
+        self.assertEqual(changes.lb_endpoints,
+                         {(ENDPOINT_UUID,) + SERVER: d.CHANGE_MODIFIED})
+        self.assertEqual(changes.load_assignments,
+                         {ENDPOINT_UUID: d.CHANGE_MODIFIED})
+
+    def test_version_only(self) -> None:
+        before = d.snapshot(self.conf)
+        self.conf.lds.set_version_info(
+            str(int(self.conf.lds.version_info) + 1))
+        changes = d.diff(before, d.snapshot(self.conf))
+
+        self.assertTrue(changes.lds_changed)
+        self.assertFalse(changes.cds_changed)
+        self.assertFalse(changes.eds_changed)
+        self.assertFalse(changes.empty)
+        self.assertEqual(changes.listeners, {})
+        self.assertEqual(changes.routes, {})
+
+    def test_unchanged(self) -> None:
+        self.assertTrue(d.diff_conf(self.conf, self.conf.copy_conf()).empty)
+
+    def test_touched_snapshot(self) -> None:
+        generation = d.snapshot(self.conf, set(), {ENDPOINT_UUID})
+
+        self.assertEqual(generation.listeners, {})
+        self.assertEqual(list(generation.clusters), [ENDPOINT_UUID])
+
+
+class GetTouchedTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conf = load_conf()
+
+    def test_endpoint_and_server(self) -> None:
+        self.assertEqual(
+            d.get_touched([endpoint(req.MODE_KEY_ADD, "18081", "/a"),
+                           server(req.MODE_KEY_ADD, "10.0.0.1", 80)],
+                          self.conf),
+            ({"18081"}, {r.gen_endpoint_uuid("18081", "/a"), ENDPOINT_UUID}))
+
+    def test_batch(self) -> None:
+        batch = req.Batch([
+            req.Endpoint(req.MODE_KEY_ADD,
+                         "18081",
+                         "/a",
+                         "example.com",
+                         r.gen_endpoint_uuid("18081", "/a")),
+            req.Server(req.MODE_KEY_REMOVE, *SERVER, ENDPOINT_UUID)
+        ])
+        self.assertEqual(
+            d.get_touched([batch.get_dict()], self.conf),
+            ({"18081"}, {r.gen_endpoint_uuid("18081", "/a"), ENDPOINT_UUID}))
+
+    def test_expire(self) -> None:
+        expire = req.Expire([server(req.MODE_KEY_REMOVE, *SERVER)])
+        self.assertEqual(d.get_touched([expire.get_dict()], self.conf),
+                         (set(), {ENDPOINT_UUID}))
+
+    def test_weight(self) -> None:
+        weight = req.Weight({ENDPOINT_UUID: [SERVER + (50,)]})
+        self.assertEqual(d.get_touched([weight.get_dict()], self.conf),
+                         (set(), {ENDPOINT_UUID}))
+
+    def test_drain(self) -> None:
+        self.assertEqual(
+            d.get_touched([req.Drain(*SERVER).get_dict()], self.conf),
+            (set(), {ENDPOINT_UUID}))
+        self.assertEqual(
+            d.get_touched([req.Drain("10.0.0.9", 80).get_dict()], self.conf),
+            (set(), set()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import copy
+import json
+import os
+import typing as t
+import unittest
+
+import database.repository as r
+import envoy_stats as es
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+ENDPOINT_UUID = "abd9aef89a54956244894f9360ff9ba0"
+IDLE_ENDPOINT_UUID = "9c3e1f7a5b2d4e6f8a0b1c2d3e4f5a6b"
+
+
+def load_dump(name: str) -> t.Dict[str, t.Any]:
+    """Returns a response of the Envoy admin recorded in the data dir."""
+    with open(os.path.join(DATA_DIR, name)) as f:
+        return json.load(f)
+
+
+def load_stats() -> t.Dict[str, es.CLUSTER_STATS_TYPE]:
+    stats = es.parse_stats(load_dump("envoy_stats.json"))
+    es.parse_clusters(load_dump("envoy_clusters.json"), stats)
+    return stats
+
+
+class ParseStatsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stats = es.parse_stats(load_dump("envoy_stats.json"))
+
+    def test_endpoint_clusters_only(self) -> None:
+        self.assertEqual(sorted(self.stats),
+                         sorted([ENDPOINT_UUID, IDLE_ENDPOINT_UUID]))
+
+    def test_counters_and_gauges(self) -> None:
+        cluster = self.stats[ENDPOINT_UUID]
+        self.assertEqual(cluster["upstream_rq_total"], 1250)
+        self.assertEqual(cluster["upstream_rq_5xx"], 7)
+        self.assertEqual(cluster["upstream_rq_timeout"], 0)
+        self.assertEqual(cluster["upstream_cx_connect_fail"], 1)
+        self.assertEqual(cluster["upstream_cx_active"], 3)
+        self.assertEqual(cluster["upstream_rq_active"], 2)
+        self.assertNotIn("upstream_cx_total", cluster)
+
+    def test_histogram_quantiles(self) -> None:
+        self.assertEqual(self.stats[ENDPOINT_UUID]["upstream_rq_time_ms"],
+                         {"p50": 3.05, "p90": 9.2, "p99": 48.4})
+        # No request in the last interval.
+        self.assertEqual(
+            self.stats[IDLE_ENDPOINT_UUID]["upstream_rq_time_ms"],
+            {"p50": None, "p90": None, "p99": None})
+
+
+class ParseClustersTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.stats = load_stats()
+
+    def test_endpoint_clusters_only(self) -> None:
+        self.assertEqual(sorted(self.stats),
+                         sorted([ENDPOINT_UUID, IDLE_ENDPOINT_UUID]))
+        self.assertEqual(self.stats[IDLE_ENDPOINT_UUID]["servers"], [])
+
+    def test_servers(self) -> None:
+        healthy, ejected = self.stats[ENDPOINT_UUID]["servers"]
+        self.assertEqual(healthy["server_uuid"],
+                         r.gen_server_uuid("172.217.175.110", 80))
+        self.assertEqual((healthy["address"], healthy["port"]),
+                         ("172.217.175.110", 80))
+        self.assertEqual((healthy["health"], healthy["health_flags"]),
+                         (es.HEALTH_HEALTHY, []))
+        self.assertEqual(healthy["weight"], 60)
+        self.assertEqual((ejected["health"], ejected["health_flags"]),
+                         (es.HEALTH_UNHEALTHY, ["failed_outlier_check"]))
+
+    def test_uint64_strings(self) -> None:
+        healthy, ejected = self.stats[ENDPOINT_UUID]["servers"]
+        self.assertEqual(healthy["rq_total"], 18446744073709551610)
+        self.assertEqual(healthy["rq_error"], 7)
+        self.assertEqual(healthy["cx_active"], 3)
+        # Zero values are left out of the JSON.
+        self.assertEqual(healthy["rq_timeout"], 0)
+        self.assertEqual(ejected["rq_error"], 0)
+        self.assertEqual(ejected["rq_timeout"], 2)
+        self.assertEqual(ejected["rq_active"], 0)
+
+
+class AddRatesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.previous = load_stats()
+        self.stats = copy.deepcopy(self.previous)
+
+    def test_rates(self) -> None:
+        self.stats[ENDPOINT_UUID]["upstream_rq_total"] += 50
+        self.stats[ENDPOINT_UUID]["servers"][1]["rq_total"] += 30
+        es.add_rates(self.stats, self.previous, 10.0)
+
+        cluster = self.stats[ENDPOINT_UUID]
+        self.assertEqual(cluster["upstream_rq_per_second"], 5.0)
+        self.assertEqual([server["rq_per_second"]
+                          for server in cluster["servers"]], [0.0, 3.0])
+
+    def test_counter_reset(self) -> None:
+        # Envoy restarted and counts from zero again.
+        self.stats[ENDPOINT_UUID]["upstream_rq_total"] = 3
+        self.stats[ENDPOINT_UUID]["servers"][0]["rq_total"] = 2
+        es.add_rates(self.stats, self.previous, 10.0)
+
+        cluster = self.stats[ENDPOINT_UUID]
+        self.assertIsNone(cluster["upstream_rq_per_second"])
+        self.assertEqual([server["rq_per_second"]
+                          for server in cluster["servers"]], [None, 0.0])
+
+    def test_without_previous(self) -> None:
+        es.add_rates(self.stats, {}, 10.0)
+        self.assertIsNone(self.stats[ENDPOINT_UUID]["upstream_rq_per_second"])
+
+        es.add_rates(self.stats, self.previous, None)
+        self.assertEqual([server["rq_per_second"] for server
+                          in self.stats[ENDPOINT_UUID]["servers"]],
+                         [None, None])
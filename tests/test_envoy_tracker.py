@@ -0,0 +1,177 @@
+import http.server
+import json
+import threading
+import typing as t
+import unittest
+
+import envoy_tracker as et
+import xds_server as xs
+
+CONFIG_DUMP = {
+    "configs": [
+        {"@type": "type.googleapis.com/envoy.admin.v3.BootstrapConfigDump"},
+        {"@type": "type.googleapis.com/envoy.admin.v3.ListenersConfigDump",
+         "version_info": "5"},
+        {"@type": "type.googleapis.com/envoy.admin.v3.ClustersConfigDump",
+         "version_info": "3"},
+        {"@type": "type.googleapis.com/envoy.admin.v3.EndpointsConfigDump",
+         "dynamic_endpoint_configs": [{"version_info": "7"},
+                                      {"version_info": "6"}]}
+    ]
+}
+
+
+class AdminHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = json.dumps(CONFIG_DUMP).encode("UTF-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        pass
+
+
+class OperationRecorder:
+    def __init__(self) -> None:
+        self.operations: t.Dict[str, t.Dict[str, t.Any]] = {}
+
+    def update_operation(self,
+                         operation_id: str,
+                         fields: t.Dict[str, t.Any]) -> None:
+        self.operations.setdefault(operation_id, {}).update(fields)
+
+
+class AckRequest:
+    def __init__(self, type_url: str, error: t.Optional[str] = None) -> None:
+        self.type_url = type_url
+        self.error_detail = type("Status", (), {"message": error})()
+        self._error = error
+
+    def HasField(self, name: str) -> bool:
+        return name == "error_detail" and self._error is not None
+
+
+class ParseConfigDumpTest(unittest.TestCase):
+    def test_versions(self) -> None:
+        self.assertEqual(et.parse_config_dump(CONFIG_DUMP),
+                         {et.XDS_LDS: 5, et.XDS_CDS: 3, et.XDS_EDS: 7})
+
+    def test_no_load_assignments(self) -> None:
+        dump = {"configs": [
+            {"@type": "type.googleapis.com/envoy.admin.v3.EndpointsConfigDump"}
+        ]}
+        self.assertEqual(et.parse_config_dump(dump), {})
+
+
+class FetchAdminTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = http.server.HTTPServer(("127.0.0.1", 0), AdminHandler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.admin_url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch(self) -> None:
+        self.assertEqual(
+            et.fetch_admin(self.admin_url),
+            {xs.DEFAULT_CONFIG_SET: ({et.XDS_LDS: 5,
+                                      et.XDS_CDS: 3,
+                                      et.XDS_EDS: 7}, {})})
+
+    def test_check(self) -> None:
+        repository = OperationRecorder()
+        tracker = et.EnvoyTracker(repository,  # type: ignore
+                                  lambda: et.fetch_admin(self.admin_url),
+                                  partial_eds=True)
+        tracker.track(["applied"], {et.XDS_LDS: 5, et.XDS_EDS: 7}, 100.0)
+        tracker.track(["pending"], {et.XDS_CDS: 4}, 100.0)
+        tracker.track(["timeout"], {et.XDS_CDS: 4}, 50.0)
+        tracker.check(et.fetch_admin(self.admin_url), 100.0 + 1)
+        tracker.check(et.fetch_admin(self.admin_url),
+                      50.0 + et.ENVOY_ACK_TIMEOUT_SECONDS + 1)
+
+        self.assertEqual(repository.operations["applied"],
+                         {"envoy_status": et.ENVOY_ACKED,
+                          "envoy_acked_at": 101.0})
+        self.assertEqual(repository.operations["timeout"],
+                         {"envoy_status": et.ENVOY_TIMEOUT})
+        self.assertNotIn("pending", repository.operations)
+
+
+class FetchAdsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.ads = xs.AdsServer()
+
+    def ack(self,
+            node_id: str,
+            type_url: str,
+            version: str,
+            config_set: str = xs.DEFAULT_CONFIG_SET,
+            error: t.Optional[str] = None) -> None:
+        self.ads.record_ack(node_id,
+                            AckRequest(type_url, error),
+                            version,
+                            config_set)
+
+    def test_oldest_version_by_config_set(self) -> None:
+        self.ack("a", xs.TYPE_LISTENER, "5")
+        self.ack("b", xs.TYPE_LISTENER, "4")
+        self.ack("c", xs.TYPE_LISTENER, "2", "edge")
+        self.ack("c", xs.TYPE_CLUSTER, "3", "edge", "bad cluster")
+
+        self.assertEqual(et.fetch_ads(self.ads), {
+            xs.DEFAULT_CONFIG_SET: ({et.XDS_LDS: 4}, {}),
+            "edge": ({et.XDS_LDS: 2}, {et.XDS_CDS: (3, "bad cluster")})
+        })
+
+    def test_only_config_sets_published_to(self) -> None:
+        self.ack("a", xs.TYPE_LISTENER, "5")
+        self.ack("c", xs.TYPE_LISTENER, "2", "edge")
+        repository = OperationRecorder()
+        tracker = et.EnvoyTracker(repository,  # type: ignore
+                                  lambda: et.fetch_ads(self.ads))
+        tracker.track(["main"], {et.XDS_LDS: 5}, 100.0)
+        tracker.track(["edge"],
+                      {et.XDS_LDS: 5},
+                      100.0,
+                      [xs.DEFAULT_CONFIG_SET, "edge"])
+        tracker.check(et.fetch_ads(self.ads), 101.0)
+
+        self.assertEqual(repository.operations["main"]["envoy_status"],
+                         et.ENVOY_ACKED)
+        self.assertNotIn("edge", repository.operations)
+
+    def test_load_assignments_are_acked(self) -> None:
+        self.ack("a", xs.TYPE_LISTENER, "5")
+        repository = OperationRecorder()
+        tracker = et.EnvoyTracker(repository,  # type: ignore
+                                  lambda: et.fetch_ads(self.ads))
+        tracker.track(["eds"], {et.XDS_EDS: 5}, 100.0)
+        tracker.check(et.fetch_ads(self.ads), 101.0)
+        self.assertNotIn("eds", repository.operations)
+
+        self.ack("a", xs.TYPE_LOAD_ASSIGNMENT, "5")
+        tracker.check(et.fetch_ads(self.ads), 102.0)
+        self.assertEqual(repository.operations["eds"]["envoy_status"],
+                         et.ENVOY_ACKED)
+
+    def test_rejected(self) -> None:
+        self.ack("a", xs.TYPE_CLUSTER, "6", error="bad cluster")
+        repository = OperationRecorder()
+        tracker = et.EnvoyTracker(repository,  # type: ignore
+                                  lambda: et.fetch_ads(self.ads))
+        tracker.track(["rejected"], {et.XDS_CDS: 6}, 100.0)
+        tracker.check(et.fetch_ads(self.ads), 101.0)
+        self.assertEqual(repository.operations["rejected"],
+                         {"envoy_status": et.ENVOY_REJECTED,
+                          "envoy_error": "bad cluster"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import typing as t
+import unittest
+
+import expiration
+import requests as req
+
+ENDPOINT_UUID = "abd9aef89a54956244894f9360ff9ba0"
+
+
+def server(mode: str,
+           address: str = "10.0.0.1",
+           expires_at: t.Optional[float] = None) -> req.REQUEST_TYPE:
+    return req.Server(mode,
+                      address,
+                      80,
+                      ENDPOINT_UUID,
+                      expires_at).get_dict()
+
+
+def removal(address: str = "10.0.0.1") -> str:
+    return json.dumps(server(req.MODE_KEY_REMOVE, address), sort_keys=True)
+
+
+class ExpirationTimerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.timer = expiration.ExpirationTimer()
+
+    def test_make_removal(self) -> None:
+        self.assertEqual(
+            expiration.make_removal(server(req.MODE_KEY_ADD,
+                                           expires_at=100.0)),
+            server(req.MODE_KEY_REMOVE))
+
+    def test_expire(self) -> None:
+        added, cancelled = self.timer.track(
+            [server(req.MODE_KEY_ADD, "10.0.0.1", 100.0),
+             server(req.MODE_KEY_ADD, "10.0.0.2", 200.0),
+             server(req.MODE_KEY_ADD, "10.0.0.3")])
+
+        self.assertEqual(added, {removal("10.0.0.1"): 100.0,
+                                 removal("10.0.0.2"): 200.0})
+        self.assertEqual(cancelled, [])
+        self.assertEqual(self.timer.pop_expired(99.0), [])
+        self.assertEqual(self.timer.pop_expired(150.0),
+                         [removal("10.0.0.1")])
+        self.assertEqual(self.timer.pop_expired(150.0), [])
+
+    def test_refresh(self) -> None:
+        self.timer.track([server(req.MODE_KEY_ADD, expires_at=100.0)])
+        added, cancelled = self.timer.track(
+            [server(req.MODE_KEY_ADD, expires_at=200.0)])
+
+        self.assertEqual(added, {removal(): 200.0})
+        self.assertEqual(cancelled, [])
+        self.assertEqual(self.timer.pop_expired(150.0), [])
+        self.assertEqual(self.timer.pop_expired(200.0), [removal()])
+
+    def test_cancel_by_add(self) -> None:
+        self.timer.track([server(req.MODE_KEY_ADD, expires_at=100.0)])
+        added, cancelled = self.timer.track([server(req.MODE_KEY_ADD)])
+
+        self.assertEqual(added, {})
+        self.assertEqual(cancelled, [removal()])
+        self.assertEqual(self.timer.pop_expired(150.0), [])
+
+    def test_cancel_by_remove(self) -> None:
+        self.timer.track([server(req.MODE_KEY_ADD, expires_at=100.0)])
+        added, cancelled = self.timer.track([server(req.MODE_KEY_REMOVE)])
+
+        self.assertEqual(cancelled, [removal()])
+        self.assertEqual(self.timer.pop_expired(150.0), [])
+
+    def test_load(self) -> None:
+        self.timer.load({removal("10.0.0.1"): 100.0,
+                         removal("10.0.0.2"): 200.0})
+        self.timer.track([server(req.MODE_KEY_ADD, "10.0.0.2")])
+
+        self.assertEqual(self.timer.pop_expired(300.0),
+                         [removal("10.0.0.1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import typing as t
+import unittest
+
+import load_weighting as lw
+
+
+def new_server(port: int,
+               requests: int,
+               errors: int = 0,
+               weight: int = lw.ENVOY_DEFAULT_WEIGHT) -> t.Dict[str, t.Any]:
+    return {"server_uuid": str(port),
+            "address": "10.0.0.1",
+            "port": port,
+            "weight": weight,
+            "rq_total": requests,
+            "rq_error": errors,
+            "rq_timeout": 0}
+
+
+def to_previous(
+        servers: t.List[t.Dict[str, t.Any]]) -> t.Dict[str, t.Any]:
+    return {server["server_uuid"]: server for server in servers}
+
+
+class GetWeightsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.previous = to_previous([new_server(8080, 1000),
+                                     new_server(8081, 1000)])
+
+    def test_healthy_servers(self) -> None:
+        servers = [new_server(8080, 1100), new_server(8081, 1100)]
+        self.assertIsNone(lw.get_weights(servers, self.previous))
+
+    def test_lowered_at_once(self) -> None:
+        servers = [new_server(8080, 1100), new_server(8081, 1100, 10)]
+        self.assertEqual(lw.get_weights(servers, self.previous),
+                         [("10.0.0.1", 8080, 100), ("10.0.0.1", 8081, 50)])
+
+    def test_small_change_is_kept(self) -> None:
+        servers = [new_server(8080, 1100), new_server(8081, 1100, 2)]
+        self.assertIsNone(lw.get_weights(servers, self.previous))
+
+    def test_kept_without_sample(self) -> None:
+        # A new leader has no previous stats and keeps the weights.
+        servers = [new_server(8080, 1100, weight=100),
+                   new_server(8081, 1100, weight=5)]
+        self.assertIsNone(lw.get_weights(servers, {}))
+
+    def test_kept_with_few_requests(self) -> None:
+        servers = [new_server(8080, 1100, weight=100),
+                   new_server(8081, 1010, weight=5)]
+        self.assertIsNone(lw.get_weights(servers, self.previous))
+
+    def test_kept_after_counter_reset(self) -> None:
+        servers = [new_server(8080, 1100, weight=100),
+                   new_server(8081, 50, weight=5)]
+        self.assertIsNone(lw.get_weights(servers, self.previous))
+
+    def test_raised_in_steps(self) -> None:
+        servers = [new_server(8080, 1100, weight=100),
+                   new_server(8081, 1100, weight=5)]
+        self.assertEqual(lw.get_weights(servers, self.previous),
+                         [("10.0.0.1", 8080, 100), ("10.0.0.1", 8081, 25)])
+
+    def test_raise_threshold(self) -> None:
+        # 1% of errors targets 95, too close to be raised from 90.
+        servers = [new_server(8080, 1100, weight=100),
+                   new_server(8081, 1100, 1, weight=90)]
+        self.assertIsNone(lw.get_weights(servers, self.previous))
+
+    def test_raised_to_full_weight(self) -> None:
+        servers = [new_server(8080, 1100, weight=100),
+                   new_server(8081, 1100, weight=95)]
+        self.assertEqual(lw.get_weights(servers, self.previous),
+                         [("10.0.0.1", 8080, None),
+                          ("10.0.0.1", 8081, None)])
+
+    def test_single_server(self) -> None:
+        servers = [new_server(8080, 1100, 100)]
+        self.assertIsNone(lw.get_weights(servers, self.previous))
+
+
+class GetBaselineTest(unittest.TestCase):
+    def test_few_requests_add_up(self) -> None:
+        previous = new_server(8080, 1000)
+        self.assertIs(lw.get_baseline(new_server(8080, 1010), previous),
+                      previous)
+
+    def test_enough_requests(self) -> None:
+        server = new_server(8080, 1100)
+        self.assertIs(lw.get_baseline(server, new_server(8080, 1000)),
+                      server)
+
+    def test_counter_reset(self) -> None:
+        server = new_server(8080, 10)
+        self.assertIs(lw.get_baseline(server, new_server(8080, 1000)),
+                      server)
+        self.assertIs(lw.get_baseline(server, None), server)
@@ -0,0 +1,151 @@
+import typing as t
+import unittest
+import unittest.mock
+
+import database.repository as r
+from tests import load_conf
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+KEYS_PER_NODE = 2500
+
+
+class CountingRedis(fakeredis.FakeRedis if fakeredis else object):
+    """Counts the pages read by SCAN."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.pages = 0
+
+    def scan(self, *args, **kwargs):
+        self.pages += 1
+        return super().scan(*args, **kwargs)
+
+
+class FakeCluster:
+    """Primaries of Redis Cluster, each holding its own keys."""
+
+    def __init__(self, nodes: t.Dict[str, CountingRedis]) -> None:
+        self._nodes = nodes
+
+    def get_primaries(self) -> t.List[str]:
+        return list(self._nodes)
+
+    def get_redis_connection(self, node: str) -> CountingRedis:
+        return self._nodes[node]
+
+
+def fill(client: CountingRedis, prefix: str) -> t.Set[bytes]:
+    keys = {"l:{}{:04d}".format(prefix, i).encode("UTF-8")
+            for i in range(KEYS_PER_NODE)}
+    client.mset({key: 1 for key in keys})
+    client.set("s:" + prefix, 1)
+    return keys
+
+
+def new_repository() -> r.RedisRepository:
+    """Returns a repository on a Redis server of its own."""
+    server = fakeredis.FakeServer()
+
+    def new_client(host: str, port: int, db: int) -> fakeredis.FakeRedis:
+        return fakeredis.FakeRedis(server=server, db=db)
+
+    with unittest.mock.patch.object(r.redis, "Redis", new_client):
+        return r.RedisRepository()
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class ScanKeysTest(unittest.TestCase):
+    def test_standalone(self) -> None:
+        client = CountingRedis()
+        keys = fill(client, "a")
+
+        self.assertEqual(set(r.scan_keys(client, False, match="l:*")), keys)
+        self.assertGreater(client.pages, 1)
+
+    def test_every_page_of_every_primary(self) -> None:
+        nodes = {name: CountingRedis(server=fakeredis.FakeServer())
+                 for name in ("a", "b", "c")}
+        keys: t.Set[bytes] = set()
+        for name, client in nodes.items():
+            keys |= fill(client, name)
+
+        found = list(r.scan_keys(FakeCluster(nodes), True, match="l:*"))
+        self.assertEqual(len(found), len(keys))
+        self.assertEqual(set(found), keys)
+        for client in nodes.values():
+            self.assertGreater(client.pages, 1)
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class SaveConfTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.repository = new_repository()
+        self.conf = load_conf()
+
+    def test_expirations_saved_with_conf(self) -> None:
+        self.repository.save_conf(self.conf, {"a": 10.0, "b": 20.0}, [])
+        self.repository.save_conf(self.conf, {"c": 30.5}, ["a"])
+        self.assertEqual(self.repository.get_expirations(),
+                         {"b": 20.0, "c": 30.5})
+        self.assertEqual(self.repository.get_conf_version(),
+                         self.conf.version)
+
+    def test_fenced(self) -> None:
+        # Another leader takes the next fencing token.
+        self.assertTrue(self.repository.acquire_leader("worker", 10000))
+        self.repository._conf.incr(r.FENCING_TOKEN_KEY)
+
+        with self.assertRaises(r.LeadershipLost):
+            self.repository.save_conf(self.conf, {"a": 10.0}, [])
+        self.assertEqual(self.repository.get_expirations(), {})
+        self.assertIsNone(self.repository.get_conf_version())
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis is not installed")
+class EdsIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.repository = new_repository()
+        self.conf = load_conf()
+        self.eds_res = self.conf.eds.resources[0]
+        self.endpoint_uuid = self.eds_res.cluster_name
+        self.repository.setup_eds_uuid_db(self.conf)
+
+    def get_servers(self) -> t.Dict[str, t.Optional[t.Tuple[str, int]]]:
+        return {
+            endpoint.address: self.repository.get_server_info(
+                self.endpoint_uuid, endpoint.address, endpoint.port_value,
+                None)
+            for endpoint in self.eds_res.endpoints}
+
+    def test_setup(self) -> None:
+        for address, server in self.get_servers().items():
+            self.assertEqual(server[0], address)
+            self.assertEqual(
+                self.repository.get_server_endpoints(*server),
+                [self.endpoint_uuid])
+
+    def test_updated_in_place(self) -> None:
+        client = self.repository._eds_uuid
+        stale_uuid = r.gen_endpoint_uuid("19999", "/stale")
+        stale_digest = bytes.fromhex(stale_uuid)
+        endpoint = self.eds_res.endpoints[0]
+        server_digest = bytes.fromhex(
+            r.gen_server_uuid(endpoint.address, endpoint.port_value))
+        client.hset(r._servers_key(stale_digest), server_digest, 1)
+        client.sadd(r._server_endpoints_key(server_digest), stale_digest)
+        client.delete(r._server_endpoints_key(bytes.fromhex(
+            r.gen_server_uuid(self.eds_res.endpoints[-1].address,
+                              self.eds_res.endpoints[-1].port_value))))
+
+        with unittest.mock.patch.object(client, "flushdb") as flushdb, \
+                unittest.mock.patch.object(client, "delete") as delete:
+            self.repository.setup_eds_uuid_db(self.conf)
+        flushdb.assert_not_called()
+        delete.assert_not_called()
+
+        self.assertFalse(client.exists(r._servers_key(stale_digest)))
+        self.test_setup()
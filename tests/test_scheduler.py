@@ -0,0 +1,67 @@
+import typing as t
+import unittest
+
+import database.repository as r
+import scheduler
+
+
+def entries(lane: str, count: int) -> t.List[r.QUEUE_ENTRY_TYPE]:
+    return [("{}-{}".format(lane, number), {}) for number in range(count)]
+
+
+class LaneSchedulerTest(unittest.TestCase):
+    def test_weighted_turns(self) -> None:
+        lane_scheduler = scheduler.LaneScheduler()
+        scheduled = lane_scheduler.schedule(
+            {r.LANE_EMERGENCY: entries(r.LANE_EMERGENCY, 100),
+             r.LANE_INTERACTIVE: entries(r.LANE_INTERACTIVE, 100),
+             r.LANE_BULK: entries(r.LANE_BULK, 100)},
+            21)
+
+        lanes = [operation_id.split("-")[0] for operation_id, _ in scheduled]
+        self.assertEqual(lanes.count(r.LANE_EMERGENCY), 16)
+        self.assertEqual(lanes.count(r.LANE_INTERACTIVE), 4)
+        self.assertEqual(lanes.count(r.LANE_BULK), 1)
+
+    def test_order_in_lane(self) -> None:
+        lane_scheduler = scheduler.LaneScheduler()
+        scheduled = lane_scheduler.schedule(
+            {r.LANE_INTERACTIVE: entries(r.LANE_INTERACTIVE, 3),
+             r.LANE_BULK: entries(r.LANE_BULK, 3)},
+            6)
+
+        self.assertEqual(
+            [operation_id for operation_id, _ in scheduled
+             if operation_id.startswith(r.LANE_BULK)],
+            ["bulk-0", "bulk-1", "bulk-2"])
+        self.assertEqual(len(scheduled), 6)
+
+    def test_tie_goes_to_higher_lane(self) -> None:
+        lane_scheduler = scheduler.LaneScheduler(
+            {r.LANE_EMERGENCY: 1, r.LANE_INTERACTIVE: 1, r.LANE_BULK: 1})
+        scheduled = lane_scheduler.schedule(
+            {r.LANE_BULK: entries(r.LANE_BULK, 1),
+             r.LANE_EMERGENCY: entries(r.LANE_EMERGENCY, 1)},
+            1)
+
+        self.assertEqual(scheduled, [("emergency-0", {})])
+
+    def test_credits_carried_over(self) -> None:
+        lane_scheduler = scheduler.LaneScheduler()
+        lanes = []
+        for _ in range(21):
+            scheduled = lane_scheduler.schedule(
+                {r.LANE_EMERGENCY: entries(r.LANE_EMERGENCY, 1),
+                 r.LANE_BULK: entries(r.LANE_BULK, 1)},
+                1)
+            lanes.append(scheduled[0][0].split("-")[0])
+
+        self.assertIn(r.LANE_BULK, lanes[:17])
+
+    def test_empty(self) -> None:
+        lane_scheduler = scheduler.LaneScheduler()
+        self.assertEqual(lane_scheduler.schedule({r.LANE_BULK: []}, 10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import database.repository as r
+import database.sqlite_repository as sr
+from tests import load_conf
+
+# Queue table of the versions before the lanes.
+OLD_QUEUE_SCHEMA = """
+CREATE TABLE request_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request TEXT NOT NULL
+);
+"""
+
+
+class SqliteRepositoryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "proxy-api.db")
+        self.repository = sr.SqliteRepository(self.path)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_queue_by_lane(self) -> None:
+        ids = {lane: self.repository.add_queue(json.dumps({"lane": lane}),
+                                               lane)
+               for lane in r.LANES}
+        interactive_id = self.repository.add_queue(json.dumps({"n": 2}))
+
+        queue = self.repository.get_queue(10)
+        self.assertEqual(queue[r.LANE_EMERGENCY],
+                         [(ids[r.LANE_EMERGENCY],
+                           {"lane": r.LANE_EMERGENCY})])
+        self.assertEqual(queue[r.LANE_INTERACTIVE],
+                         [(ids[r.LANE_INTERACTIVE],
+                           {"lane": r.LANE_INTERACTIVE}),
+                          (interactive_id, {"n": 2})])
+        self.assertEqual(self.repository.get_queue_stats()[0], 4)
+
+        self.repository.ack_queue([ids[r.LANE_EMERGENCY],
+                                   ids[r.LANE_INTERACTIVE]])
+        queue = self.repository.get_queue(10)
+        self.assertEqual(sorted(queue), [r.LANE_BULK, r.LANE_INTERACTIVE])
+        self.assertEqual(queue[r.LANE_INTERACTIVE],
+                         [(interactive_id, {"n": 2})])
+
+    def test_queue_timeout(self) -> None:
+        started = time.monotonic()
+        self.assertEqual(self.repository.get_queue(1, block=50), {})
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_wait_commit_wakes_up(self) -> None:
+        # Another connection commits while the queue is blocked.
+        other = sr.SqliteRepository(self.path)
+        timer = threading.Timer(0.1, other.add_queue, ['{"n": 1}'])
+        timer.start()
+        try:
+            started = time.monotonic()
+            queue = self.repository.get_queue(1, block=5000)
+        finally:
+            timer.cancel()
+
+        self.assertEqual(queue[r.LANE_INTERACTIVE][0][1], {"n": 1})
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_operation_merged(self) -> None:
+        operation_id = self.repository.add_queue('{"n": 1}')
+        queued_at = self.repository.get_operation(operation_id)["queued_at"]
+
+        conf = load_conf()
+        self.repository.save_operation_result(
+            operation_id, r.OPERATION_APPLIED, conf,
+            timings={"applied_at": 1.5})
+        self.repository.update_operation(operation_id, {"written_at": 2.5})
+
+        operation = self.repository.get_operation(operation_id)
+        self.assertEqual(operation["operation_id"], operation_id)
+        self.assertEqual(operation["status"], r.OPERATION_APPLIED)
+        self.assertEqual(operation["queued_at"], queued_at)
+        self.assertEqual(operation["applied_at"], 1.5)
+        self.assertEqual(operation["written_at"], 2.5)
+        self.assertEqual(operation["conf_version"], str(conf.version))
+
+    def test_fencing_token(self) -> None:
+        conf = load_conf()
+        self.assertTrue(self.repository.acquire_leader("a", 1))
+        time.sleep(0.01)
+        other = sr.SqliteRepository(self.path)
+        self.assertTrue(other.acquire_leader("b", 10000))
+        self.assertFalse(self.repository.acquire_leader("a", 10000))
+
+        with self.assertRaises(r.LeadershipLost):
+            self.repository.save_conf(conf, {"a": 10.0}, [])
+        with self.assertRaises(r.LeadershipLost):
+            self.repository.add_journal([("1-0", 1, {"n": 1})])
+        with self.assertRaises(r.LeadershipLost):
+            self.repository.check_leader()
+        self.assertIsNone(self.repository.get_conf_version())
+        self.assertEqual(self.repository.get_expirations(), {})
+
+        other.save_conf(conf, {"a": 10.0}, [])
+        self.assertEqual(self.repository.get_conf_version(), conf.version)
+        self.assertEqual(self.repository.get_expirations(), {"a": 10.0})
+
+    def test_expirations_saved_with_conf(self) -> None:
+        conf = load_conf()
+        self.repository.save_conf(conf, {"a": 10.0, "b": 20.0}, [])
+        self.repository.save_conf(conf, {"c": 30.5}, ["a"])
+        self.assertEqual(self.repository.get_expirations(),
+                         {"b": 20.0, "c": 30.5})
+
+
+class LaneMigrationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "proxy-api.db")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_lane_column_added(self) -> None:
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.executescript(OLD_QUEUE_SCHEMA)
+        db.execute("INSERT INTO request_queue (request) VALUES (?)",
+                   ('{"n": 1}',))
+        db.close()
+
+        repository = sr.SqliteRepository(self.path)
+        self.assertEqual(repository.get_queue(10),
+                         {r.LANE_INTERACTIVE: [("1-0", {"n": 1})]})
+
+        operation_id = repository.add_queue('{"n": 2}', r.LANE_BULK)
+        self.assertEqual(repository.get_queue(10)[r.LANE_BULK],
+                         [(operation_id, {"n": 2})])
+
+        # Opened again, the migrated table is left as it is.
+        repository = sr.SqliteRepository(self.path)
+        self.assertEqual(len(repository.get_queue(10)), 2)
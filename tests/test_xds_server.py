@@ -0,0 +1,60 @@
+import unittest
+
+import database.repository as r
+import xds_server as xs
+from tests import load_conf
+
+if xs.grpc is not None:
+    from envoy.config.core.v3 import base_pb2
+    from envoy.service.discovery.v3 import discovery_pb2
+
+ENDPOINT_UUID = r.gen_endpoint_uuid("18080", "/")
+
+
+@unittest.skipIf(xs.grpc is None, "requirements_xds.txt is not installed")
+class ConfigSetSelectionTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conf = load_conf()
+        self.ads = xs.AdsServer()
+        self.ads.update(self.conf)
+        self.node = base_pb2.Node(id="node", cluster="edge")
+
+    def publish_edge(self) -> None:
+        self.ads.update(self.conf.copy_subset(set()), None, "edge")
+
+    def test_state_of_the_world(self) -> None:
+        stream = xs.AdsStream(self.ads)
+        responses = stream.on_request(discovery_pb2.DiscoveryRequest(
+            node=self.node, type_url=xs.TYPE_CLUSTER))
+        self.assertEqual(len(responses[0].resources), 1)
+
+        self.publish_edge()
+        responses = stream.on_update()
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(len(responses[0].resources), 0)
+
+    def test_delta(self) -> None:
+        stream = xs.DeltaStream(self.ads)
+        responses = stream.on_request(discovery_pb2.DeltaDiscoveryRequest(
+            node=self.node, type_url=xs.TYPE_CLUSTER))
+        self.assertEqual([resource.name
+                          for resource in responses[0].resources],
+                         [ENDPOINT_UUID])
+
+        self.publish_edge()
+        responses = stream.on_update()
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(list(responses[0].removed_resources),
+                         [ENDPOINT_UUID])
+
+    def test_published_set(self) -> None:
+        self.publish_edge()
+        stream = xs.AdsStream(self.ads)
+        responses = stream.on_request(discovery_pb2.DiscoveryRequest(
+            node=self.node, type_url=xs.TYPE_CLUSTER))
+        self.assertEqual(len(responses[0].resources), 0)
+        self.assertEqual(stream.on_update(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
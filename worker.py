@@ -1,58 +1,726 @@
+import json
 import logging
+import os
+import signal
+import socket
+import threading
+import time
+import typing as t
 
+import compaction
+import config_sets as cs
+import conf_filesystem.read_conf as rc
 import conf_filesystem.write_conf as cf
 import database.repository as r
 import entity.conf as c
+import entity.diff as d
+import envoy_tracker as et
+import expiration
+import load_weighting as lw
 import logger
 import requests as req
+import scheduler
+import xds_server as xs
 
 logger.config_logger()
 LOG = logging.getLogger(__name__)
 
+CHANGE_ENDPOINT_ADDED = "endpoint_added"
+CHANGE_ENDPOINT_REMOVED = "endpoint_removed"
+CHANGE_SERVER_ADDED = "server_added"
+CHANGE_SERVER_REMOVED = "server_removed"
+CHANGE_VERSIONS = "versions"
+
+try:
+    WORKER_ID = os.environ["WORKER_ID"]
+except KeyError:
+    WORKER_ID = "{}-{}".format(socket.gethostname(), os.getpid())
+
+# A standby takes over within the lease after the leader stops.
+LEASE_MILLISECONDS = 500
+LEASE_RENEW_SECONDS = 0.1
+FOLLOW_INTERVAL_SECONDS = 0.1
+QUEUE_BLOCK_MILLISECONDS = 100
+# Pending operations are compacted and saved together up to the size.
+QUEUE_BATCH_SIZE = 100
+
+# Operation ID, status, error and results of the batch.
+OPERATION_RESULT_TYPE = t.Tuple[str,
+                                str,
+                                t.Optional[str],
+                                t.Optional[t.List[c.RESULT_TYPE]]]
+
 conf = c.EnvoyConf()
-conf.load_from_file()
+repository = r.new_repository()
+timer = expiration.ExpirationTimer()
+ads: t.Optional[xs.AdsServer] = None
+config_set_writer = cs.ConfigSetWriter()
+tracker: t.Optional[et.EnvoyTracker] = None
+weight_controller = lw.WeightController(repository)
 
-redis = r.RedisRepository()
-redis.flushall()
-redis.save_conf(conf)
-redis.setup_lds_uuid_db(conf)
-redis.setup_eds_uuid_db(conf)
 
+def make_change_event(
+        operation_id: str,
+        request: req.REQUEST_TYPE) -> t.Optional[r.CHANGE_EVENT_TYPE]:
+    mode: str = request[req.MODE_KEY]
+    endpoint_uuid: str = request[req.ENDPOINT_UUID]
 
-def server():
-    while True:
+    if req.ENDPOINTS_CASE_NAME in request:
+        request_value: req.ENDPOINTS_REQUEST_TYPE = \
+            request[req.ENDPOINTS_CASE_NAME]
+        if mode == req.MODE_KEY_ADD:
+            change_type = CHANGE_ENDPOINT_ADDED
+        else:
+            change_type = CHANGE_ENDPOINT_REMOVED
+
+        return {
+            "type": change_type,
+            "operation_id": operation_id,
+            "endpoint_uuid": endpoint_uuid,
+            "port_value": request_value[req.PORT_VALUE_KEY],
+            "prefix": request_value[req.ROUTE_KEY][req.PREFIX_KEY]
+        }
+
+    elif req.SERVERS_CASE_NAME in request:
+        request_value: req.SERVERS_REQUEST_TYPE = \
+            request[req.SERVERS_CASE_NAME]
+        if mode == req.MODE_KEY_ADD:
+            change_type = CHANGE_SERVER_ADDED
+        else:
+            change_type = CHANGE_SERVER_REMOVED
+
+        address: str = request_value[req.ADDRESS_KEY]
+        port: int = request_value[req.PORT_KEY]
+        return {
+            "type": change_type,
+            "operation_id": operation_id,
+            "endpoint_uuid": endpoint_uuid,
+            "server_uuid": r.gen_server_uuid(address, port),
+            "address": address,
+            "port": port
+        }
+
+    return None
+
+
+def make_change_events(
+        operation_id: str,
+        requests: t.List[req.REQUEST_TYPE]) -> t.List[r.CHANGE_EVENT_TYPE]:
+    events: t.List[r.CHANGE_EVENT_TYPE] = []
+    for request in requests:
+        event = make_change_event(operation_id, request)
+        if event is not None:
+            events.append(event)
+
+    events.append({
+        "type": CHANGE_VERSIONS,
+        "operation_id": operation_id,
+        "lds_version": conf.lds.version_info,
+        "cds_version": conf.cds.version_info,
+        "eds_version": conf.eds.version_info
+    })
+    return events
+
+
+def apply_request(
+        request: req.REQUEST_TYPE
+) -> t.Tuple[bool,
+             t.List[req.REQUEST_TYPE],
+             t.Optional[t.List[c.RESULT_TYPE]]]:
+    mode: str = request[req.MODE_KEY]
+    if mode == req.MODE_KEY_REPLACE:
+        endpoint_uuid: str = request[req.ENDPOINT_UUID]
+        added, removed = conf.replace_servers(request)
+
+        applied: t.List[req.REQUEST_TYPE] = []
+        for changed_mode, servers in ((req.MODE_KEY_REMOVE, removed),
+                                      (req.MODE_KEY_ADD, added)):
+            for address, port in servers:
+                sr_req = req.Server(changed_mode, address, port, endpoint_uuid)
+                applied.append(sr_req.get_dict())
+
+        return bool(applied), applied, None
+
+    if mode == req.MODE_KEY_DRAIN:
+        request_value: req.SERVERS_REQUEST_TYPE = \
+            request[req.SERVERS_CASE_NAME]
+        endpoint_uuids: t.List[str] = conf.drain_server(request)
+
+        applied = []
+        for endpoint_uuid in endpoint_uuids:
+            sr_req = req.Server(req.MODE_KEY_REMOVE,
+                                request_value[req.ADDRESS_KEY],
+                                request_value[req.PORT_KEY],
+                                endpoint_uuid)
+            applied.append(sr_req.get_dict())
+
+        return bool(applied), applied, None
+
+    if mode == req.MODE_KEY_EXPIRE:
+        changed, applied = conf.apply_expired(request[req.OPERATIONS_KEY])
+        return changed, applied, None
+
+    if mode == req.MODE_KEY_WEIGHT:
+        # Weights change no endpoint or server, so nothing is tracked.
+        return conf.set_weights(request), [], None
+
+    if mode != req.MODE_KEY_BATCH:
+        changed = conf.apply(request)
+        return changed, [request], None
+
+    operations: t.List[req.REQUEST_TYPE] = request[req.OPERATIONS_KEY]
+    changed, results = conf.apply_batch(operations,
+                                        request.get(req.UPSERT_KEY, False))
+
+    applied = []
+    for operation, result in zip(operations, results):
+        if result["status"] == c.RESULT_APPLIED:
+            applied.append(operation)
+    return changed, applied, results
+
+
+def publish(changes: t.Optional[d.ChangeSet] = None) -> t.List[str]:
+    # Config sets and ADS are built from the config in memory, so they are
+    # published whole again after the start. Returns the config sets
+    # published to.
+    if ads is not None:
+        ads.update(conf, changes)
+
+    published: t.List[str] = [xs.DEFAULT_CONFIG_SET]
+    for name, (set_conf, set_changes) in \
+            config_set_writer.write(conf, changes).items():
+        if ads is not None:
+            ads.update(set_conf, set_changes, name)
+        published.append(name)
+    return published
+
+
+def get_refreshed(
+        request: req.REQUEST_TYPE,
+        changed: bool,
+        results: t.Optional[t.List[c.RESULT_TYPE]]
+) -> t.List[req.REQUEST_TYPE]:
+    # Adds of the resources in the config already change nothing, but
+    # refresh or cancel their TTL.
+    if request[req.MODE_KEY] == req.MODE_KEY_BATCH:
+        return [operation
+                for operation, result
+                in zip(request[req.OPERATIONS_KEY], results or [])
+                if operation[req.MODE_KEY] == req.MODE_KEY_ADD
+                and result["status"] == c.RESULT_UNCHANGED]
+
+    if request[req.MODE_KEY] == req.MODE_KEY_ADD and not changed:
+        return [request]
+    return []
+
+
+def track_expirations(applied: t.List[req.REQUEST_TYPE]) -> None:
+    added, cancelled = timer.track(applied)
+    if added or cancelled:
+        repository.update_expirations(added, cancelled)
+
+
+def save_applied(applied: t.List[req.REQUEST_TYPE],
+                 events: t.List[r.CHANGE_EVENT_TYPE],
+                 changes: d.ChangeSet,
+                 lost: t.Callable[[], bool] = lambda: False) -> t.List[str]:
+    # The fenced write goes first, so a worker which lost the lease stops
+    # before the indexes, files and Envoy. Indexes left behind by a stop
+    # after it are rebuilt on the next start. Deadlines are saved with it,
+    # as the journal is not replayed up to the saved config.
+    added, cancelled = timer.track(applied)
+    repository.save_conf(conf, added, cancelled)
+    if changes.lds_changed:
+        repository.setup_lds_uuid_db(conf)
+    repository.update_eds_uuid_db(conf, set(changes.load_assignments))
+    if lost():
+        raise r.LeadershipLost()
+    cf.write_conf_files(conf, changes)
+    published = publish(changes)
+    repository.add_changes(events)
+    return published
+
+
+def get_status(
+        changed: bool,
+        results: t.Optional[t.List[c.RESULT_TYPE]]
+) -> t.Tuple[str, t.Optional[str]]:
+    if results is not None \
+            and any(result["status"] == c.RESULT_FAILED
+                    for result in results):
+        return r.OPERATION_FAILED, "Batch was rejected."
+
+    if changed:
+        return r.OPERATION_APPLIED, None
+    return r.OPERATION_UNCHANGED, None
+
+
+def cold_start() -> None:
+    conf.load_from_file()
+    repository.flushall()
+    repository.save_conf(conf)
+    repository.setup_lds_uuid_db(conf)
+    repository.setup_eds_uuid_db(conf)
+
+
+def get_files_version() -> int:
+    version = 0
+    for load_conf_file in (rc.load_lds_conf_file,
+                           rc.load_cds_conf_file,
+                           rc.load_eds_conf_file):
+        version += int(json.loads(load_conf_file())["version_info"])
+    return version
+
+
+def is_written(envoy_conf: c.EnvoyConf) -> bool:
+    return envoy_conf.lds.get_json() == rc.load_lds_conf_file() and \
+        envoy_conf.cds.get_json() == rc.load_cds_conf_file() and \
+        envoy_conf.eds.get_json() == rc.load_eds_conf_file()
+
+
+def load_snapshot() -> t.Optional[int]:
+    global conf
+
+    meta: t.Optional[t.Tuple[int, str]] = repository.get_conf_meta()
+    if meta is None:
+        return None
+
+    version, digest = meta
+    snapshot: c.EnvoyConf = repository.load_conf()
+    if r.get_conf_digest(snapshot) != digest:
+        LOG.warning("Stored config does not match its digest.")
+        return None
+
+    conf = snapshot
+    return version
+
+
+def replay_journal(saved_version: t.Optional[int]) -> bool:
+    # Entries after saved_version were journaled by a worker stopped
+    # before saving them, so they are saved again. A standby follows
+    # the journal only in memory with None.
+    if saved_version is not None:
+        timer.load(repository.get_expirations())
+
+    for operation_id, journal_version, request in \
+            repository.get_journal(conf.version):
+        ports, cluster_names = d.get_touched([request], conf)
+        before: d.Generation = d.snapshot(conf, ports, cluster_names)
         try:
-            request: req.REQUEST_TYPE = redis.get_queue()
-        except IndexError:
+            changed, applied, results = apply_request(request)
+        except Exception:
+            LOG.exception("Failed to replay operation %s", operation_id)
+            return False
+
+        if conf.version != journal_version:
+            LOG.warning("Journal of operation %s does not match the config.",
+                        operation_id)
+            return False
+
+        if saved_version is None or journal_version <= saved_version:
             continue
 
-        mode: str = request[req.MODE_KEY]
+        changes: d.ChangeSet = \
+            d.diff(before, d.snapshot(conf, ports, cluster_names))
+        applied.extend(get_refreshed(request, changed, results))
+        save_applied(applied,
+                     make_change_events(operation_id, applied),
+                     changes)
+        status, error = get_status(changed, results)
+        repository.save_operation_result(operation_id,
+                                         status,
+                                         conf,
+                                         error,
+                                         results)
+        LOG.info("Operation %s is replayed.", operation_id)
 
-        new_conf: c.EnvoyConf = conf.copy_conf()
+    return True
 
-        LOG.debug("Requested config:")
-        LOG.debug(new_conf.get_json())
-        LOG.debug(conf.get_json())
 
-        changed = False
-        if mode == req.MODE_KEY_ADD:
-            LOG.debug("Add requested config")
-            new_conf.apply_request(request)
-            changed = conf.add(new_conf)
-        elif mode == req.MODE_KEY_REMOVE:
-            LOG.debug("Remove requested config")
-            new_conf.remove_without_request(request)
-            changed = conf.remove(new_conf)
-        else:
-            pass
+def update_files() -> bool:
+    if is_written(conf):
+        return True
+
+    if get_files_version() > conf.version:
+        LOG.warning("Config files are newer than the stored config.")
+        return False
+
+    cf.write_conf_files(conf)
+    return True
+
+
+def update_indexes() -> None:
+    repository.setup_lds_uuid_db(conf)
+    repository.setup_eds_uuid_db(conf)
+
+
+def warm_start() -> bool:
+    saved_version: t.Optional[int] = load_snapshot()
+    if saved_version is None:
+        return False
+
+    if not replay_journal(saved_version) or not update_files():
+        return False
+
+    update_indexes()
+    return True
+
+
+def start() -> None:
+    if warm_start():
+        LOG.info("Worker is started from the stored config version %d.",
+                 conf.version)
+        return
+
+    cold_start()
+    LOG.info("Worker is started from the config files.")
+
+
+def follow() -> bool:
+    # Keeps the config warm by the journal until the lease is acquired,
+    # and returns whether the config follows the journal.
+    following = False
+    while not repository.acquire_leader(WORKER_ID, LEASE_MILLISECONDS):
+        if not following:
+            following = load_snapshot() is not None
+        if following:
+            following = replay_journal(None)
+        time.sleep(FOLLOW_INTERVAL_SECONDS)
+
+    return following
+
+
+def take_over(following: bool) -> None:
+    meta: t.Optional[t.Tuple[int, str]] = repository.get_conf_meta()
+    if following and meta is not None and conf.version <= meta[0]:
+        saved_version: int = meta[0]
+        if replay_journal(saved_version) \
+                and conf.version >= saved_version \
+                and update_files():
+            update_indexes()
+            LOG.info("Worker took over the config version %d.",
+                     conf.version)
+            return
+
+    start()
+
+
+class Leadership:
+    """Renews the lease of the leader worker in background.
+
+    The lease is lost when it is not renewed within the lease time,
+    then writes of the worker are rejected by the fencing token.
+    """
+
+    def __init__(self) -> None:
+        self._lost = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self._renew, daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    @property
+    def lost(self) -> bool:
+        return self._lost.is_set()
+
+    def _renew(self) -> None:
+        renewed_at = time.monotonic()
+        while not self._stopped.wait(LEASE_RENEW_SECONDS):
+            try:
+                if not repository.renew_leader(WORKER_ID,
+                                               LEASE_MILLISECONDS):
+                    break
+                renewed_at = time.monotonic()
+            except Exception:
+                LOG.exception("Failed to renew the lease.")
+                if time.monotonic() - renewed_at > \
+                        LEASE_MILLISECONDS / 1000:
+                    break
+
+        self._lost.set()
+
+
+def is_processed(operation_id: str) -> bool:
+    operation: t.Optional[r.OPERATION_TYPE] = \
+        repository.get_operation(operation_id)
+    return operation is not None \
+        and operation["status"] != r.OPERATION_PENDING
+
+
+def get_journaled(operation_ids: t.List[str]) -> t.List[str]:
+    # Operations journaled up to the config version are in the config
+    # already, a worker stopped after saving it did not record them.
+    if not operation_ids:
+        return []
+
+    pending = set(operation_ids)
+    return [operation_id
+            for operation_id, version, _ in repository.get_journal(0)
+            if operation_id in pending and version <= conf.version]
+
+
+def apply_operations(
+        entries: t.List[r.QUEUE_ENTRY_TYPE]
+) -> t.Tuple[t.List[r.JOURNAL_TYPE],
+             t.List[req.REQUEST_TYPE],
+             t.List[r.CHANGE_EVENT_TYPE],
+             t.List[OPERATION_RESULT_TYPE]]:
+    journal: t.List[r.JOURNAL_TYPE] = []
+    applied: t.List[req.REQUEST_TYPE] = []
+    events: t.List[r.CHANGE_EVENT_TYPE] = []
+    results: t.List[OPERATION_RESULT_TYPE] = []
+
+    for operation_id, request in entries:
+        try:
+            changed, operation_applied, operation_results = \
+                apply_request(request)
+        except Exception as e:
+            LOG.exception("Failed to apply operation %s", operation_id)
+            results.append((operation_id, r.OPERATION_FAILED, str(e), None))
+            continue
 
         if changed:
-            redis.setup_lds_uuid_db(conf)
-            redis.setup_eds_uuid_db(conf)
-            redis.save_conf(conf)
-            cf.write_conf_files(conf)
+            journal.append((operation_id, conf.version, request))
+            applied.extend(operation_applied)
+            events.extend(make_change_events(operation_id,
+                                             operation_applied))
+        applied.extend(get_refreshed(request, changed, operation_results))
+
+        status, error = get_status(changed, operation_results)
+        results.append((operation_id, status, error, operation_results))
+
+    return journal, applied, events, results
+
+
+def get_target_versions(changes: d.ChangeSet) -> et.VERSIONS_TYPE:
+    target: et.VERSIONS_TYPE = {}
+    if changes.lds_changed:
+        target[et.XDS_LDS] = int(conf.lds.version_info)
+    if changes.cds_changed:
+        target[et.XDS_CDS] = int(conf.cds.version_info)
+    if changes.eds_changed:
+        target[et.XDS_EDS] = int(conf.eds.version_info)
+    return target
+
+
+def expire() -> t.List[r.QUEUE_ENTRY_TYPE]:
+    expired: t.List[str] = timer.pop_expired(time.time())
+    if not expired:
+        return []
+
+    # Servers are removed before their endpoints.
+    removals: t.List[req.REQUEST_TYPE] = \
+        sorted((json.loads(removal_json) for removal_json in expired),
+               key=lambda removal: req.ENDPOINTS_CASE_NAME in removal)
+    ex_req = req.Expire(removals)
+
+    # Queued to be given an operation ID, and acknowledged with the batch.
+    # Left in the queue, it is applied after the restart.
+    operation_id: str = repository.add_queue(ex_req.get_json())
+    repository.update_expirations({}, expired)
+    LOG.info("Operation %s expires %d resources.",
+             operation_id, len(removals))
+    return [(operation_id, ex_req.get_dict())]
+
+
+def server(leadership: t.Optional[Leadership] = None):
+    # Requests are acknowledged after their results are recorded, so the
+    # first ones may have been processed already before the restart.
+    check_processed = True
+    lane_scheduler = scheduler.LaneScheduler()
+    timer.load(repository.get_expirations())
+
+    while leadership is None or not leadership.lost:
+        pending: t.Dict[str, t.List[r.QUEUE_ENTRY_TYPE]] = \
+            repository.get_queue(QUEUE_BATCH_SIZE, QUEUE_BLOCK_MILLISECONDS)
+
+        # Expirations go first, before the requests read above change
+        # the expiring resources.
+        expired: t.List[r.QUEUE_ENTRY_TYPE] = expire()
+        if not pending and not expired:
+            continue
+
+        if check_processed:
+            check_processed = False
+            processed = [operation_id
+                         for entries in pending.values()
+                         for operation_id, _ in entries
+                         if is_processed(operation_id)]
+
+            # Journaled operations are recorded as applied, not applied
+            # again to be reported as unchanged or failed.
+            journaled = get_journaled([operation_id
+                                       for entries in pending.values()
+                                       for operation_id, _ in entries
+                                       if operation_id not in processed])
+            for operation_id in journaled:
+                repository.save_operation_result(operation_id,
+                                                 r.OPERATION_APPLIED,
+                                                 conf)
+                LOG.info("Operation %s was applied before the restart.",
+                         operation_id)
+            processed.extend(journaled)
+
+            if processed:
+                repository.ack_queue(processed)
+                pending = {lane: [entry for entry in entries
+                                  if entry[0] not in processed]
+                           for lane, entries in pending.items()}
+
+        # Requests not scheduled in this batch are left in the queue.
+        entries: t.List[r.QUEUE_ENTRY_TYPE] = \
+            expired + lane_scheduler.schedule(pending, QUEUE_BATCH_SIZE)
+        if not entries:
+            continue
+
+        survivors, dropped = compaction.compact(entries)
+
+        # Only the resources the batch may change are compared.
+        ports, cluster_names = \
+            d.get_touched([request for _, request in survivors], conf)
+        before: d.Generation = d.snapshot(conf, ports, cluster_names)
+        journal, applied, events, results = apply_operations(survivors)
+        timings: r.TIMINGS_TYPE = {"applied_at": time.time()}
+
+        changes: t.Optional[d.ChangeSet] = None
+        published: t.List[str] = []
+        if journal:
+            # Journaled first, the operations are replayed on the next start
+            # when the worker stops before saving them.
+            repository.add_journal(journal)
+            after: d.Generation = d.snapshot(conf, ports, cluster_names)
+            changes = d.diff(before, after)
+            published = save_applied(
+                applied,
+                events,
+                changes,
+                lambda: leadership is not None and leadership.lost)
+            timings["written_at"] = time.time()
+        elif applied:
+            track_expirations(applied)
+
+        for operation_id, reason in dropped.items():
+            if reason == compaction.COMPACTION_SUPERSEDED:
+                results.append((operation_id,
+                                r.OPERATION_SUPERSEDED,
+                                None,
+                                None))
+            else:
+                results.append((operation_id,
+                                r.OPERATION_UNCHANGED,
+                                None,
+                                None))
+
+        # Results are recorded only by the leader, the operations are
+        # left in the queue for the next one.
+        repository.check_leader()
+        for operation_id, status, error, operation_results in results:
+            repository.save_operation_result(operation_id,
+                                             status,
+                                             conf,
+                                             error,
+                                             operation_results,
+                                             timings)
+        repository.ack_queue([operation_id for operation_id, _ in entries])
+
+        if tracker is not None and changes is not None:
+            tracker.track([operation_id
+                           for operation_id, status, _, _ in results
+                           if status == r.OPERATION_APPLIED],
+                          get_target_versions(changes),
+                          timings["written_at"],
+                          published)
+
+
+def setup_ads() -> None:
+    global ads
+
+    if not xs.XDS_GRPC_PORT:
+        return
+
+    if xs.grpc is None:
+        LOG.warning("grpcio and xds-protos are not installed, "
+                    "the config is delivered only by the files.")
+        return
+
+    ads = xs.AdsServer()
+
+
+def serve_ads() -> t.Any:
+    # Only the leader serves ADS, Envoy connected to a standby would keep
+    # the config it had when the standby lost the leadership.
+    if ads is None:
+        return None
+
+    grpc_server = xs.serve(ads, xs.XDS_GRPC_PORT)
+    LOG.info("ADS server is started on port %d.", xs.XDS_GRPC_PORT)
+    return grpc_server
+
+
+def stop_ads(grpc_server: t.Any) -> None:
+    if grpc_server is None:
+        return
+
+    # Open streams are cancelled, so Envoy reconnects to the new leader.
+    grpc_server.stop(None).wait()
+    LOG.info("ADS server is stopped.")
+
+
+def start_tracker() -> None:
+    global tracker
+
+    if ads is not None:
+        tracker = et.EnvoyTracker(repository, lambda: et.fetch_ads(ads))
+    elif et.ENVOY_ADMIN_URL:
+        tracker = et.EnvoyTracker(repository,
+                                  et.fetch_admin,
+                                  partial_eds=True)
+    else:
+        return
+
+    tracker.start()
+
+
+def run() -> None:
+    setup_ads()
+    start_tracker()
+    while True:
+        following = follow()
+        LOG.info("Worker %s is the leader.", WORKER_ID)
+
+        leadership = Leadership()
+        leadership.start()
+        grpc_server: t.Any = None
+        try:
+            take_over(following)
+            publish()
+            grpc_server = serve_ads()
+            if weight_controller.enabled:
+                weight_controller.start(lambda: not leadership.lost)
+            server(leadership)
+        except r.LeadershipLost:
+            pass
+        stop_ads(grpc_server)
+        leadership.stop()
+        # Released in case the lease is still held, so a standby takes
+        # over without waiting for it to expire.
+        repository.release_leader(WORKER_ID)
+        LOG.warning("Worker %s lost the leadership.", WORKER_ID)
+
+
+def shutdown(signum: int, frame: t.Any) -> None:
+    raise SystemExit(0)
 
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, shutdown)
     print("Worker server is started.")
-    server()
+    try:
+        run()
+    finally:
+        repository.release_leader(WORKER_ID)
+        LOG.info("Worker %s released the leadership.", WORKER_ID)
@@ -0,0 +1,541 @@
+import copy
+import hashlib
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import typing as t
+from concurrent import futures
+
+import entity.conf as c
+import entity.diff as d
+
+# gRPC delivery is optional, the config files are written without it.
+try:
+    import grpc
+    from google.protobuf import any_pb2
+    from google.protobuf import json_format
+    from envoy.service.discovery.v3 import ads_pb2_grpc
+    from envoy.service.discovery.v3 import discovery_pb2
+    # Imported to register the types packed in the resources.
+    from envoy.config.cluster.v3 import cluster_pb2  # noqa: F401
+    from envoy.config.endpoint.v3 import endpoint_pb2  # noqa: F401
+    from envoy.config.listener.v3 import listener_pb2  # noqa: F401
+    from envoy.extensions.access_loggers.file.v3 import \
+        file_pb2  # noqa: F401
+    from envoy.extensions.filters.network.http_connection_manager.v3 import \
+        http_connection_manager_pb2  # noqa: F401
+except ImportError:
+    grpc = None
+
+LOG = logging.getLogger(__name__)
+
+try:
+    XDS_GRPC_PORT = int(os.environ["XDS_GRPC_PORT"])
+except KeyError:
+    XDS_GRPC_PORT = 0
+
+# Every stream holds a thread of the server.
+try:
+    XDS_GRPC_MAX_STREAMS = int(os.environ["XDS_GRPC_MAX_STREAMS"])
+except KeyError:
+    XDS_GRPC_MAX_STREAMS = 100
+
+TYPE_LISTENER = "type.googleapis.com/envoy.config.listener.v3.Listener"
+TYPE_CLUSTER = "type.googleapis.com/envoy.config.cluster.v3.Cluster"
+TYPE_LOAD_ASSIGNMENT = \
+    "type.googleapis.com/envoy.config.endpoint.v3.ClusterLoadAssignment"
+TYPE_URLS = [TYPE_LISTENER, TYPE_CLUSTER, TYPE_LOAD_ASSIGNMENT]
+
+# Listeners in the config files have no name, so they are named by port.
+LISTENER_NAME_PREFIX = "listener_"
+ADS_CONFIG_SOURCE = {"resource_api_version": "V3", "ads": {}}
+
+# Nodes of other clusters take the whole config.
+DEFAULT_CONFIG_SET = ""
+
+ACK_ACKED = "acked"
+ACK_NACKED = "nacked"
+
+# Version, status, error and config set of a type applied by a node.
+ACK_TYPE = t.Dict[str, t.Optional[str]]
+
+_UPDATED = object()
+
+
+def get_listener_name(port: str) -> str:
+    return LISTENER_NAME_PREFIX + port
+
+
+def to_listener(resource: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    listener = copy.deepcopy(resource)
+    if "name" not in listener:
+        port = str(listener["address"]["socket_address"]["port_value"])
+        listener["name"] = get_listener_name(port)
+    return listener
+
+
+def to_cluster(resource: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    # Load assignments of the cluster are also taken from ADS.
+    cluster = copy.deepcopy(resource)
+    cluster["eds_cluster_config"]["eds_config"] = \
+        copy.deepcopy(ADS_CONFIG_SOURCE)
+    return cluster
+
+
+def to_load_assignment(
+        resource: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    # Load assignments are written as v2, which has the same fields.
+    load_assignment = copy.deepcopy(resource)
+    load_assignment["@type"] = TYPE_LOAD_ASSIGNMENT
+    return load_assignment
+
+
+def pack(name: str, resource: t.Dict[str, t.Any]) -> t.Any:
+    # A resource is versioned by its content, so the versions known by
+    # a node stay valid after the worker restarts.
+    version = hashlib.md5(
+        json.dumps(resource, sort_keys=True).encode("UTF-8")).hexdigest()
+    return discovery_pb2.Resource(
+        name=name,
+        version=version,
+        resource=json_format.ParseDict(resource, any_pb2.Any()))
+
+
+def get_resources(
+        conf: c.EnvoyConf
+) -> t.Dict[str, t.Dict[str, t.Dict[str, t.Any]]]:
+    return {
+        TYPE_LISTENER: {get_listener_name(lds_res.port): lds_res.get_dict()
+                        for lds_res in conf.lds.resources},
+        TYPE_CLUSTER: {cds_res.cluster_name: cds_res.get_dict()
+                       for cds_res in conf.cds.resources},
+        TYPE_LOAD_ASSIGNMENT: {eds_res.cluster_name: eds_res.get_dict()
+                               for eds_res in conf.eds.resources}
+    }
+
+
+def get_changed_names(
+        changes: d.ChangeSet
+) -> t.Dict[str, t.Dict[str, str]]:
+    return {
+        TYPE_LISTENER: {get_listener_name(port): change
+                        for port, change in changes.listeners.items()},
+        TYPE_CLUSTER: changes.clusters,
+        TYPE_LOAD_ASSIGNMENT: changes.load_assignments
+    }
+
+
+def get_versions(conf: c.EnvoyConf) -> t.Dict[str, str]:
+    return {
+        TYPE_LISTENER: conf.lds.version_info,
+        TYPE_CLUSTER: conf.cds.version_info,
+        TYPE_LOAD_ASSIGNMENT: conf.eds.version_info
+    }
+
+
+CONVERTERS: t.Dict[str, t.Callable[[t.Dict[str, t.Any]],
+                                   t.Dict[str, t.Any]]] = {
+    TYPE_LISTENER: to_listener,
+    TYPE_CLUSTER: to_cluster,
+    TYPE_LOAD_ASSIGNMENT: to_load_assignment
+}
+
+
+class AdsStream:
+    """State of the state-of-the-world ADS stream of a node."""
+
+    def __init__(self, server: "AdsServer") -> None:
+        self._server = server
+        self._node: t.Any = None
+        self._node_id = ""
+        self._config_set = DEFAULT_CONFIG_SET
+        self._nonces = itertools.count(1)
+        # Resource names subscribed by type, empty for all of them.
+        self._subscriptions: t.Dict[str, t.List[str]] = {}
+        # Version and nonce last sent by type.
+        self._sent: t.Dict[str, t.Tuple[str, str]] = {}
+
+    @property
+    def node_id(self) -> str:
+        return self._node_id
+
+    def on_request(self, request: t.Any) -> t.List[t.Any]:
+        if request.HasField("node"):
+            self._node = request.node
+            self._node_id = request.node.id
+            self._select_config_set()
+
+        type_url: str = request.type_url
+        if type_url not in TYPE_URLS:
+            LOG.warning("Node %s requested unknown type %s",
+                        self._node_id, type_url)
+            return []
+
+        names = list(request.resource_names)
+        if request.response_nonce:
+            sent = self._sent.get(type_url)
+            if sent is None or sent[1] != request.response_nonce:
+                # Stale, a newer response is on the way.
+                return []
+
+            self._server.record_ack(self._node_id,
+                                    request,
+                                    sent[0],
+                                    self._config_set)
+            if names == self._subscriptions.get(type_url):
+                return []
+
+        self._subscriptions[type_url] = names
+        return self._respond(type_url)
+
+    def _select_config_set(self) -> bool:
+        # A node connected before its config set is published moves to it
+        # on the update publishing it.
+        if self._node is None:
+            return False
+
+        config_set = self._server.select_config_set(self._node)
+        selected = config_set != self._config_set
+        self._config_set = config_set
+        return selected
+
+    def on_update(self) -> t.List[t.Any]:
+        if self._select_config_set():
+            # Config sets share the versions, so every type is sent again.
+            self._sent = {}
+
+        responses: t.List[t.Any] = []
+        for type_url in self._subscriptions:
+            sent = self._sent.get(type_url)
+            if sent is None \
+                    or sent[0] != self._server.get_version(type_url,
+                                                           self._config_set):
+                responses.extend(self._respond(type_url))
+        return responses
+
+    def _respond(self, type_url: str) -> t.List[t.Any]:
+        version, resources = \
+            self._server.get_snapshot(type_url, self._config_set)
+        if version is None:
+            # Nothing is published yet.
+            return []
+
+        names = self._subscriptions[type_url]
+        if names:
+            resources = {name: resources[name]
+                         for name in names if name in resources}
+
+        nonce = str(next(self._nonces))
+        self._sent[type_url] = (version, nonce)
+        return [discovery_pb2.DiscoveryResponse(
+            version_info=version,
+            resources=[resource.resource for resource in resources.values()],
+            type_url=type_url,
+            nonce=nonce)]
+
+
+class DeltaStream:
+    """State of the incremental ADS stream of a node.
+
+    Versions of the resources known by the node are kept by type, so only
+    the resources added, modified or removed since are sent. The node
+    gives the versions it has on reconnect, which resumes the stream
+    without sending them again.
+    """
+
+    def __init__(self, server: "AdsServer") -> None:
+        self._server = server
+        self._node: t.Any = None
+        self._node_id = ""
+        self._config_set = DEFAULT_CONFIG_SET
+        self._nonces = itertools.count(1)
+        self._wildcards: t.Set[str] = set()
+        self._subscriptions: t.Dict[str, t.Set[str]] = {}
+        self._known: t.Dict[str, t.Dict[str, str]] = {}
+        # Nonce, version and resource names last sent by type.
+        self._sent: t.Dict[str, t.Tuple[str, str, t.List[str]]] = {}
+
+    @property
+    def node_id(self) -> str:
+        return self._node_id
+
+    def on_request(self, request: t.Any) -> t.List[t.Any]:
+        if request.HasField("node"):
+            self._node = request.node
+            self._node_id = request.node.id
+            self._select_config_set()
+
+        type_url: str = request.type_url
+        if type_url not in TYPE_URLS:
+            LOG.warning("Node %s requested unknown type %s",
+                        self._node_id, type_url)
+            return []
+
+        first = type_url not in self._subscriptions
+        names = self._subscriptions.setdefault(type_url, set())
+        known = self._known.setdefault(type_url, {})
+        subscribe = list(request.resource_names_subscribe)
+        if first:
+            known.update(request.initial_resource_versions)
+            # Listeners and clusters are subscribed all without names.
+            if not subscribe and type_url != TYPE_LOAD_ASSIGNMENT:
+                self._wildcards.add(type_url)
+
+        for name in subscribe:
+            if name == "*":
+                self._wildcards.add(type_url)
+            else:
+                names.add(name)
+        for name in request.resource_names_unsubscribe:
+            if name == "*":
+                self._wildcards.discard(type_url)
+            else:
+                names.discard(name)
+                known.pop(name, None)
+
+        if request.response_nonce:
+            sent = self._sent.get(type_url)
+            if sent is not None and sent[0] == request.response_nonce:
+                self._server.record_ack(self._node_id,
+                                        request,
+                                        sent[1],
+                                        self._config_set)
+                if request.HasField("error_detail"):
+                    # Rejected resources are sent again when they change.
+                    for name in sent[2]:
+                        known.pop(name, None)
+
+        if not first and not subscribe:
+            return []
+        return self._respond(type_url, first)
+
+    def _select_config_set(self) -> None:
+        # A node connected before its config set is published moves to it
+        # on the update publishing it, the resources of the former set are
+        # removed by the versions known by the node.
+        if self._node is not None:
+            self._config_set = self._server.select_config_set(self._node)
+
+    def on_update(self) -> t.List[t.Any]:
+        self._select_config_set()
+        responses: t.List[t.Any] = []
+        for type_url in self._subscriptions:
+            responses.extend(self._respond(type_url, False))
+        return responses
+
+    def _respond(self, type_url: str, always: bool) -> t.List[t.Any]:
+        version, resources = \
+            self._server.get_snapshot(type_url, self._config_set)
+        if version is None:
+            # Nothing is published yet.
+            return []
+
+        if type_url in self._wildcards:
+            names: t.Iterable[str] = resources.keys()
+        else:
+            names = self._subscriptions[type_url]
+
+        known = self._known[type_url]
+        updated = [resources[name] for name in names
+                   if name in resources
+                   and resources[name].version != known.get(name)]
+        removed = [name for name in known if name not in resources]
+        if not updated and not removed and not always:
+            return []
+
+        for resource in updated:
+            known[resource.name] = resource.version
+        for name in removed:
+            del known[name]
+
+        nonce = str(next(self._nonces))
+        self._sent[type_url] = (nonce,
+                                version,
+                                [resource.name for resource in updated])
+        return [discovery_pb2.DeltaDiscoveryResponse(
+            system_version_info=version,
+            resources=updated,
+            type_url=type_url,
+            removed_resources=removed,
+            nonce=nonce)]
+
+
+class AdsServer:
+    """Serves the config to Envoy by aggregated xDS over gRPC.
+
+    Resources are packed when they are published, only the changed ones
+    with a change set, and shared by the streams. Every update is pushed
+    to the streams which subscribe the changed types, by the whole type
+    on state-of-the-world streams and by the changed resources on
+    incremental ones.
+
+    Config sets are published apart, and a node takes the set of its
+    cluster ID.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Versions and resources by config set and type.
+        self._versions: t.Dict[str, t.Dict[str, str]] = {}
+        self._resources: t.Dict[str, t.Dict[str, t.Dict[str, t.Any]]] = {}
+        self._streams: t.Set[queue.Queue] = set()
+        self._acks: t.Dict[str, t.Dict[str, ACK_TYPE]] = {}
+
+    def update(self,
+               conf: c.EnvoyConf,
+               changes: t.Optional[d.ChangeSet] = None,
+               config_set: str = DEFAULT_CONFIG_SET) -> None:
+        current = get_resources(conf)
+        versions = get_versions(conf)
+        changed_names = get_changed_names(changes) \
+            if changes is not None else None
+
+        with self._lock:
+            published_versions = self._versions.get(config_set, {})
+            published = self._resources.get(config_set, {})
+
+        packed: t.Dict[str, t.Dict[str, t.Any]] = {}
+        for type_url in TYPE_URLS:
+            if changed_names is None or type_url not in published_versions:
+                packed[type_url] = {
+                    name: pack(name, CONVERTERS[type_url](resource))
+                    for name, resource in current[type_url].items()
+                }
+                continue
+
+            if not changed_names[type_url] \
+                    and versions[type_url] == published_versions[type_url]:
+                continue
+
+            # Streams keep reading the former resources while they are
+            # replaced.
+            resources = dict(published[type_url])
+            for name in changed_names[type_url]:
+                resource = current[type_url].get(name)
+                if resource is None:
+                    resources.pop(name, None)
+                else:
+                    resources[name] = \
+                        pack(name, CONVERTERS[type_url](resource))
+            packed[type_url] = resources
+
+        with self._lock:
+            self._resources.setdefault(config_set, {}).update(packed)
+            self._versions[config_set] = versions
+            streams = list(self._streams)
+
+        for events in streams:
+            events.put(_UPDATED)
+
+    def select_config_set(self, node: t.Any) -> str:
+        with self._lock:
+            if node.cluster in self._versions:
+                return node.cluster
+        return DEFAULT_CONFIG_SET
+
+    def get_version(self,
+                    type_url: str,
+                    config_set: str = DEFAULT_CONFIG_SET) -> t.Optional[str]:
+        with self._lock:
+            return self._versions.get(config_set, {}).get(type_url)
+
+    def get_snapshot(
+            self,
+            type_url: str,
+            config_set: str = DEFAULT_CONFIG_SET
+    ) -> t.Tuple[t.Optional[str], t.Dict[str, t.Any]]:
+        with self._lock:
+            return self._versions.get(config_set, {}).get(type_url), \
+                self._resources.get(config_set, {}).get(type_url, {})
+
+    def record_ack(self,
+                   node_id: str,
+                   request: t.Any,
+                   version: str,
+                   config_set: str = DEFAULT_CONFIG_SET) -> None:
+        if request.HasField("error_detail"):
+            ack: ACK_TYPE = {"version": version,
+                             "status": ACK_NACKED,
+                             "error": request.error_detail.message,
+                             "config_set": config_set}
+            LOG.warning("Node %s rejected %s version %s: %s",
+                        node_id, request.type_url, version,
+                        request.error_detail.message)
+        else:
+            ack = {"version": version,
+                   "status": ACK_ACKED,
+                   "error": None,
+                   "config_set": config_set}
+
+        with self._lock:
+            self._acks.setdefault(node_id, {})[request.type_url] = ack
+
+    def get_acks(self, node_id: str) -> t.Dict[str, ACK_TYPE]:
+        with self._lock:
+            return dict(self._acks.get(node_id, {}))
+
+    def get_all_acks(self) -> t.Dict[str, t.Dict[str, ACK_TYPE]]:
+        with self._lock:
+            return {node_id: dict(acks)
+                    for node_id, acks in self._acks.items()}
+
+    def _serve(self,
+               stream: t.Union[AdsStream, DeltaStream],
+               request_iterator: t.Iterator[t.Any]) -> t.Iterator[t.Any]:
+        events: queue.Queue = queue.Queue()
+
+        def read() -> None:
+            try:
+                for request in request_iterator:
+                    events.put(request)
+            except Exception:
+                # The stream is closed by the node.
+                pass
+            events.put(None)
+
+        thread = threading.Thread(target=read, daemon=True)
+        thread.start()
+
+        with self._lock:
+            self._streams.add(events)
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+
+                if event is _UPDATED:
+                    responses = stream.on_update()
+                else:
+                    responses = stream.on_request(event)
+                for response in responses:
+                    yield response
+        finally:
+            # A node gone away does not hold back the applied versions.
+            with self._lock:
+                self._streams.discard(events)
+                self._acks.pop(stream.node_id, None)
+            LOG.info("ADS stream of node %s is closed.", stream.node_id)
+
+    def StreamAggregatedResources(self,
+                                  request_iterator: t.Iterator[t.Any],
+                                  context: t.Any) -> t.Iterator[t.Any]:
+        return self._serve(AdsStream(self), request_iterator)
+
+    def DeltaAggregatedResources(self,
+                                 request_iterator: t.Iterator[t.Any],
+                                 context: t.Any) -> t.Iterator[t.Any]:
+        return self._serve(DeltaStream(self), request_iterator)
+
+
+def serve(ads_server: AdsServer, port: int = XDS_GRPC_PORT) -> t.Any:
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=XDS_GRPC_MAX_STREAMS))
+    ads_pb2_grpc.add_AggregatedDiscoveryServiceServicer_to_server(ads_server,
+                                                                  server)
+    server.add_insecure_port("[::]:{}".format(port))
+    server.start()
+    return server